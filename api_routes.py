@@ -2,7 +2,8 @@
 API Routes for GRPO Dropdown Functionality
 Warehouse, Bin Location, and Batch selection endpoints
 """
-from flask import jsonify, request
+from flask import Response, jsonify, request
+from flask_login import login_required
 from sap_integration import SAPIntegration
 import logging
 
@@ -301,4 +302,42 @@ def register_api_routes(app):
                 'success': False,
                 'error': str(e),
                 'serial_numbers': []
+            }), 500
+
+    @app.route('/api/scan-manifest', methods=['GET'])
+    @login_required
+    def get_scan_manifest():
+        """Compact manifest of the serials or batches available for an item in a warehouse (ETag / 304)"""
+        try:
+            import scan_manifest
+
+            item_code = request.args.get('item_code')
+            warehouse_code = request.args.get('warehouse_code')
+            kind = request.args.get('type', 'serial')
+
+            if not item_code or not warehouse_code:
+                return jsonify({
+                    'success': False,
+                    'error': 'item_code and warehouse_code are required'
+                }), 400
+            if kind not in ('serial', 'batch'):
+                return jsonify({'success': False, 'error': f'Invalid manifest type: {kind}'}), 400
+
+            manifest, error = scan_manifest.load(SAPIntegration(), kind, item_code, warehouse_code)
+            if manifest is None:
+                return jsonify({'success': False, 'error': error}), 500
+
+            # Weak ETag: the compressed and plain bodies are the same manifest
+            headers = {'ETag': f'W/"{manifest["version"]}"', 'Cache-Control': 'private, no-cache'}
+            if request.if_none_match.contains_weak(manifest['version']):
+                return Response(status=304, headers=headers)
+
+            # Compressed by http_compression like every large JSON response
+            return jsonify({'success': True, **manifest}), 200, headers
+
+        except Exception as e:
+            logging.error(f"Error in get_scan_manifest API: {str(e)}")
+            return jsonify({
+                'success': False,
+                'error': str(e)
             }), 500
\ No newline at end of file
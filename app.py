@@ -1,22 +1,18 @@
 import os
+import json
+import time
 import logging
+import importlib
+from contextlib import contextmanager
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
+from wms_metrics import TimedQueuePool
 
-# Load credentials from JSON file instead of .env
-try:
-    from credentials_loader import load_credentials
-    credentials = load_credentials()
-    logging.info("✅ Credentials loaded from JSON file or environment variables")
-except Exception as e:
-    logging.warning(f"⚠️ Could not load credentials: {e}")
-    logging.info("Using system environment variables as fallback")
-
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Configure logging - set LOG_LEVEL=DEBUG to see per-call SAP debug output
+logging.basicConfig(level=getattr(logging, os.environ.get('LOG_LEVEL', 'INFO').upper(), logging.INFO))
 
 
 class Base(DeclarativeBase):
@@ -27,110 +23,219 @@ class Base(DeclarativeBase):
 db = SQLAlchemy(model_class=Base)
 login_manager = LoginManager()
 
-# Create Flask app
+# Create Flask app - configured by create_app() below. The legacy routes.py
+# registers its views with @app.route, so the instance lives at module level.
 app = Flask(__name__)
 
-# Validate SESSION_SECRET is set - required for security
-session_secret = os.environ.get("SESSION_SECRET")
-if not session_secret:
-    raise RuntimeError("SESSION_SECRET environment variable must be set for secure session management")
-app.secret_key = session_secret
-
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
-
-# Database configuration - PostgreSQL required for Replit environment
-database_url_env = os.environ.get("DATABASE_URL", "")
-
-# Validate DATABASE_URL is set and is PostgreSQL
-if not database_url_env:
-    raise RuntimeError("DATABASE_URL environment variable must be set")
-
-# if not ("postgres" in database_url_env or "postgresql" in database_url_env):
-#     raise RuntimeError("DATABASE_URL must be a PostgreSQL connection string for Replit environment")
-
-logging.info(f"✅ Using PostgreSQL database (Replit environment): {database_url_env[:50]}...")
-
-# Convert postgres:// to postgresql:// if needed for SQLAlchemy compatibility
-if database_url_env.startswith("postgres://"):
-    database_url_env = database_url_env.replace("postgres://", "postgresql://", 1)
-
-app.config["SQLALCHEMY_DATABASE_URI"] = database_url_env
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-    "pool_size": 5,
-    "max_overflow": 10
-}
-db_type = "postgresql"
-
-# Test PostgreSQL connection - fail fast if connection fails
-from sqlalchemy import create_engine, text
-try:
-    test_engine = create_engine(database_url_env, pool_pre_ping=True)
-    with test_engine.connect() as conn:
-        conn.execute(text("SELECT 1"))
-    logging.info("✅ PostgreSQL database connection successful")
-    database_url = database_url_env
-except Exception as e:
-    raise RuntimeError(f"PostgreSQL connection failed: {e}")
-
-# Store database type for use in other modules
-app.config["DB_TYPE"] = db_type
-
-# Initialize extensions with app
-db.init_app(app)
-login_manager.init_app(app)
-login_manager.login_view = 'login'  # type: ignore
-login_manager.login_message = 'Please log in to access this page.'
-
-# SAP B1 Configuration - Updated with user's real SAP server
-app.config['SAP_B1_SERVER'] = os.environ.get('SAP_B1_SERVER',
-                                             'https://10.112.253.173:50000')
-app.config['SAP_B1_USERNAME'] = os.environ.get('SAP_B1_USERNAME', 'manager')
-app.config['SAP_B1_PASSWORD'] = os.environ.get('SAP_B1_PASSWORD', '1422')
-app.config['SAP_B1_COMPANY_DB'] = os.environ.get('SAP_B1_COMPANY_DB',
-                                                 'SBODemoUS')
-
-# Import models after app is configured to avoid circular imports
-import models
-import models_extensions
-from modules.grpo import models as grpo_models
-from modules.multi_grn_creation import models as multi_grn_models
-
-with app.app_context():
-    # Create all database tables first
-    db.create_all()
-    logging.info("Database tables created")
-    
-    # Fix duplicate serial number constraint issue - drop unique constraint to allow duplicates
-    if db_type == "mysql":
+# Module blueprints, imported lazily by register_blueprints():
+# (module key, import path, blueprint attribute, template folder)
+BLUEPRINTS = [
+    ('inventory_transfer', 'modules.inventory_transfer.routes', 'transfer_bp',
+     'modules/inventory_transfer/templates'),
+    ('serial_item_transfer', 'modules.serial_item_transfer.routes', 'serial_item_bp',
+     'modules/serial_item_transfer/templates'),
+    ('multi_grn', 'modules.multi_grn_creation.routes', 'multi_grn_bp',
+     'modules/multi_grn_creation/templates'),
+    ('grpo', 'modules.grpo.routes', 'grpo_bp',
+     'modules/grpo/templates'),
+    ('sales_delivery', 'modules.sales_delivery.routes', 'sales_delivery_bp',
+     None),
+    ('direct_inventory_transfer', 'modules.direct_inventory_transfer.routes', 'direct_inventory_transfer_bp',
+     'modules/direct_inventory_transfer/templates'),
+]
+
+# Modules that register views directly on the app with @app.route
+ROUTE_MODULES = [
+    'routes',
+    'api_cascading_dropdowns',
+]
+
+
+class StartupTimer:
+    """Records how long each application start-up phase takes"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name):
+        phase_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, (time.perf_counter() - phase_start) * 1000))
+
+    @property
+    def total_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def report(self):
+        """Return the timings as a dict suitable for app.config / JSON"""
+        return {
+            'phases': {name: round(ms, 1) for name, ms in self.phases},
+            'total_ms': round(self.total_ms, 1)
+        }
+
+    def log_report(self):
+        summary = ', '.join(f"{name}={ms:.0f}ms" for name, ms in self.phases)
+        logging.info(f"⏱️ Startup timing: {summary} (total {self.total_ms:.0f}ms)")
+
+
+def load_configuration(app):
+    """Load credentials and populate app.config from the environment"""
+    # Load credentials from JSON file instead of .env
+    try:
+        from credentials_loader import load_credentials
+        load_credentials()
+        logging.info("✅ Credentials loaded from JSON file or environment variables")
+    except Exception as e:
+        logging.warning(f"⚠️ Could not load credentials: {e}")
+        logging.info("Using system environment variables as fallback")
+
+    # Validate SESSION_SECRET is set - required for security
+    session_secret = os.environ.get("SESSION_SECRET")
+    if not session_secret:
+        raise RuntimeError("SESSION_SECRET environment variable must be set for secure session management")
+    app.secret_key = session_secret
+
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+
+    # Database configuration - PostgreSQL required for Replit environment
+    database_url_env = os.environ.get("DATABASE_URL", "")
+
+    # Validate DATABASE_URL is set
+    if not database_url_env:
+        raise RuntimeError("DATABASE_URL environment variable must be set")
+
+    # Convert postgres:// to postgresql:// if needed for SQLAlchemy compatibility
+    if database_url_env.startswith("postgres://"):
+        database_url_env = database_url_env.replace("postgres://", "postgresql://", 1)
+
+    logging.info(f"✅ Using PostgreSQL database (Replit environment): {database_url_env[:50]}...")
+
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_url_env
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "pool_recycle": 300,
+        "pool_pre_ping": True,
+        "pool_size": 5,
+        "max_overflow": 10,
+        "poolclass": TimedQueuePool
+    }
+
+    # Store database type for use in other modules
+    app.config["DB_TYPE"] = "postgresql"
+
+    # SAP B1 Configuration - Updated with user's real SAP server
+    app.config['SAP_B1_SERVER'] = os.environ.get('SAP_B1_SERVER',
+                                                 'https://10.112.253.173:50000')
+    app.config['SAP_B1_USERNAME'] = os.environ.get('SAP_B1_USERNAME', 'manager')
+    app.config['SAP_B1_PASSWORD'] = os.environ.get('SAP_B1_PASSWORD', '1422')
+    app.config['SAP_B1_COMPANY_DB'] = os.environ.get('SAP_B1_COMPANY_DB',
+                                                     'SBODemoUS')
+
+
+def register_blueprints(app):
+    """Import and register module blueprints.
+
+    Blueprint modules are only imported here, so a worker can load a subset by
+    setting WMS_MODULES to a comma separated list of module keys
+    (e.g. ``grpo,inventory_transfer``). All modules are loaded by default.
+    """
+    enabled = os.environ.get('WMS_MODULES', '').strip()
+    enabled_keys = {key.strip() for key in enabled.split(',') if key.strip()} if enabled else None
+
+    template_paths = []
+    for key, module_path, attr, template_folder in BLUEPRINTS:
+        if enabled_keys is not None and key not in enabled_keys:
+            logging.info(f"⏭️ Module '{key}' not enabled - blueprint not loaded")
+            continue
+        module = importlib.import_module(module_path)
+        app.register_blueprint(getattr(module, attr))
+        if template_folder:
+            template_paths.append(template_folder)
+
+    # Add module-specific template folders to Jinja loader search path
+    app.jinja_loader.searchpath.extend(template_paths)
+
+    logging.info("✅ All module blueprints registered and template paths configured")
+
+
+def register_template_filters(app):
+    """Register custom Jinja2 filters"""
+
+    @app.template_filter('from_json')
+    def from_json_filter(value):
+        """Parse JSON string to Python object for use in templates"""
+        if value is None or value == '':
+            return []
         try:
-            from sqlalchemy import text
+            return json.loads(value)
+        except (ValueError, TypeError):
+            return []
+
+    logging.info("✅ Custom Jinja2 filters registered")
+
+
+def init_dual_db(app):
+    """Initialize dual database support for MySQL sync.
+
+    Enabled by default but fails gracefully if MySQL is not available.
+    """
+    try:
+        from db_dual_support import init_dual_database
+        dual_db = init_dual_database(app)
+        app.config['DUAL_DB'] = dual_db
+        logging.info("✅ Dual database support initialized for MySQL sync")
+    except Exception as e:
+        logging.warning(f"⚠️ Dual database support not available: {e}")
+        app.config['DUAL_DB'] = None
+        logging.info("💡 MySQL sync disabled, using single database mode")
+
+
+def check_database_connection(app):
+    """Fail fast if the primary database is unreachable"""
+    from sqlalchemy import text
+    try:
+        with app.app_context():
             with db.engine.connect() as conn:
-                # Check if the constraint exists and drop it
-                result = conn.execute(text("""
-                    SELECT CONSTRAINT_NAME 
-                    FROM INFORMATION_SCHEMA.TABLE_CONSTRAINTS 
-                    WHERE TABLE_SCHEMA = DATABASE() 
-                    AND TABLE_NAME = 'serial_number_transfer_serials' 
-                    AND CONSTRAINT_NAME = 'unique_serial_per_item'
-                """))
-                
-                if result.fetchone():
-                    conn.execute(text("ALTER TABLE serial_number_transfer_serials DROP INDEX unique_serial_per_item"))
-                    conn.commit()
-                    logging.info("✅ Dropped unique_serial_per_item constraint to allow duplicate serial numbers")
-                else:
-                    logging.info("ℹ️ unique_serial_per_item constraint not found, skipping")
-        except Exception as e:
-            logging.warning(f"⚠️ Could not drop unique constraint: {e}")
-    
-    # Create default data for PostgreSQL database
+                conn.execute(text("SELECT 1"))
+        logging.info("✅ PostgreSQL database connection successful")
+    except Exception as e:
+        raise RuntimeError(f"PostgreSQL connection failed: {e}")
+
+
+def fix_mysql_constraints():
+    """Fix duplicate serial number constraint issue - drop unique constraint to allow duplicates"""
+    from sqlalchemy import text
+    try:
+        with db.engine.connect() as conn:
+            # Check if the constraint exists and drop it
+            result = conn.execute(text("""
+                SELECT CONSTRAINT_NAME
+                FROM INFORMATION_SCHEMA.TABLE_CONSTRAINTS
+                WHERE TABLE_SCHEMA = DATABASE()
+                AND TABLE_NAME = 'serial_number_transfer_serials'
+                AND CONSTRAINT_NAME = 'unique_serial_per_item'
+            """))
+
+            if result.fetchone():
+                conn.execute(text("ALTER TABLE serial_number_transfer_serials DROP INDEX unique_serial_per_item"))
+                conn.commit()
+                logging.info("✅ Dropped unique_serial_per_item constraint to allow duplicate serial numbers")
+            else:
+                logging.info("ℹ️ unique_serial_per_item constraint not found, skipping")
+    except Exception as e:
+        logging.warning(f"⚠️ Could not drop unique constraint: {e}")
+
+
+def create_default_data():
+    """Create the default branch and admin user if they do not exist"""
     try:
         from models_extensions import Branch
         from werkzeug.security import generate_password_hash
         from models import User
-        
+
         # Create default branch
         default_branch = Branch.query.filter_by(id='BR001').first()
         if not default_branch:
@@ -148,7 +253,7 @@ with app.app_context():
             default_branch.is_default = True
             db.session.add(default_branch)
             logging.info("Default branch created")
-        
+
         # Create default admin user
         admin = User.query.filter_by(username='admin').first()
         if not admin:
@@ -166,75 +271,192 @@ with app.app_context():
             admin.must_change_password = False
             db.session.add(admin)
             logging.info("Default admin user created")
-            
+
         db.session.commit()
         logging.info("✅ Default data initialization completed")
-        
+
     except Exception as e:
         logging.error(f"Error initializing default data: {e}")
         db.session.rollback()
-        # Continue with application startup
-
-# Initialize dual database support for MySQL sync 
-# Enable by default but fail gracefully if MySQL not available
-try:
-    from db_dual_support import init_dual_database
-    dual_db = init_dual_database(app)
-    app.config['DUAL_DB'] = dual_db
-    logging.info("✅ Dual database support initialized for MySQL sync")
-except Exception as e:
-    logging.warning(f"⚠️ Dual database support not available: {e}")
-    app.config['DUAL_DB'] = None
-    logging.info("💡 MySQL sync disabled, using single database mode")
-
-# Validate and create SAP B1 SQL Queries on startup
-try:
-    from sap_query_manager import validate_sap_queries
-    validate_sap_queries(app)
-except Exception as e:
-    logging.warning(f"⚠️ SAP query validation skipped: {e}")
-    logging.info("💡 Application will continue without SAP query validation")
-
-# Import and register blueprints
-from modules.inventory_transfer.routes import transfer_bp
-from modules.serial_item_transfer.routes import serial_item_bp
-from modules.multi_grn_creation.routes import multi_grn_bp
-from modules.grpo.routes import grpo_bp
-from modules.sales_delivery.routes import sales_delivery_bp
-from modules.direct_inventory_transfer.routes import direct_inventory_transfer_bp
-
-app.register_blueprint(transfer_bp)
-app.register_blueprint(serial_item_bp)
-app.register_blueprint(multi_grn_bp)
-app.register_blueprint(grpo_bp)
-app.register_blueprint(sales_delivery_bp)
-app.register_blueprint(direct_inventory_transfer_bp)
-
-# Add module-specific template folders to Jinja loader search path
-app.jinja_loader.searchpath.extend([
-    'modules/grpo/templates',
-    'modules/inventory_transfer/templates',
-    'modules/multi_grn_creation/templates',
-    'modules/serial_item_transfer/templates',
-    'modules/direct_inventory_transfer/templates'
-])
-
-logging.info("✅ All module blueprints registered and template paths configured")
-
-# Register custom Jinja2 filters
-import json
 
-@app.template_filter('from_json')
-def from_json_filter(value):
-    """Parse JSON string to Python object for use in templates"""
-    if value is None or value == '':
-        return []
-    try:
-        return json.loads(value)
-    except (ValueError, TypeError):
-        return []
 
-logging.info("✅ Custom Jinja2 filters registered")
+def run_migrations(app, validate_sap=True):
+    """Create tables, apply schema fixes and seed default data.
+
+    This used to run on every import of app.py; it now only runs from the
+    ``flask migrate`` command (or at start-up when AUTO_MIGRATE=true).
+    """
+    timer = StartupTimer()
+
+    with timer.phase('db_connect'):
+        check_database_connection(app)
+
+    with app.app_context():
+        with timer.phase('create_all'):
+            # Create all database tables first
+            db.create_all()
+            logging.info("Database tables created")
+
+        if app.config.get('DB_TYPE') == "mysql":
+            with timer.phase('mysql_constraints'):
+                fix_mysql_constraints()
+
+        with timer.phase('default_data'):
+            # Create default data for PostgreSQL database
+            create_default_data()
+
+        with timer.phase('search_indexes'):
+            # Columns/indexes for the local master data search tables
+            try:
+                from models import BusinessPartner, ItemMaster
+                BusinessPartner.ensure_schema()
+                ItemMaster.ensure_schema()
+            except Exception as e:
+                logging.warning(f"⚠️ Search index setup skipped: {e}")
+
+        with timer.phase('qc_queue_indexes'):
+            # (status, created_at, id) indexes behind the keyset-paginated QC queues
+            try:
+                import qc_queues
+                qc_queues.ensure_indexes()
+            except Exception as e:
+                logging.warning(f"⚠️ QC queue index setup skipped: {e}")
+
+        with timer.phase('transfer_indexes'):
+            # Indexes behind the grouped inventory transfer quantities
+            try:
+                from models import ensure_transfer_indexes
+                ensure_transfer_indexes()
+            except Exception as e:
+                logging.warning(f"⚠️ Transfer index setup skipped: {e}")
+
+        with timer.phase('column_additions'):
+            # Columns added to existing tables after they were first created
+            try:
+                from modules.multi_grn_creation.models import MultiGRNBatch
+                MultiGRNBatch.ensure_schema()
+            except Exception as e:
+                logging.warning(f"⚠️ Column additions skipped: {e}")
+
+    if validate_sap:
+        with timer.phase('sap_queries'):
+            # Validate and create SAP B1 SQL Queries
+            try:
+                from sap_query_manager import validate_sap_queries
+                validate_sap_queries(app)
+            except Exception as e:
+                logging.warning(f"⚠️ SAP query validation skipped: {e}")
+                logging.info("💡 Application will continue without SAP query validation")
+
+    timer.log_report()
+    return timer.report()
+
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Create missing tables, apply schema fixes and seed default data."""
+    report = run_migrations(app)
+    print(f"✅ Migration completed in {report['total_ms']:.0f}ms")
+    for name, ms in report['phases'].items():
+        print(f"   {name}: {ms:.0f}ms")
+
+
+@app.cli.command('sync-master-data')
+def sync_master_data_command():
+    """Refresh warehouses, bins and the business partner and item indexes from SAP B1 (run from cron)."""
+    from sap_integration import SAPIntegration
+    with app.app_context():
+        results = SAPIntegration().sync_all_master_data()
+    for name, ok in results.items():
+        print(f"{'✅' if ok else '❌'} {name}")
+
+
+@app.cli.command('replicate-outbox')
+def replicate_outbox_command():
+    """Apply every pending replication outbox row to MySQL now."""
+    import db_dual_support
+    if not db_dual_support.outbox_replicator:
+        print("❌ MySQL replication is disabled (set MYSQL_HOST or DUAL_DB_REPLICATION=true)")
+        return
+    total = 0
+    with app.app_context():
+        while True:
+            applied = db_dual_support.outbox_replicator.drain_once()
+            if not applied:
+                break
+            total += applied
+    print(f"✅ Replicated {total} outbox rows to MySQL")
+
+
+@app.cli.command('qc-release-postings')
+def qc_release_postings_command():
+    """Return QC documents left in 'posting' by an interrupted bulk review to the QC queue (run from cron)."""
+    import qc_bulk
+    with app.app_context():
+        released = qc_bulk.release_stale_postings()
+    print(f"✅ Released {released} documents stuck in SAP posting")
+
+
+def create_app():
+    """Configure the application, register extensions, blueprints and routes.
+
+    Schema creation is not part of start-up any more - run ``flask migrate``
+    after deploying model changes (or set AUTO_MIGRATE=true).
+    """
+    if app.config.get('WMS_INITIALIZED'):
+        return app
+
+    timer = StartupTimer()
+
+    with timer.phase('config'):
+        load_configuration(app)
+
+    with timer.phase('extensions'):
+        # Initialize extensions with app
+        db.init_app(app)
+        login_manager.init_app(app)
+        login_manager.login_view = 'login'  # type: ignore
+        login_manager.login_message = 'Please log in to access this page.'
+
+        import sap_instrumentation
+        import wms_metrics
+        import http_compression
+        sap_instrumentation.init_app(app)
+        wms_metrics.init_app(app)
+        http_compression.init_app(app)
+
+    with timer.phase('models'):
+        # Import models after app is configured to avoid circular imports
+        import models
+        import models_extensions
+        from modules.grpo import models as grpo_models
+        from modules.multi_grn_creation import models as multi_grn_models
+
+    with timer.phase('dual_db'):
+        init_dual_db(app)
+
+    app.config['WMS_INITIALIZED'] = True
+
+    with timer.phase('blueprints'):
+        register_blueprints(app)
+
+    with timer.phase('template_filters'):
+        register_template_filters(app)
+
+    with timer.phase('routes'):
+        # Import routes to register them
+        for module_path in ROUTE_MODULES:
+            importlib.import_module(module_path)
+
+    # Development workspaces (REPL_ID set) keep migrating on start by default
+    auto_migrate = os.environ.get('AUTO_MIGRATE', 'true' if os.environ.get('REPL_ID') else 'false')
+    if auto_migrate.lower() in ('true', '1', 'yes'):
+        with timer.phase('migrate'):
+            run_migrations(app)
+
+    app.config['STARTUP_TIMINGS'] = timer.report()
+    timer.log_report()
+    return app
+
 
-# Import routes to register them
-import routes
+create_app()
@@ -10,6 +10,7 @@ from PIL import Image, ImageDraw, ImageFont
 import logging
 import os
 from datetime import datetime
+from wms_metrics import record_label_render
 
 class BarcodeGenerator:
     def __init__(self):
@@ -63,6 +64,7 @@ class BarcodeGenerator:
             filename = f"qr_{timestamp}.{format.lower()}"
             
             logging.info(f"✅ QR code generated successfully: {len(data)} characters")
+            record_label_render('qr_image')
             
             return {
                 'success': True,
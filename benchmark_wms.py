@@ -0,0 +1,250 @@
+"""
+WMS Benchmark Harness
+Drives the main WMS flows through the Flask test client against the local
+SAP Service Layer simulator (sap_simulator.py) and reports p50/p95 latency
+and the number of Service Layer calls each flow makes.
+
+Usage (use a scratch database - the benchmark creates documents):
+    DATABASE_URL=postgresql://.../wms_bench SESSION_SECRET=bench python benchmark_wms.py
+    python benchmark_wms.py --flows bin_scan,dashboard --iterations 50 --latency-ms 80
+    python benchmark_wms.py --flows serial_transfer --serials 2000 --json results.json
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from collections import defaultdict
+
+from sap_simulator import SimulatorConfig, start_simulator
+
+FLOWS = ('bin_scan', 'serial_transfer', 'grpo_post', 'dashboard')
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+class BenchmarkRun:
+    """Collects per-step timings and simulator call counts for one flow"""
+
+    def __init__(self, name, simulator_url):
+        self.name = name
+        self.simulator_url = simulator_url
+        self.timings = defaultdict(list)
+        self.failures = defaultdict(int)
+        self.sap_calls = {}
+        self.elapsed_ms = 0.0
+
+    def timed(self, step, func, *args, **kwargs):
+        start = time.perf_counter()
+        response = func(*args, **kwargs)
+        self.timings[step].append((time.perf_counter() - start) * 1000.0)
+        if response.status_code >= 400:
+            self.failures[step] += 1
+        return response
+
+    def __enter__(self):
+        import requests
+        requests.post(f"{self.simulator_url}/_sim/reset", timeout=10)
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        import requests
+        self.elapsed_ms = (time.perf_counter() - self._started) * 1000.0
+        self.sap_calls = requests.get(f"{self.simulator_url}/_sim/stats", timeout=10).json()
+        return False
+
+    def report(self):
+        steps = {}
+        for step, samples in self.timings.items():
+            steps[step] = {
+                'count': len(samples),
+                'failures': self.failures.get(step, 0),
+                'p50_ms': round(percentile(samples, 50), 2),
+                'p95_ms': round(percentile(samples, 95), 2),
+                'max_ms': round(max(samples), 2),
+            }
+        return {
+            'flow': self.name,
+            'elapsed_ms': round(self.elapsed_ms, 2),
+            'steps': steps,
+            'sap_calls_total': self.sap_calls.get('total', 0),
+            'sap_calls': self.sap_calls.get('calls', {}),
+        }
+
+
+def flow_bin_scan(client, dataset, run, iterations):
+    bins = dataset.bins
+    for n in range(iterations):
+        bin_code = bins[n % len(bins)]['BinCode']
+        run.timed('POST /api/scan_bin', client.post, '/api/scan_bin', json={'bin_code': bin_code})
+
+
+def flow_dashboard(client, dataset, run, iterations):
+    for _ in range(iterations):
+        run.timed('GET /dashboard', client.get, '/dashboard')
+
+
+def flow_serial_transfer(client, dataset, run, iterations, serial_count):
+    from app import app
+    from models import SerialItemTransfer
+
+    from_whs = dataset.warehouses[0]['WarehouseCode']
+    to_whs = dataset.warehouses[1]['WarehouseCode'] if len(dataset.warehouses) > 1 else 'WH99'
+    serials = sorted(dataset.serials)[:serial_count]
+
+    for _ in range(iterations):
+        run.timed('POST /serial-item-transfer/create', client.post, '/serial-item-transfer/create',
+                  data={'from_warehouse': from_whs, 'to_warehouse': to_whs, 'notes': 'benchmark'})
+        with app.app_context():
+            transfer_id = SerialItemTransfer.query.order_by(SerialItemTransfer.id.desc()).first().id
+        base = f'/serial-item-transfer/{transfer_id}'
+
+        validated = []
+        for serial in serials:
+            response = run.timed('POST validate_serial_only', client.post, f'{base}/validate_serial_only',
+                                 data={'serial_number': serial})
+            body = response.get_json(silent=True) or {}
+            if body.get('success'):
+                validated.append({'serial_number': serial, 'item_code': body.get('item_code'),
+                                  'item_description': body.get('item_description'),
+                                  'warehouse_code': body.get('warehouse_code')})
+
+        run.timed('POST add_multiple_serials', client.post, f'{base}/add_multiple_serials',
+                  data={'validated_serials': json.dumps(validated)})
+        run.timed('POST submit', client.post, f'{base}/submit')
+        run.timed('POST approve', client.post, f'{base}/approve', data={'qc_notes': 'benchmark'})
+        run.timed('POST post_to_sap', client.post, f'{base}/post_to_sap')
+
+
+def flow_grpo_post(client, dataset, run, iterations):
+    from app import app
+    from modules.grpo.models import GRPODocument
+
+    # Use PO lines for items that are neither serial nor batch managed
+    candidates = []
+    for po in dataset.purchase_orders.values():
+        for line in po['DocumentLines']:
+            item = dataset.items_by_code[line['ItemCode']]
+            if item['ManageSerialNumbers'] == 'tNO' and item['ManageBatchNumbers'] == 'tNO':
+                candidates.append((po, line))
+                break
+    if not candidates:
+        logging.warning("⚠️ Simulator dataset has no PO with a non-managed item - skipping GRPO flow")
+        return
+
+    for n in range(iterations):
+        po, line = candidates[n % len(candidates)]
+        run.timed('POST /grpo/create', client.post, '/grpo/create', data={'po_number': str(po['DocNum'])})
+        with app.app_context():
+            grpo_id = GRPODocument.query.order_by(GRPODocument.id.desc()).first().id
+
+        run.timed('POST add_item', client.post, f'/grpo/{grpo_id}/add_item', data={
+            'item_code': line['ItemCode'],
+            'item_name': line['ItemDescription'],
+            'quantity': str(line['Quantity']),
+            'unit_of_measure': line['UoMCode'],
+            'warehouse_code': line['WarehouseCode'],
+            'bin_location': f"{line['WarehouseCode']}-BIN-001",
+        })
+        run.timed('POST submit', client.post, f'/grpo/{grpo_id}/submit')
+        run.timed('POST approve (posts to SAP)', client.post, f'/grpo/{grpo_id}/approve', json={'qc_notes': 'benchmark'})
+
+
+def print_report(results):
+    for result in results:
+        print()
+        print(f"=== {result['flow']}  ({result['elapsed_ms'] / 1000.0:.2f}s, "
+              f"{result['sap_calls_total']} SAP calls) ===")
+        print(f"{'step':<36}{'count':>7}{'fail':>6}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+        for step, stats in result['steps'].items():
+            print(f"{step:<36}{stats['count']:>7}{stats['failures']:>6}"
+                  f"{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['max_ms']:>10.1f}")
+        print('SAP calls by endpoint:')
+        for endpoint, count in sorted(result['sap_calls'].items(), key=lambda kv: -kv[1]):
+            print(f"  {count:>7}  {endpoint}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark WMS flows against a simulated SAP Service Layer')
+    parser.add_argument('--flows', default=','.join(FLOWS), help=f"comma separated subset of {', '.join(FLOWS)}")
+    parser.add_argument('--iterations', type=int, default=20, help='iterations for bin scan, GRPO and dashboard')
+    parser.add_argument('--transfers', type=int, default=1, help='serial transfers to run')
+    parser.add_argument('--serials', type=int, default=2000, help='serials per transfer')
+    parser.add_argument('--latency-ms', type=float, default=30, help='simulated Service Layer latency')
+    parser.add_argument('--jitter-ms', type=float, default=10)
+    parser.add_argument('--items', type=int, default=200, help='simulated item master size')
+    parser.add_argument('--warehouses', type=int, default=4)
+    parser.add_argument('--bins', type=int, default=20, help='bins per warehouse')
+    parser.add_argument('--json', dest='json_path', help='also write the results to this file')
+    parser.add_argument('--verbose', action='store_true', help='keep application logging at INFO')
+    args = parser.parse_args()
+
+    flows = [f.strip() for f in args.flows.split(',') if f.strip()]
+    unknown = set(flows) - set(FLOWS)
+    if unknown:
+        parser.error(f"unknown flows: {', '.join(sorted(unknown))}")
+    if not os.environ.get('DATABASE_URL'):
+        parser.error('DATABASE_URL must point at a scratch database')
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    config = SimulatorConfig(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, items=args.items,
+                             warehouses=args.warehouses, bins_per_warehouse=args.bins,
+                             serials=max(args.serials, 1))
+    server, simulator_url = start_simulator(config)
+    dataset = server.app.config['DATASET']
+
+    # The app reads SAP settings at import time, so point it at the simulator first
+    os.environ['SAP_B1_SERVER'] = simulator_url
+    os.environ['SAP_B1_USERNAME'] = 'manager'
+    os.environ['SAP_B1_PASSWORD'] = 'simulator'
+    os.environ['SAP_B1_COMPANY_DB'] = 'SIMULATOR'
+    os.environ.setdefault('SESSION_SECRET', 'benchmark-only-secret')
+    os.environ['AUTO_MIGRATE'] = 'false'
+
+    from app import app, run_migrations
+    run_migrations(app, validate_sap=False)
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    client = app.test_client()
+    response = client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    if response.status_code != 302:
+        print('❌ Could not log in as admin - is the default data seeded?', file=sys.stderr)
+        return 1
+
+    results = []
+    for flow in flows:
+        with BenchmarkRun(flow, simulator_url) as run:
+            if flow == 'bin_scan':
+                flow_bin_scan(client, dataset, run, args.iterations)
+            elif flow == 'serial_transfer':
+                flow_serial_transfer(client, dataset, run, args.transfers, args.serials)
+            elif flow == 'grpo_post':
+                flow_grpo_post(client, dataset, run, args.iterations)
+            elif flow == 'dashboard':
+                flow_dashboard(client, dataset, run, args.iterations)
+        results.append(run.report())
+
+    server.shutdown()
+    print_report(results)
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'config': vars(args), 'results': results}, f, indent=2)
+        print(f"\n📄 Results written to {args.json_path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,6 +5,9 @@ echo.
 REM Install PyInstaller if not already installed
 pip install pyinstaller
 
+REM Production WSGI server used by the executable on Windows
+pip install waitress
+
 REM Clean previous builds
 if exist "build" rmdir /s /q "build"
 if exist "dist" rmdir /s /q "dist"
@@ -57,6 +57,11 @@ hidden_imports = [
     'qrcode',
     'PIL',
     'barcode',
+    'wsgi_server',
+    'waitress',
+    'gunicorn.app.base',
+    'gunicorn.glogging',
+    'gunicorn.workers.gthread',
     'logging.config',
     'json',
     'datetime',
@@ -1,6 +1,10 @@
 """
 Example usage of dual database synchronization
 This shows how to sync changes to both SQLite and MySQL databases
+
+sync_model_change only queues the change in the replication outbox, so call
+it before commit: the outbox row then commits (or rolls back) with the write
+and the background replicator copies it to MySQL.
 """
 
 from db_dual_support import sync_model_change
@@ -17,10 +21,11 @@ def create_grpo_with_sync(grpo_data):
         
         grpo = GRPODocument(**grpo_data)
         db.session.add(grpo)
-        db.session.commit()
+        db.session.flush()
         
-        # Sync to MySQL
-        sync_model_change('grpo_document', 'INSERT', grpo_data)
+        # Queue for MySQL in the same transaction
+        sync_model_change('grpo_document', 'INSERT', dict(grpo_data, id=grpo.id), key={'id': grpo.id})
+        db.session.commit()
         
         logging.info(f"✅ GRPO {grpo.po_number} created and synced to both databases")
         return grpo
@@ -45,11 +50,10 @@ def update_user_with_sync(user_id, update_data):
         for key, value in update_data.items():
             setattr(user, key, value)
         
+        # Queue for MySQL in the same transaction
+        sync_model_change('user', 'UPDATE', update_data, key={'id': user_id})
         db.session.commit()
         
-        # Sync to MySQL
-        sync_model_change('user', 'UPDATE', update_data, f"id = {user_id}")
-        
         logging.info(f"✅ User {user.username} updated and synced to both databases")
         return user
         
@@ -1,30 +1,151 @@
 """
 Dual Database Support Module
 Handles both SQLite (for Replit) and MySQL (for local development) synchronization
+
+Changes are not written to MySQL inline any more. They are appended to the
+replication_outbox table in the same transaction as the primary write, and a
+background replicator applies pending rows to MySQL in id order, grouping
+consecutive identical statements into one executemany per MySQL transaction.
+A request therefore never waits on a MySQL round trip, and a change is only
+replicated if its primary transaction committed.
+
+Captured automatically: ORM unit-of-work flushes (after_flush) and ORM bulk
+UPDATE / DELETE statements such as Query.update() (do_orm_execute).
+Not captured: bulk_insert_mappings / bulk_update_mappings, ORM insert()
+statements and Core or db.text() SQL. Code issuing those for a replicated
+table must call capture_where() / capture_keys() on the same connection
+(as the GRPO line inserts, master data sync and document number series do)
+or sync_model_change().
+
+Environment:
+    DUAL_DB_REPLICATION         - true / false / auto (default auto: on when MYSQL_HOST is set)
+    REPLICATE_TABLES            - tables captured automatically on flush ('*' for all, default none)
+    OUTBOX_BATCH_SIZE           - outbox rows applied per MySQL transaction (default 500)
+    OUTBOX_POLL_SECONDS         - replicator sleep when the outbox is empty (default 2)
+    OUTBOX_MAX_ATTEMPTS         - attempts before a row is parked as failed (default 10)
+    OUTBOX_RETENTION_HOURS      - how long applied rows are kept (default 24)
 """
 
 import os
+import re
+import time
 import logging
-from sqlalchemy import create_engine, text
-from sqlalchemy.exc import SQLAlchemyError
+import threading
+from decimal import Decimal
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import Session
 import json
-from datetime import datetime
+from datetime import date, datetime, timedelta
+
+
+def _env_int(name, default):
+    try:
+        return max(1, int(os.environ.get(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+OUTBOX_BATCH_SIZE = _env_int('OUTBOX_BATCH_SIZE', 500)
+OUTBOX_POLL_SECONDS = _env_int('OUTBOX_POLL_SECONDS', 2)
+OUTBOX_MAX_ATTEMPTS = _env_int('OUTBOX_MAX_ATTEMPTS', 10)
+OUTBOX_RETENTION_HOURS = _env_int('OUTBOX_RETENTION_HOURS', 24)
+MAX_BACKOFF_SECONDS = 300
+
+# Session-level lock so only one worker process replicates at a time
+OUTBOX_LOCK_ID = 72010437
+OUTBOX_LOCK_NAME = 'wms_replication_outbox'
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+_outbox_table = {'checked': False, 'present': False}
+_outbox_check_lock = threading.Lock()
+
+
+def outbox_available(connection):
+    """Whether the replication_outbox table exists, checked once per process
+
+    Without it every captured write would fail, so a missing table turns
+    capture and replication off (with an error) instead.
+    """
+    if not _outbox_table['checked']:
+        from sqlalchemy import inspect
+        with _outbox_check_lock:
+            if not _outbox_table['checked']:
+                _outbox_table['present'] = inspect(connection).has_table('replication_outbox')
+                _outbox_table['checked'] = True
+                if not _outbox_table['present']:
+                    logging.error("❌ replication_outbox table is missing - MySQL replication disabled. "
+                                  "Apply migrations/mysql/changes/2026-10-19_replication_outbox.sql "
+                                  "(or run flask migrate) and restart.")
+    return _outbox_table['present']
+
+
+def replication_enabled():
+    """Outbox capture and replication are on when a MySQL secondary is configured"""
+    setting = os.environ.get('DUAL_DB_REPLICATION', 'auto').lower()
+    if setting in ('true', '1', 'yes'):
+        return True
+    if setting in ('false', '0', 'no'):
+        return False
+    return bool(os.environ.get('MYSQL_HOST'))
+
+
+def replicated_tables():
+    """Tables captured by the flush listener: None for every table, else a set of names"""
+    setting = os.environ.get('REPLICATE_TABLES', '').strip()
+    if setting == '*':
+        return None
+    return {name.strip() for name in setting.split(',') if name.strip()}
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return str(value)
+
+
+def _dumps(value):
+    return json.dumps(value, default=_json_default) if value is not None else None
+
+
+def _quote(identifier):
+    if not _IDENTIFIER.match(identifier or ''):
+        raise ValueError(f"Invalid identifier for replication: {identifier!r}")
+    return f"`{identifier}`"
+
 
 class DualDatabaseManager:
     """Manages dual database support for SQLite and MySQL"""
-    
+
     def __init__(self, app):
         self.app = app
         self.sqlite_engine = None
         self.mysql_engine = None
-        self.setup_engines()
-    
+        self._engines_ready = False
+        self._engines_checked_at = 0.0
+
+    def _ensure_engines(self):
+        """Create the engines on first use so app start-up never waits on MySQL
+
+        If MySQL was unreachable, the connection is tried again at most once a minute.
+        """
+        retry_due = self.mysql_engine is None and time.time() - self._engines_checked_at > 60
+        if not self._engines_ready or retry_due:
+            self._engines_ready = True
+            self._engines_checked_at = time.time()
+            self.setup_engines()
+
     def setup_engines(self):
         """Setup both SQLite and MySQL engines"""
         # SQLite engine (primary for Replit)
         sqlite_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'wms.db')
         self.sqlite_engine = create_engine(f"sqlite:///{sqlite_path}")
-        
+
         # MySQL engine (for local development sync)
         mysql_config = {
             'host': os.environ.get('MYSQL_HOST', 'localhost'),
@@ -33,62 +154,57 @@ class DualDatabaseManager:
             'password': os.environ.get('MYSQL_PASSWORD', 'root@123'),
             'database': os.environ.get('MYSQL_DATABASE', 'wms_db_dev')
         }
-        
+
         try:
             mysql_url = f"mysql+pymysql://{mysql_config['user']}:{mysql_config['password']}@{mysql_config['host']}:{mysql_config['port']}/{mysql_config['database']}"
-            self.mysql_engine = create_engine(mysql_url, connect_args={'connect_timeout': 5})
-            
+            self.mysql_engine = create_engine(mysql_url, connect_args={'connect_timeout': 5},
+                                              pool_size=2, max_overflow=2, pool_pre_ping=True)
+
             # Test the connection
             with self.mysql_engine.connect() as conn:
                 conn.execute(text("SELECT 1"))
-                
+
             logging.info("✅ MySQL engine configured and connected successfully")
         except Exception as e:
             logging.warning(f"⚠️ MySQL engine connection failed: {e}. Operating in SQLite-only mode.")
             self.mysql_engine = None
-    
-    def sync_to_mysql(self, table_name, operation, data=None, where_clause=None):
-        """Synchronize changes to MySQL database"""
-        if not self.mysql_engine:
-            logging.debug(f"MySQL not available, skipping sync for {table_name}")
+
+    def sync_to_mysql(self, table_name, operation, data=None, where_clause=None, key=None, session=None):
+        """Queue a change for MySQL in the caller's transaction
+
+        The outbox row is added to ``session`` (db.session by default) and is
+        committed - or rolled back - together with the caller's own write, so
+        call this before ``db.session.commit()``. ``key`` is the primary key
+        as a dict; ``where_clause`` is still accepted from older callers.
+        """
+        if not replication_enabled():
+            logging.debug(f"MySQL replication disabled, skipping sync for {table_name}")
             return
-        
-        if not data and operation in ['INSERT', 'UPDATE']:
+
+        if not data and operation in ['INSERT', 'UPDATE', 'UPSERT']:
             logging.warning(f"No data provided for {operation} operation on {table_name}")
             return
-        
-        try:
-            with self.mysql_engine.connect() as conn:
-                if operation == 'INSERT' and data:
-                    # Build INSERT statement
-                    columns = ', '.join(data.keys())
-                    placeholders = ', '.join([f":{key}" for key in data.keys()])
-                    sql = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
-                    conn.execute(text(sql), data)
-                    
-                elif operation == 'UPDATE' and data:
-                    # Build UPDATE statement
-                    set_clause = ', '.join([f"{key} = :{key}" for key in data.keys()])
-                    sql = f"UPDATE {table_name} SET {set_clause} WHERE {where_clause}"
-                    conn.execute(text(sql), data)
-                    
-                elif operation == 'DELETE':
-                    # Build DELETE statement
-                    sql = f"DELETE FROM {table_name} WHERE {where_clause}"
-                    conn.execute(text(sql), data or {})
-                
-                conn.commit()
-                logging.debug(f"✅ Synced {operation} to MySQL: {table_name}")
-                
-        except SQLAlchemyError as e:
-            logging.error(f"❌ MySQL sync failed for {table_name}: {e}")
-        except Exception as e:
-            logging.error(f"❌ Unexpected error during MySQL sync: {e}")
-    
+
+        from app import db
+        from models import ReplicationOutbox
+        session = session or db.session
+        if not outbox_available(session.connection()):
+            return
+        session.add(ReplicationOutbox(
+            table_name=table_name,
+            operation=operation,
+            row_data=_dumps(data),
+            key_data=_dumps(key),
+            where_clause=where_clause,
+            status='pending',
+            attempts=0,
+        ))
+
     def execute_dual_query(self, sql, params=None):
         """Execute query on both databases"""
         results = {'sqlite': [], 'mysql': []}
-        
+        self._ensure_engines()
+
         # Execute on SQLite
         if self.sqlite_engine:
             try:
@@ -100,7 +216,7 @@ class DualDatabaseManager:
                         results['sqlite'] = result.rowcount
             except Exception as e:
                 logging.error(f"SQLite query failed: {e}")
-        
+
         # Execute on MySQL if available
         if self.mysql_engine:
             try:
@@ -113,21 +229,445 @@ class DualDatabaseManager:
                     conn.commit()
             except Exception as e:
                 logging.error(f"MySQL query failed: {e}")
-        
+
         return results
 
+
+def build_statement(table_name, operation, data, key, where_clause):
+    """(sql, params) applying one outbox row to MySQL
+
+    INSERT is written as an upsert so a batch that is applied again after a
+    lost acknowledgement does not fail on duplicate keys.
+    """
+    table = _quote(table_name)
+    data = data or {}
+    key = key or {}
+    params = dict(data)
+    params.update({f'k__{name}': value for name, value in key.items()})
+
+    if operation in ('INSERT', 'UPSERT'):
+        columns = sorted(data)
+        column_sql = ', '.join(_quote(c) for c in columns)
+        values_sql = ', '.join(f":{c}" for c in columns)
+        updates = ', '.join(f"{_quote(c)} = VALUES({_quote(c)})" for c in columns if c not in key)
+        sql = f"INSERT INTO {table} ({column_sql}) VALUES ({values_sql})"
+        if updates:
+            sql += f" ON DUPLICATE KEY UPDATE {updates}"
+        return sql, params
+
+    if key:
+        where_sql = ' AND '.join(f"{_quote(name)} = :k__{name}" for name in sorted(key))
+    elif where_clause:
+        where_sql = where_clause
+    else:
+        raise ValueError(f"{operation} on {table_name} needs a key or where clause")
+
+    if operation == 'UPDATE':
+        set_sql = ', '.join(f"{_quote(c)} = :{c}" for c in sorted(data))
+        return f"UPDATE {table} SET {set_sql} WHERE {where_sql}", params
+    if operation == 'DELETE':
+        return f"DELETE FROM {table} WHERE {where_sql}", params
+    raise ValueError(f"Unknown replication operation {operation!r}")
+
+
+def group_statements(entries):
+    """Merge consecutive outbox rows with the same SQL into executemany groups
+
+    Only neighbours are merged, so statements still run in outbox order.
+    Returns [(sql, [params, ...], [entry_id, ...])].
+    """
+    groups = []
+    for entry in entries:
+        sql, params = build_statement(entry['table_name'], entry['operation'],
+                                      json.loads(entry['row_data']) if entry['row_data'] else None,
+                                      json.loads(entry['key_data']) if entry['key_data'] else None,
+                                      entry['where_clause'])
+        if groups and groups[-1][0] == sql:
+            groups[-1][1].append(params)
+            groups[-1][2].append(entry['id'])
+        else:
+            groups.append((sql, [params], [entry['id']]))
+    return groups
+
+
+class OutboxReplicator:
+    """Applies pending replication_outbox rows to MySQL from a background thread
+
+    Every worker process runs a replicator, but each pass first takes a
+    database lock (pg_try_advisory_lock / GET_LOCK), so only one of them
+    replicates at a time and rows are applied strictly in id order. A failing
+    row is retried with exponential backoff and holds back the rows behind it
+    until it succeeds or is parked as 'failed' after OUTBOX_MAX_ATTEMPTS.
+    """
+
+    def __init__(self, app, manager):
+        self.app = app
+        self.manager = manager
+        self._pid = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._last_purge = 0.0
+        self.stats = {'applied': 0, 'failed': 0, 'batches': 0, 'last_error': None, 'last_applied_at': None}
+
+    def ensure_started(self):
+        """Start the thread in this process (after a gunicorn fork the parent's thread is gone)"""
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='outbox-replicator', daemon=True)
+            self._thread.start()
+            logging.info(f"🔁 Outbox replicator started in process {self._pid}")
+
+    def _run(self):
+        while True:
+            applied = 0
+            try:
+                with self.app.app_context():
+                    applied = self.drain_once()
+            except Exception as e:
+                logging.error(f"❌ Outbox replicator pass failed: {e}")
+            if not applied:
+                time.sleep(OUTBOX_POLL_SECONDS)
+
+    def _try_lock(self, conn):
+        dialect = conn.dialect.name
+        if dialect == 'postgresql':
+            return bool(conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {'id': OUTBOX_LOCK_ID}).scalar())
+        if dialect == 'mysql':
+            return conn.execute(text("SELECT GET_LOCK(:name, 0)"), {'name': OUTBOX_LOCK_NAME}).scalar() == 1
+        return True
+
+    def _unlock(self, conn):
+        dialect = conn.dialect.name
+        if dialect == 'postgresql':
+            conn.execute(text("SELECT pg_advisory_unlock(:id)"), {'id': OUTBOX_LOCK_ID})
+        elif dialect == 'mysql':
+            conn.execute(text("SELECT RELEASE_LOCK(:name)"), {'name': OUTBOX_LOCK_NAME})
+        conn.commit()
+
+    def drain_once(self, batch_size=None):
+        """Apply one batch of pending rows; returns how many were applied"""
+        from app import db
+        self.manager._ensure_engines()
+        if not self.manager.mysql_engine:
+            return 0
+
+        with db.engine.connect() as conn:
+            if not outbox_available(conn) or not self._try_lock(conn):
+                return 0
+            try:
+                applied = self._apply_pending(conn, batch_size or OUTBOX_BATCH_SIZE)
+                self._purge(conn)
+                return applied
+            finally:
+                self._unlock(conn)
+
+    def _apply_pending(self, conn, batch_size):
+        import wms_metrics
+        now = datetime.utcnow()
+        entries = [dict(row._mapping) for row in conn.execute(text(
+            "SELECT id, table_name, operation, row_data, key_data, where_clause, attempts, next_attempt_at "
+            "FROM replication_outbox WHERE status = 'pending' ORDER BY id LIMIT :limit"
+        ), {'limit': batch_size})]
+        conn.commit()
+        if not entries or (entries[0]['next_attempt_at'] and entries[0]['next_attempt_at'] > now):
+            return 0
+
+        try:
+            groups = group_statements(entries)
+            with self.manager.mysql_engine.begin() as mysql_conn:
+                for sql, params, _ in groups:
+                    mysql_conn.execute(text(sql), params)
+            self._mark_done(conn, [entry['id'] for entry in entries])
+            applied = len(entries)
+        except Exception as e:
+            wms_metrics.inc('wms_replication_errors_total')
+            logging.warning(f"⚠️ Outbox batch of {len(entries)} failed on MySQL, retrying row by row: {e}")
+            applied = self._apply_one_by_one(conn, entries)
+
+        if applied:
+            self.stats['applied'] += applied
+            self.stats['batches'] += 1
+            self.stats['last_applied_at'] = datetime.utcnow().isoformat()
+            wms_metrics.inc('wms_replication_applied_total', value=applied)
+            logging.debug(f"🔁 Replicated {applied} outbox rows to MySQL")
+        return applied
+
+    def _apply_one_by_one(self, conn, entries):
+        """Apply rows in order, each in its own transaction, up to the first failure"""
+        applied = 0
+        for entry in entries:
+            try:
+                sql, params, _ = group_statements([entry])[0]
+                with self.manager.mysql_engine.begin() as mysql_conn:
+                    mysql_conn.execute(text(sql), params)
+            except Exception as e:
+                self._record_failure(conn, entry, e)
+                if entry['attempts'] + 1 < OUTBOX_MAX_ATTEMPTS:
+                    break
+                continue
+            self._mark_done(conn, [entry['id']])
+            applied += 1
+        return applied
+
+    def _mark_done(self, conn, ids):
+        conn.execute(text(
+            "UPDATE replication_outbox SET status = 'done', processed_at = :now, last_error = NULL WHERE id = :id"
+        ), [{'id': entry_id, 'now': datetime.utcnow()} for entry_id in ids])
+        conn.commit()
+
+    def _record_failure(self, conn, entry, error):
+        attempts = entry['attempts'] + 1
+        parked = attempts >= OUTBOX_MAX_ATTEMPTS
+        delay = min(2 ** attempts, MAX_BACKOFF_SECONDS)
+        conn.execute(text(
+            "UPDATE replication_outbox SET attempts = :attempts, last_error = :error, "
+            "next_attempt_at = :next_at, status = :status WHERE id = :id"
+        ), {
+            'id': entry['id'],
+            'attempts': attempts,
+            'error': str(error)[:2000],
+            'next_at': datetime.utcnow() + timedelta(seconds=delay),
+            'status': 'failed' if parked else 'pending',
+        })
+        conn.commit()
+        self.stats['last_error'] = str(error)[:500]
+        if parked:
+            self.stats['failed'] += 1
+            logging.error(f"❌ Outbox row {entry['id']} ({entry['operation']} {entry['table_name']}) "
+                          f"parked after {attempts} attempts: {error}")
+        else:
+            logging.warning(f"⚠️ Outbox row {entry['id']} failed (attempt {attempts}), retrying in {delay}s: {error}")
+
+    def _purge(self, conn):
+        """Delete applied rows older than OUTBOX_RETENTION_HOURS, at most every 10 minutes"""
+        if time.time() - self._last_purge < 600:
+            return
+        self._last_purge = time.time()
+        cutoff = datetime.utcnow() - timedelta(hours=OUTBOX_RETENTION_HOURS)
+        result = conn.execute(text(
+            "DELETE FROM replication_outbox WHERE status = 'done' AND processed_at < :cutoff"
+        ), {'cutoff': cutoff})
+        conn.commit()
+        if result.rowcount:
+            logging.info(f"🧹 Purged {result.rowcount} replicated outbox rows")
+
+
+def _row_values(connection, state):
+    """Column name -> value of every column of a flushed object
+
+    Taken from the object when all its columns are loaded; otherwise (deferred
+    or expired attributes, server-side defaults) the row is read back by
+    primary key on the flush's connection, so the upsert never misses a column.
+    """
+    values = {}
+    for attr in state.mapper.column_attrs:
+        if attr.key not in state.dict:
+            break
+        values[attr.columns[0].name] = state.dict[attr.key]
+    else:
+        return values
+
+    table = state.mapper.local_table
+    key = _primary_key(state)
+    row = connection.execute(
+        table.select().where(*[table.c[name] == value for name, value in key.items()])
+    ).mappings().first()
+    if row is None:
+        return values
+    return {column.name: row[column] for column in table.columns}
+
+
+def _primary_key(state):
+    # The identity key is only assigned after after_flush, so read the attributes
+    mapper = state.mapper
+    return {column.name: state.dict.get(mapper.get_property_by_column(column).key)
+            for column in mapper.primary_key}
+
+
+def _capture_flush(session, flush_context):
+    """Append outbox rows for the objects in this flush, on the flush's own connection"""
+    tables = replicated_tables()
+    if tables is not None and not tables:
+        return
+
+    from sqlalchemy import inspect
+    from models import ReplicationOutbox
+    connection = session.connection()
+    if not outbox_available(connection):
+        return
+    rows = []
+    now = datetime.utcnow()
+    changes = [('UPSERT', obj) for obj in session.new] + \
+              [('UPSERT', obj) for obj in session.dirty if session.is_modified(obj, include_collections=False)] + \
+              [('DELETE', obj) for obj in session.deleted]
+    for operation, obj in changes:
+        state = inspect(obj)
+        table_name = getattr(state.mapper.local_table, 'name', None)
+        if not table_name or table_name == ReplicationOutbox.__tablename__:
+            continue
+        if tables is not None and table_name not in tables:
+            continue
+        rows.append({
+            'table_name': table_name,
+            'operation': operation,
+            'row_data': _dumps(_row_values(connection, state)) if operation == 'UPSERT' else None,
+            'key_data': _dumps(_primary_key(state)),
+            'where_clause': None,
+            'status': 'pending',
+            'attempts': 0,
+            'created_at': now,
+        })
+    if rows:
+        connection.execute(ReplicationOutbox.__table__.insert(), rows)
+
+
+CAPTURE_CHUNK = 500
+_capture = {'enabled': False}
+
+
+def captures(table_name):
+    """Whether writes to table_name are captured into the outbox in this process"""
+    if not _capture['enabled'] or table_name == 'replication_outbox':
+        return False
+    tables = replicated_tables()
+    return tables is None or table_name in tables
+
+
+def _outbox_rows(table, operation, records):
+    now = datetime.utcnow()
+    key_columns = [column.name for column in table.primary_key.columns]
+    return [{
+        'table_name': table.name,
+        'operation': operation,
+        'row_data': _dumps(record) if operation == 'UPSERT' else None,
+        'key_data': _dumps({name: record[name] for name in key_columns}),
+        'where_clause': None,
+        'status': 'pending',
+        'attempts': 0,
+        'created_at': now,
+    } for record in records]
+
+
+def capture_where(connection, table, whereclause):
+    """Queue UPSERTs for the rows of table matching whereclause, on the writer's connection
+
+    For writes the flush listener cannot see (bulk mappings, Core statements):
+    call it after the write, inside the same transaction.
+    """
+    if not captures(table.name) or not outbox_available(connection):
+        return 0
+    from models import ReplicationOutbox
+    records = [dict(row) for row in connection.execute(table.select().where(whereclause)).mappings()]
+    if records:
+        connection.execute(ReplicationOutbox.__table__.insert(), _outbox_rows(table, 'UPSERT', records))
+    return len(records)
+
+
+def capture_keys(connection, table, keys, operation='UPSERT'):
+    """Queue rows by primary key value (single-column keys), in chunks of CAPTURE_CHUNK"""
+    if not keys or not captures(table.name) or not outbox_available(connection):
+        return
+    (key_column,) = table.primary_key.columns
+    keys = list(keys)
+    for start in range(0, len(keys), CAPTURE_CHUNK):
+        chunk = keys[start:start + CAPTURE_CHUNK]
+        if operation == 'DELETE':
+            from models import ReplicationOutbox
+            connection.execute(ReplicationOutbox.__table__.insert(),
+                               _outbox_rows(table, 'DELETE', [{key_column.name: key} for key in chunk]))
+        else:
+            capture_where(connection, table, key_column.in_(chunk))
+
+
+def _capture_bulk_write(orm_execute_state):
+    """Capture ORM bulk UPDATE / DELETE statements, which never reach after_flush
+
+    The affected primary keys are selected with the statement's own WHERE
+    before it runs, so rows an UPDATE moves out of its filter are still
+    queued. Multi-column keys and statements without a mapped table are
+    skipped.
+    """
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return None
+    mapper = orm_execute_state.bind_mapper
+    table = getattr(mapper, 'local_table', None) if mapper is not None else None
+    if table is None or not captures(table.name) or len(table.primary_key.columns) != 1:
+        return None
+    connection = orm_execute_state.session.connection()
+    if not outbox_available(connection):
+        return None
+
+    from sqlalchemy import select
+    (key_column,) = table.primary_key.columns
+    parameters = orm_execute_state.parameters
+    if isinstance(parameters, list):
+        # Bulk UPDATE by primary key: one parameter set per row
+        key_attribute = mapper.get_property_by_column(key_column).key
+        keys = [params[key_attribute] for params in parameters if key_attribute in params]
+    else:
+        selection = select(key_column)
+        if orm_execute_state.statement.whereclause is not None:
+            selection = selection.where(orm_execute_state.statement.whereclause)
+        keys = connection.execute(selection).scalars().all()
+    result = orm_execute_state.invoke_statement()
+    capture_keys(connection, table, keys, 'DELETE' if orm_execute_state.is_delete else 'UPSERT')
+    return result
+
+
+def _outbox_pending_gauge():
+    """Outbox backlog for /metrics, read at most every 15 seconds"""
+    if time.time() - _pending_cache['at'] < 15:
+        return _pending_cache['samples']
+    from app import db
+    from models import ReplicationOutbox
+    pending = db.session.query(db.func.count(ReplicationOutbox.id)) \
+        .filter(ReplicationOutbox.status == 'pending').scalar() or 0
+    failed = db.session.query(db.func.count(ReplicationOutbox.id)) \
+        .filter(ReplicationOutbox.status == 'failed').scalar() or 0
+    samples = [('wms_replication_outbox_pending', {'status': 'pending'}, pending),
+               ('wms_replication_outbox_pending', {'status': 'failed'}, failed)]
+    _pending_cache.update(at=time.time(), samples=samples)
+    return samples
+
+
+_pending_cache = {'at': 0.0, 'samples': []}
+
 # Global instance
 dual_db_manager = None
+outbox_replicator = None
 
 def init_dual_database(app):
-    """Initialize dual database support"""
-    global dual_db_manager
+    """Initialize dual database support
+
+    With replication enabled this hooks the flush listener for
+    REPLICATE_TABLES and starts the replicator lazily on the first request
+    of each worker process.
+    """
+    global dual_db_manager, outbox_replicator
     dual_db_manager = DualDatabaseManager(app)
+    if replication_enabled():
+        outbox_replicator = OutboxReplicator(app, dual_db_manager)
+        _capture['enabled'] = True
+        if not event.contains(Session, 'after_flush', _capture_flush):
+            event.listen(Session, 'after_flush', _capture_flush)
+        if not event.contains(Session, 'do_orm_execute', _capture_bulk_write):
+            event.listen(Session, 'do_orm_execute', _capture_bulk_write)
+        app.before_request(outbox_replicator.ensure_started)
+        try:
+            import wms_metrics
+            wms_metrics.register_scrape_gauge(_outbox_pending_gauge)
+        except Exception as e:
+            logging.debug(f"Outbox metrics not registered: {e}")
+        logging.info("🔁 MySQL replication via outbox enabled")
     return dual_db_manager
 
-def sync_model_change(model_name, operation, data, where_clause=None):
-    """Helper function to sync model changes"""
+def sync_model_change(model_name, operation, data, where_clause=None, key=None):
+    """Queue a model change for MySQL - call before committing the change itself"""
     if dual_db_manager:
         # Convert SQLAlchemy model name to table name
         table_name = model_name.lower() + 's' if not model_name.endswith('s') else model_name.lower()
-        dual_db_manager.sync_to_mysql(table_name, operation, data, where_clause)
\ No newline at end of file
+        dual_db_manager.sync_to_mysql(table_name, operation, data, where_clause, key=key)
@@ -0,0 +1,94 @@
+"""
+Request Fan-out
+Runs the independent SAP and database lookups of one request side by side, so
+a page waits for its slowest lookup instead of the sum of all of them.
+
+    results = fanout.gather(sap_request=lambda: sap.get_inventory_transfer_request(number),
+                            quantities=lambda: transferred_quantities(transfer.id))
+
+Each task runs on a shared thread pool inside a copy of the current request
+context with its own database session, so tasks return plain values rather
+than ORM objects. A task that calls SAP uses its own SAPIntegration
+(SAPIntegration.sibling() shares the caller's login). SAP calls made by tasks
+are added to the request's SAP call summary. The first exception raised by a
+task is re-raised by gather(). Calls from inside a task run sequentially, so
+nested fan-outs cannot exhaust the pool.
+
+Environment:
+    FANOUT_WORKERS         - threads shared by all requests of a worker process (default 16)
+    FANOUT_TIMEOUT_SECONDS - how long gather() waits for its tasks (default 60)
+"""
+
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, copy_current_request_context, g, has_app_context, has_request_context
+
+
+def _env_int(name, default):
+    try:
+        return max(1, int(os.environ.get(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+WORKERS = _env_int('FANOUT_WORKERS', 16)
+TIMEOUT_SECONDS = _env_int('FANOUT_TIMEOUT_SECONDS', 60)
+THREAD_PREFIX = 'fanout'
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _pool():
+    """Fan-out thread pool, created on first use in each worker process"""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix=THREAD_PREFIX)
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _task(fn):
+    """fn wrapped to run in a copy of the caller's context; returns (result, SAP calls it made)"""
+
+    def run():
+        return fn(), list(g.get('sap_calls') or [])
+
+    if has_request_context():
+        return copy_current_request_context(run)
+    if has_app_context():
+        app = current_app._get_current_object()
+
+        def in_app_context():
+            with app.app_context():
+                return run()
+
+        return in_app_context
+    return lambda: (fn(), [])
+
+
+def gather(**tasks):
+    """Run zero-argument callables concurrently and return {name: result}"""
+    if len(tasks) < 2 or threading.current_thread().name.startswith(THREAD_PREFIX):
+        return {name: fn() for name, fn in tasks.items()}
+
+    deadline = time.monotonic() + TIMEOUT_SECONDS
+    futures = {name: _pool().submit(_task(fn)) for name, fn in tasks.items()}
+    results, calls = {}, []
+    try:
+        for name, future in futures.items():
+            results[name], task_calls = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            calls.extend(task_calls)
+    finally:
+        for future in futures.values():
+            future.cancel()
+        if calls and has_request_context():
+            if g.get('sap_calls') is None:
+                g.sap_calls = []
+            g.sap_calls.extend(calls)
+    return results
@@ -0,0 +1,20 @@
+"""
+Gunicorn configuration - picked up automatically by
+`gunicorn main:app` when started from the project directory.
+Settings come from the same WMS_* environment variables as wsgi_server.py
+Set WMS_METRICS_DIR to a shared directory so /metrics covers every worker
+"""
+from wsgi_server import get_server_settings, on_starting, post_fork, worker_exit
+
+_settings = get_server_settings()
+
+bind = f"{_settings['host']}:{_settings['port']}"
+workers = _settings['workers']
+threads = _settings['threads']
+worker_class = 'gthread'
+timeout = _settings['timeout']
+graceful_timeout = _settings['graceful_timeout']
+keepalive = _settings['keepalive']
+max_requests = _settings['max_requests']
+max_requests_jitter = _settings['max_requests'] // 10
+preload_app = _settings['preload']
@@ -0,0 +1,92 @@
+"""
+HTTP Compression and Conditional GET
+Shrinks the large JSON API responses (bin scans, warehouse and bin lists,
+dropdowns, label batches) that handhelds load over warehouse Wi-Fi, and lets
+repeat loads of unchanged data come back as 304 Not Modified.
+
+- A successful GET returning JSON gets a weak ETag computed from its body; a
+  request whose If-None-Match matches it gets 304 with no body.
+- JSON bodies of HTTP_COMPRESS_MIN_BYTES or more are sent brotli-compressed
+  when the client accepts br and the optional brotli package is installed,
+  otherwise gzip-compressed when the client accepts gzip.
+
+Responses that already carry an ETag or a Content-Encoding (for example
+/api/scan-manifest), streamed responses and file downloads are left alone.
+
+Environment:
+    HTTP_COMPRESSION         - 0 disables compression (default on)
+    HTTP_COMPRESS_MIN_BYTES  - smallest body that is compressed (default 1024)
+    HTTP_COMPRESS_LEVEL      - gzip level 1-9 (default 6); brotli uses quality 5
+    HTTP_JSON_ETAGS          - 0 disables ETags / 304 on JSON GET responses (default on)
+"""
+
+import os
+import gzip
+import hashlib
+
+try:
+    import brotli
+except ImportError:  # optional - gzip only
+    brotli = None
+
+
+def _env_int(name, default):
+    try:
+        return max(1, int(os.environ.get(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_flag(name):
+    return os.environ.get(name, '1').lower() not in ('0', 'false', 'no')
+
+
+COMPRESSION = _env_flag('HTTP_COMPRESSION')
+MIN_BYTES = _env_int('HTTP_COMPRESS_MIN_BYTES', 1024)
+GZIP_LEVEL = min(9, _env_int('HTTP_COMPRESS_LEVEL', 6))
+BROTLI_QUALITY = 5
+JSON_ETAGS = _env_flag('HTTP_JSON_ETAGS')
+
+
+def choose_encoding(accept_encodings):
+    """'br', 'gzip' or None for a request's Accept-Encoding"""
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+def init_app(app):
+    """Add content ETags and compression to JSON responses"""
+    from flask import request
+
+    @app.after_request
+    def compress_json_response(response):
+        if (response.status_code != 200 or response.mimetype != 'application/json'
+                or response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers):
+            return response
+
+        data = response.get_data()
+
+        if JSON_ETAGS and request.method in ('GET', 'HEAD') and 'ETag' not in response.headers:
+            # Weak: the compressed and plain bodies are the same representation
+            response.set_etag(hashlib.sha1(data).hexdigest()[:20], weak=True)
+            response.make_conditional(request)
+            if response.status_code == 304:
+                return response
+
+        if COMPRESSION and len(data) >= MIN_BYTES:
+            response.vary.add('Accept-Encoding')
+            encoding = choose_encoding(request.accept_encodings)
+            if encoding:
+                response.set_data(compress(data, encoding))
+                response.headers['Content-Encoding'] = encoding
+        return response
@@ -7,31 +7,40 @@ from app import app
 import routes
 import api_cascading_dropdowns
 
+
+def check_license():
+    """Validate the local deployment license - returns True when valid"""
+    from Lic.license_validator import load_public_key, validate_license_file
+
+    pub_key_path = os.path.join("C:\\tmp\\", "sap_login", "public_key.pem")
+    license_path = os.path.join("C:\\tmp\\", "sap_login", "license.lic")
+
+    try:
+        pub = load_public_key(pub_key_path)
+        ok, info = validate_license_file(license_path, pub)
+        if not ok:
+            logging.info(f"❌ License validation failed: {info}")
+            return False
+
+        logging.info("✅ License validated Successfully")
+        print("✅ License validated Successfully")
+        return True
+    except Exception as e:
+        logging.info(f"❌ License check error: {e}")
+        return False
+
+
 if __name__ == "__main__":
-    # Check if we're in Replit environment (skip license validation)
-    if os.environ.get('REPL_ID') or os.environ.get('DATABASE_URL'):
-        logging.info("🚀 Running in Replit environment - skipping license validation")
+    from wsgi_server import is_dev_workspace, run
+
+    # The Werkzeug dev server (debugger on) is for development workspaces only;
+    # DATABASE_URL is set everywhere, so it cannot tell the two apart
+    if is_dev_workspace() or os.environ.get('WMS_DEV_SERVER', '').lower() in ('true', '1', 'yes'):
+        logging.info("🚀 Development workspace - Flask dev server, license validation skipped")
         app.run(host="0.0.0.0", port=5000, debug=True)
     else:
-        # Original license validation for local deployment
-        from Lic.license_validator import load_public_key, validate_license_file
-
-        pub_key_path = os.path.join("C:\\tmp\\", "sap_login", "public_key.pem")
-        license_path = os.path.join("C:\\tmp\\", "sap_login", "license.lic")
-
-        try:
-            pub = load_public_key(pub_key_path)
-            ok, info = validate_license_file(license_path, pub)
-            if not ok:
-                logging.info("❌ License validation failed:", info)
-                sys.exit(1)
-            else:
-
-                logging.info("✅ License validated Successfully")
-                print("✅ License validated Successfully")
-        except Exception as e:
-            logging.info(f"❌ License check error: {e}")
+        if not check_license():
             sys.exit(1)
 
-        # Start Flask app only if license is valid
-        app.run(host="0.0.0.0", port=5000, debug=True)
+        # Start the production server only if license is valid
+        run(app)
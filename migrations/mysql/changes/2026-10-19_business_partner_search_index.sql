@@ -0,0 +1,29 @@
+-- Migration: Local business partner search index
+-- Date: 2026-10-19
+-- Description: business_partners becomes an ORM model (models.BusinessPartner) that backs the
+--              customer/vendor type-ahead. Adds the lower-cased search column, the sync
+--              timestamp and a prefix index. SAPIntegration.sync_business_partners fills it.
+
+CREATE TABLE IF NOT EXISTS business_partners (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    card_code VARCHAR(50) UNIQUE NOT NULL,
+    card_name VARCHAR(200) NOT NULL,
+    card_type VARCHAR(20) NOT NULL,
+    phone VARCHAR(50),
+    email VARCHAR(100),
+    address TEXT,
+    is_active BOOLEAN DEFAULT TRUE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- Tables created by the old raw-SQL sync do not have these columns
+ALTER TABLE business_partners ADD COLUMN search_text VARCHAR(260) NULL;
+ALTER TABLE business_partners ADD COLUMN last_synced_at TIMESTAMP NULL;
+
+UPDATE business_partners
+SET search_text = LOWER(CONCAT(card_code, ' ', card_name))
+WHERE search_text IS NULL;
+
+-- LIKE 'abc%' (code/name prefix) uses this index
+CREATE INDEX ix_business_partners_search_text_prefix ON business_partners (search_text);
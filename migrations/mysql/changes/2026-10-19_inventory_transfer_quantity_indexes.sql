@@ -0,0 +1,8 @@
+-- Migration: Inventory transfer quantity indexes
+-- Date: 2026-10-19
+-- Description: The inventory transfer detail page sums the WMS quantities per item code for the
+--              transfer and for every transfer of the same SAP transfer request in one grouped
+--              query. These indexes find the request's transfers and group their lines by item.
+
+CREATE INDEX ix_inventory_transfers_request_number ON inventory_transfers (transfer_request_number, status);
+CREATE INDEX ix_inventory_transfer_items_transfer_item ON inventory_transfer_items (inventory_transfer_id, item_code);
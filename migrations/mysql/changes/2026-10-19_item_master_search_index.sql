@@ -0,0 +1,26 @@
+-- Migration: Local item master search index
+-- Date: 2026-10-19
+-- Description: item_master holds a copy of the SAP B1 item master (OITM) for item type-ahead
+--              (/api/items/search) and exact-code lookups without a Service Layer call.
+--              Filled by SAPIntegration.sync_items (flask sync-master-data).
+
+CREATE TABLE IF NOT EXISTS item_master (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    item_code VARCHAR(50) UNIQUE NOT NULL,
+    item_name VARCHAR(200) NOT NULL DEFAULT '',
+    item_group_code INT NULL,
+    item_type VARCHAR(10) NOT NULL DEFAULT 'none',
+    manage_method VARCHAR(1) NULL,
+    batch_managed BOOLEAN DEFAULT FALSE,
+    serial_managed BOOLEAN DEFAULT FALSE,
+    inventory_uom VARCHAR(20) NULL,
+    is_inventory_item BOOLEAN DEFAULT TRUE,
+    is_active BOOLEAN DEFAULT TRUE,
+    search_text VARCHAR(260) NULL,
+    last_synced_at TIMESTAMP NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+
+    -- LIKE 'abc%' (code/description prefix) uses this index
+    INDEX ix_item_master_search_text_prefix (search_text)
+);
@@ -0,0 +1,9 @@
+-- Migration: Multi GRN open-PO snapshot
+-- Date: 2026-10-19
+-- Description: Step 2 of the Multi GRN wizard stores the supplier's open POs on the batch.
+--              Step 3 reuses them and only re-reads the selected POs by DocEntry once the
+--              snapshot is older than MULTI_GRN_PO_SNAPSHOT_SECONDS.
+
+ALTER TABLE multi_grn_batches
+    ADD COLUMN po_snapshot LONGTEXT NULL,
+    ADD COLUMN po_snapshot_at TIMESTAMP NULL;
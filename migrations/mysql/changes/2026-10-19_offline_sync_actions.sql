@@ -0,0 +1,24 @@
+-- Migration: Offline scanner sync idempotency keys
+-- Date: 2026-10-19
+-- Description: One row per scanner action replayed through /api/sync_offline. Written in the
+--              same transaction as the action, so a re-sent batch returns the stored result
+--              instead of applying the action twice.
+
+CREATE TABLE IF NOT EXISTS offline_sync_actions (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    idempotency_key VARCHAR(100) NOT NULL,
+    user_id INT NOT NULL,
+    action_type VARCHAR(50) NOT NULL,
+    document_key VARCHAR(100) NULL,
+    result TEXT NULL,
+    client_timestamp VARCHAR(50) NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT uq_offline_sync_actions_key UNIQUE (idempotency_key),
+    CONSTRAINT fk_offline_sync_actions_user
+        FOREIGN KEY (user_id)
+        REFERENCES users(id),
+
+    INDEX idx_offline_sync_actions_user (user_id),
+    INDEX idx_offline_sync_actions_created (created_at)
+);
@@ -0,0 +1,28 @@
+-- Migration: QC queue created_at NOT NULL
+-- Date: 2026-10-19
+-- Description: The QC queues page through documents by (created_at, id). A NULL created_at has
+--              no place in that order, so older rows are back-filled (from updated_at, else the
+--              epoch) and the column becomes NOT NULL; pages then stay index range scans on
+--              (status, created_at, id).
+
+UPDATE grpo_documents SET created_at = COALESCE(updated_at, '1970-01-01 00:00:00') WHERE created_at IS NULL;
+UPDATE inventory_transfers SET created_at = COALESCE(updated_at, '1970-01-01 00:00:00') WHERE created_at IS NULL;
+UPDATE serial_number_transfers SET created_at = COALESCE(updated_at, '1970-01-01 00:00:00') WHERE created_at IS NULL;
+UPDATE serial_item_transfers SET created_at = COALESCE(updated_at, '1970-01-01 00:00:00') WHERE created_at IS NULL;
+UPDATE direct_inventory_transfers SET created_at = COALESCE(updated_at, '1970-01-01 00:00:00') WHERE created_at IS NULL;
+UPDATE delivery_documents SET created_at = '1970-01-01 00:00:00' WHERE created_at IS NULL;
+
+ALTER TABLE grpo_documents MODIFY created_at DATETIME NOT NULL;
+ALTER TABLE inventory_transfers MODIFY created_at DATETIME NOT NULL;
+ALTER TABLE serial_number_transfers MODIFY created_at DATETIME NOT NULL;
+ALTER TABLE serial_item_transfers MODIFY created_at DATETIME NOT NULL;
+ALTER TABLE direct_inventory_transfers MODIFY created_at DATETIME NOT NULL;
+ALTER TABLE delivery_documents MODIFY created_at DATETIME NOT NULL;
+
+-- DOWN:
+-- ALTER TABLE grpo_documents MODIFY created_at DATETIME NULL;
+-- ALTER TABLE inventory_transfers MODIFY created_at DATETIME NULL;
+-- ALTER TABLE serial_number_transfers MODIFY created_at DATETIME NULL;
+-- ALTER TABLE serial_item_transfers MODIFY created_at DATETIME NULL;
+-- ALTER TABLE direct_inventory_transfers MODIFY created_at DATETIME NULL;
+-- ALTER TABLE delivery_documents MODIFY created_at DATETIME NULL;
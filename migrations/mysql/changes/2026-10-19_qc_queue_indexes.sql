@@ -0,0 +1,12 @@
+-- Migration: QC queue keyset indexes
+-- Date: 2026-10-19
+-- Description: The QC dashboard and /api/qc/queues/<queue> page through the documents waiting
+--              for approval ordered by (created_at, id) after a cursor. These indexes make
+--              every page an index range scan regardless of the backlog size.
+
+CREATE INDEX ix_grpo_documents_qc_queue ON grpo_documents (status, created_at, id);
+CREATE INDEX ix_inventory_transfers_qc_queue ON inventory_transfers (status, created_at, id);
+CREATE INDEX ix_serial_number_transfers_qc_queue ON serial_number_transfers (status, created_at, id);
+CREATE INDEX ix_serial_item_transfers_qc_queue ON serial_item_transfers (status, created_at, id);
+CREATE INDEX ix_direct_inventory_transfers_qc_queue ON direct_inventory_transfers (status, created_at, id);
+CREATE INDEX ix_delivery_documents_qc_queue ON delivery_documents (status, created_at, id);
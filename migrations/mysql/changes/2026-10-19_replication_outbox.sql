@@ -0,0 +1,22 @@
+-- Migration: Replication outbox for the secondary MySQL database
+-- Date: 2026-10-19
+-- Description: Row changes are appended here in the same transaction as the primary write.
+--              The background replicator in db_dual_support.py applies pending rows to MySQL
+--              in id order and marks them done, replacing the inline MySQL writes.
+
+CREATE TABLE IF NOT EXISTS replication_outbox (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    table_name VARCHAR(100) NOT NULL,
+    operation VARCHAR(10) NOT NULL,
+    row_data TEXT NULL,
+    key_data TEXT NULL,
+    where_clause TEXT NULL,
+    status VARCHAR(10) NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    last_error TEXT NULL,
+    next_attempt_at DATETIME NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    processed_at DATETIME NULL,
+
+    INDEX idx_replication_outbox_status_id (status, id)
+);
@@ -1,8 +1,46 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
 from datetime import datetime
 from flask_login import UserMixin
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import relationship
+from sqlalchemy import event
+from sqlalchemy.orm import Session, relationship
 from app import db
+from db_dual_support import capture_where
+
+# Decoded permission sets per user id: {id: (role, permissions JSON, dict, granted screens)}
+PERMISSION_CACHE_SIZE = 1024
+_permission_cache = OrderedDict()
+_permission_cache_lock = threading.Lock()
+
+# Users loaded by Flask-Login, reused across requests: {id: (loaded at, detached copy)}
+IDENTITY_CACHE_SIZE = 1024
+try:
+    IDENTITY_CACHE_SECONDS = float(os.environ.get('IDENTITY_CACHE_SECONDS', 30))
+except ValueError:
+    IDENTITY_CACHE_SECONDS = 30
+_identity_cache = OrderedDict()
+_identity_cache_lock = threading.Lock()
+
+# Quantity already moved by WMS per transfer request number: {request number: (loaded at, {item_code: quantity})}
+try:
+    TRANSFER_TOTALS_SECONDS = float(os.environ.get('TRANSFER_TOTALS_CACHE_SECONDS', 30))
+except ValueError:
+    TRANSFER_TOTALS_SECONDS = 30
+_transfer_totals_cache = {}
+_transfer_requests = {}  # transfer id: request number, to invalidate on line changes
+_transfer_totals_lock = threading.Lock()
+
+# Last sync time of the local master data indexes: {table: (read at, MAX(last_synced_at))}
+try:
+    INDEX_SYNC_CACHE_SECONDS = float(os.environ.get('INDEX_SYNC_CACHE_SECONDS', 60))
+except ValueError:
+    INDEX_SYNC_CACHE_SECONDS = 60
+_index_sync_times = {}
+_index_sync_lock = threading.Lock()
 
 
 class User(UserMixin, db.Model):
@@ -33,6 +71,9 @@ class User(UserMixin, db.Model):
 
     def get_permissions(self):
         """Get user permissions as a dictionary"""
+        return dict(self._cached_permissions()[2])
+
+    def _decode_permissions(self):
         import json
         if self.permissions:
             try:
@@ -41,10 +82,35 @@ class User(UserMixin, db.Model):
                 return {}
         return self.get_default_permissions()
 
+    def _cached_permissions(self):
+        """(role, permissions JSON, decoded dict, granted screens) for this user
+
+        Kept in a process-wide LRU keyed by user id. An entry is only used while
+        the row's role and permissions text still match it, so an edit saved by
+        another worker is picked up as soon as the row is loaded again.
+        """
+        with _permission_cache_lock:
+            entry = _permission_cache.get(self.id)
+            if entry and entry[0] == self.role and entry[1] == self.permissions:
+                _permission_cache.move_to_end(self.id)
+                return entry
+
+        decoded = self._decode_permissions()
+        entry = (self.role, self.permissions, decoded,
+                 frozenset(screen for screen, allowed in decoded.items() if allowed))
+        if self.id is not None:
+            with _permission_cache_lock:
+                _permission_cache[self.id] = entry
+                while len(_permission_cache) > PERMISSION_CACHE_SIZE:
+                    _permission_cache.popitem(last=False)
+        return entry
+
     def set_permissions(self, perms_dict):
         """Set user permissions from a dictionary"""
         import json
         self.permissions = json.dumps(perms_dict)
+        with _permission_cache_lock:
+            _permission_cache.pop(self.id, None)
 
     def get_default_permissions(self):
         """Get default permissions based on role"""
@@ -114,7 +180,7 @@ class User(UserMixin, db.Model):
         """Check if user has permission for a specific screen"""
         if self.role == 'admin':
             return True
-        return self.get_permissions().get(screen, False)
+        return screen in self._cached_permissions()[3]
 
     # Relationships
     # Note: GRPO relationships are in modules/grpo/models.py
@@ -129,6 +195,60 @@ class User(UserMixin, db.Model):
     qr_code_labels = relationship('QRCodeLabel', back_populates='user')
 
 
+def load_identity(user_id):
+    """User for Flask-Login's user_loader, without a users query on most requests
+
+    The row is kept as a detached copy in a process-wide LRU and merged into
+    the request's session with load=False, so the returned user is a normal
+    persistent object (changes to it are saved on commit). Committing a change
+    to a user in this process drops its entry; changes saved by another worker
+    - permissions, role, deactivation - apply within IDENTITY_CACHE_SECONDS
+    (default 30, 0 disables the cache).
+    """
+    from sqlalchemy.orm import make_transient_to_detached
+
+    with _identity_cache_lock:
+        entry = _identity_cache.get(user_id)
+        if entry and entry[0] > time.time() - IDENTITY_CACHE_SECONDS:
+            _identity_cache.move_to_end(user_id)
+            return db.session.merge(entry[1], load=False)
+
+    user = db.session.get(User, user_id)
+    if user is None or IDENTITY_CACHE_SECONDS <= 0:
+        return user
+    copy = User()
+    for attr in db.inspect(User).column_attrs:
+        setattr(copy, attr.key, getattr(user, attr.key))
+    make_transient_to_detached(copy)
+    with _identity_cache_lock:
+        _identity_cache[user_id] = (time.time(), copy)
+        while len(_identity_cache) > IDENTITY_CACHE_SIZE:
+            _identity_cache.popitem(last=False)
+    return user
+
+
+def _note_user_changes(session, flush_context):
+    """Remember which users this transaction changed"""
+    changed = session.info.setdefault('identity_changed', set())
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            changed.add(obj.id)
+
+
+def _drop_identities(session):
+    changed = session.info.pop('identity_changed', None)
+    if not changed:
+        return
+    with _identity_cache_lock:
+        for user_id in changed:
+            _identity_cache.pop(user_id, None)
+
+
+event.listen(Session, 'after_flush', _note_user_changes)
+event.listen(Session, 'after_commit', _drop_identities)
+event.listen(Session, 'after_rollback', lambda session: session.info.pop('identity_changed', None))
+
+
 class InventoryTransfer(db.Model):
     __tablename__ = 'inventory_transfers'
 
@@ -143,7 +263,7 @@ class InventoryTransfer(db.Model):
     qc_notes = db.Column(db.Text, nullable=True)
     from_warehouse = db.Column(db.String(20), nullable=True)
     to_warehouse = db.Column(db.String(20), nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime,
                         default=datetime.utcnow,
                         onupdate=datetime.utcnow)
@@ -183,6 +303,91 @@ class InventoryTransferItem(db.Model):
     inventory_transfer = relationship('InventoryTransfer',
                                       back_populates='items')
 
+    @staticmethod
+    def transfer_quantities(transfer_id, request_number):
+        """({item_code: quantity in this transfer}, {item_code: quantity in all transfers of the request})
+
+        Quantities are summed per item code. The request-wide totals leave out
+        rejected transfers and are cached per request number for
+        TRANSFER_TOTALS_CACHE_SECONDS (default 30); saving a change to a
+        transfer or its lines drops the cached totals in this process. Either
+        way the page needs one query.
+        """
+        with _transfer_totals_lock:
+            _transfer_requests[transfer_id] = request_number
+            cached = _transfer_totals_cache.get(request_number)
+        if cached and cached[0] > time.time() - TRANSFER_TOTALS_SECONDS:
+            rows = db.session.query(InventoryTransferItem.item_code,
+                                    db.func.sum(InventoryTransferItem.quantity)) \
+                .filter(InventoryTransferItem.inventory_transfer_id == transfer_id) \
+                .group_by(InventoryTransferItem.item_code).all()
+            return {code: float(qty or 0) for code, qty in rows}, dict(cached[1])
+
+        in_transfer = db.case((InventoryTransfer.id == transfer_id, InventoryTransferItem.quantity), else_=0)
+        counted = db.case((InventoryTransfer.status != 'rejected', InventoryTransferItem.quantity), else_=0)
+        rows = db.session.query(InventoryTransferItem.item_code,
+                                db.func.sum(in_transfer),
+                                db.func.sum(counted)) \
+            .join(InventoryTransfer, InventoryTransferItem.inventory_transfer_id == InventoryTransfer.id) \
+            .filter(InventoryTransfer.transfer_request_number == request_number) \
+            .group_by(InventoryTransferItem.item_code).all()
+
+        this_transfer = {code: float(qty or 0) for code, qty, _ in rows if qty}
+        totals = {code: float(total or 0) for code, _, total in rows}
+        with _transfer_totals_lock:
+            _transfer_totals_cache[request_number] = (time.time(), totals)
+        return this_transfer, dict(totals)
+
+
+def _note_transfer_changes(session, flush_context):
+    """Remember which transfer requests this transaction changed"""
+    changed = session.info.setdefault('transfer_totals_changed', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, InventoryTransfer):
+            changed.add(obj.transfer_request_number)
+            if obj.id is not None:
+                with _transfer_totals_lock:
+                    _transfer_requests[obj.id] = obj.transfer_request_number
+        elif isinstance(obj, InventoryTransferItem):
+            with _transfer_totals_lock:
+                # None = a transfer this process has not seen: drop every cached total
+                changed.add(_transfer_requests.get(obj.inventory_transfer_id))
+
+
+def _drop_transfer_totals(session):
+    changed = session.info.pop('transfer_totals_changed', None)
+    if not changed:
+        return
+    with _transfer_totals_lock:
+        if None in changed:
+            _transfer_totals_cache.clear()
+        for request_number in changed:
+            _transfer_totals_cache.pop(request_number, None)
+
+
+def ensure_transfer_indexes():
+    """Indexes behind InventoryTransferItem.transfer_quantities (request number lookup and line grouping)"""
+    dialect = db.engine.dialect.name
+    for name, table, columns in (
+            ('ix_inventory_transfers_request_number', 'inventory_transfers', 'transfer_request_number, status'),
+            ('ix_inventory_transfer_items_transfer_item', 'inventory_transfer_items',
+             'inventory_transfer_id, item_code')):
+        if dialect == 'mysql':
+            sql = f"CREATE INDEX {name} ON {table} ({columns})"
+        else:
+            sql = f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(db.text(sql))
+        except Exception as e:
+            # MySQL has no IF NOT EXISTS - the index is usually there already
+            logging.debug(f"Transfer index statement skipped ({sql}): {e}")
+
+
+event.listen(Session, 'after_flush', _note_transfer_changes)
+event.listen(Session, 'after_commit', _drop_transfer_totals)
+event.listen(Session, 'after_rollback', lambda session: session.info.pop('transfer_totals_changed', None))
+
 
 class PickList(db.Model):
     __tablename__ = 'pick_lists'
@@ -453,6 +658,241 @@ class BinLocation(db.Model):
         return f'<BinLocation {self.bin_code}>'
 
 
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def build_search_text(code, name):
+    """Value of the search_text column of the local master data indexes"""
+    return f"{code or ''} {name or ''}".strip().lower()[:260]
+
+
+def _ranked_search(query, code_col, name_col, search_col, term, page, per_page):
+    """Filter query to rows matching term and return a page of them as (rows, has_more)
+
+    Exact code matches rank first, then code prefix, then name prefix,
+    then any substring of code or name.
+    """
+    term = (term or '').strip().lower()
+    if term:
+        escaped = _escape_like(term)
+        query = query.filter(search_col.like(f"%{escaped}%", escape='\\'))
+        rank = db.case(
+            (db.func.lower(code_col) == term, 0),
+            (search_col.like(f"{escaped}%", escape='\\'), 1),
+            (db.func.lower(name_col).like(f"{escaped}%", escape='\\'), 2),
+            else_=3)
+        query = query.order_by(rank, name_col)
+    else:
+        query = query.order_by(name_col)
+
+    page = max(1, page)
+    rows = query.offset((page - 1) * per_page).limit(per_page + 1).all()
+    return rows[:per_page], len(rows) > per_page
+
+
+def _add_missing_columns(table, ddl_by_column):
+    """ALTER TABLE ADD COLUMN for columns an older version of the table does not have"""
+    from sqlalchemy import inspect
+
+    existing = {col['name'] for col in inspect(db.engine).get_columns(table)}
+    with db.engine.begin() as conn:
+        for column, ddl in ddl_by_column.items():
+            if column not in existing:
+                conn.execute(db.text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def _create_search_indexes(table, column):
+    """Prefix (b-tree) index on the search column, plus a trigram index on PostgreSQL
+
+    LIKE 'abc%' uses the b-tree index; LIKE '%abc%' uses the pg_trgm GIN index
+    when the extension can be created, otherwise it scans the (small) table.
+    """
+    dialect = db.engine.dialect.name
+    statements = []
+    if dialect == 'postgresql':
+        statements.append(f"CREATE INDEX IF NOT EXISTS ix_{table}_{column}_prefix "
+                          f"ON {table} ({column} varchar_pattern_ops)")
+        statements.append("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        statements.append(f"CREATE INDEX IF NOT EXISTS ix_{table}_{column}_trgm "
+                          f"ON {table} USING gin ({column} gin_trgm_ops)")
+    elif dialect == 'mysql':
+        statements.append(f"CREATE INDEX ix_{table}_{column}_prefix ON {table} ({column})")
+    else:
+        statements.append(f"CREATE INDEX IF NOT EXISTS ix_{table}_{column}_prefix ON {table} ({column})")
+
+    for sql in statements:
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(db.text(sql))
+        except Exception as e:
+            # Index already there (MySQL has no IF NOT EXISTS) or no rights for CREATE EXTENSION
+            logging.debug(f"Search index statement skipped ({sql}): {e}")
+
+
+def _last_synced(model):
+    """MAX(last_synced_at) of a master data index, read from the database at most every INDEX_SYNC_CACHE_SECONDS
+
+    A sync in this process updates the cached value at once (see _mark_synced);
+    syncs in other worker processes are seen after the TTL.
+    """
+    table = model.__tablename__
+    cached = _index_sync_times.get(table)
+    if cached is not None and time.time() - cached[0] < INDEX_SYNC_CACHE_SECONDS:
+        return cached[1]
+    value = db.session.query(db.func.max(model.last_synced_at)).scalar()
+    with _index_sync_lock:
+        _index_sync_times[table] = (time.time(), value)
+    return value
+
+
+def _mark_synced(model, synced_at):
+    with _index_sync_lock:
+        _index_sync_times[model.__tablename__] = (time.time(), synced_at)
+
+
+class BusinessPartner(db.Model):
+    """Local copy of SAP B1 business partners, refreshed by SAPIntegration.sync_business_partners
+
+    Customer/vendor type-ahead searches this table instead of calling the
+    Service Layer on every keystroke.
+    """
+    __tablename__ = 'business_partners'
+
+    id = db.Column(db.Integer, primary_key=True)
+    card_code = db.Column(db.String(50), unique=True, nullable=False)
+    card_name = db.Column(db.String(200), nullable=False)
+    card_type = db.Column(db.String(20), nullable=False)  # cSupplier, cCustomer, cLid
+    phone = db.Column(db.String(50))
+    email = db.Column(db.String(100))
+    address = db.Column(db.Text)
+    is_active = db.Column(db.Boolean, default=True)  # SAP Valid = tYES and not frozen
+    search_text = db.Column(db.String(260))  # lower("<card_code> <card_name>"), see _create_search_indexes
+    last_synced_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    CARD_TYPES = {'S': 'cSupplier', 'C': 'cCustomer', 'L': 'cLid'}
+
+    _schema_checked = False
+
+    def __repr__(self):
+        return f'<BusinessPartner {self.card_code}>'
+
+    @classmethod
+    def ensure_schema(cls):
+        """Create the table, or bring a table created by the old raw-SQL sync up to date"""
+        if cls._schema_checked:
+            return
+        cls.__table__.create(db.engine, checkfirst=True)
+        _add_missing_columns(cls.__tablename__, {
+            'search_text': 'VARCHAR(260)',
+            'last_synced_at': 'TIMESTAMP NULL',
+        })
+        table = cls.__table__
+        with db.engine.begin() as conn:
+            # String + compiles to || or CONCAT() per dialect
+            conn.execute(table.update().where(table.c.search_text.is_(None)).values(
+                search_text=db.func.lower(table.c.card_code + ' ' + table.c.card_name)))
+        _create_search_indexes(cls.__tablename__, 'search_text')
+        cls._schema_checked = True
+
+    @classmethod
+    def last_synced(cls):
+        return _last_synced(cls)
+
+    @classmethod
+    def mark_synced(cls, synced_at):
+        _mark_synced(cls, synced_at)
+
+    @classmethod
+    def search(cls, term='', card_type=None, page=1, per_page=20, active_only=True):
+        """Page of partners matching term as (rows, has_more), best matches first"""
+        query = cls.query
+        if active_only:
+            query = query.filter(cls.is_active.is_(True))
+        if card_type:
+            query = query.filter(cls.card_type == cls.CARD_TYPES.get(card_type, card_type))
+        return _ranked_search(query, cls.card_code, cls.card_name, cls.search_text, term, page, per_page)
+
+    def to_dict(self):
+        return {
+            'CardCode': self.card_code,
+            'CardName': self.card_name,
+            'CardType': self.card_type,
+        }
+
+
+class ItemMaster(db.Model):
+    """Local copy of the SAP B1 item master (OITM), refreshed by SAPIntegration.sync_items
+
+    Serves item type-ahead and exact-code lookups without a Service Layer round trip.
+    """
+    __tablename__ = 'item_master'
+
+    id = db.Column(db.Integer, primary_key=True)
+    item_code = db.Column(db.String(50), unique=True, nullable=False)
+    item_name = db.Column(db.String(200), nullable=False, default='')
+    item_group_code = db.Column(db.Integer, nullable=True)
+    item_type = db.Column(db.String(10), nullable=False, default='none')  # serial, batch, none
+    manage_method = db.Column(db.String(1), nullable=True)  # SAP MngMethod: A = every transaction, R = release only
+    batch_managed = db.Column(db.Boolean, default=False)
+    serial_managed = db.Column(db.Boolean, default=False)
+    inventory_uom = db.Column(db.String(20), nullable=True)
+    is_inventory_item = db.Column(db.Boolean, default=True)
+    is_active = db.Column(db.Boolean, default=True)  # SAP Valid = tYES and not frozen
+    search_text = db.Column(db.String(260))  # lower("<item_code> <item_name>"), see _create_search_indexes
+    last_synced_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    _schema_checked = False
+
+    def __repr__(self):
+        return f'<ItemMaster {self.item_code}>'
+
+    @classmethod
+    def ensure_schema(cls):
+        if cls._schema_checked:
+            return
+        cls.__table__.create(db.engine, checkfirst=True)
+        _create_search_indexes(cls.__tablename__, 'search_text')
+        cls._schema_checked = True
+
+    @classmethod
+    def last_synced(cls):
+        return _last_synced(cls)
+
+    @classmethod
+    def mark_synced(cls, synced_at):
+        _mark_synced(cls, synced_at)
+
+    @classmethod
+    def get_by_code(cls, item_code):
+        return cls.query.filter_by(item_code=item_code).first()
+
+    @classmethod
+    def search(cls, term='', item_type=None, page=1, per_page=20, active_only=True):
+        """Page of items matching term as (rows, has_more), best matches first"""
+        query = cls.query
+        if active_only:
+            query = query.filter(cls.is_active.is_(True))
+        if item_type:
+            query = query.filter(cls.item_type == item_type)
+        return _ranked_search(query, cls.item_code, cls.item_name, cls.search_text, term, page, per_page)
+
+    def to_dict(self):
+        return {
+            'item_code': self.item_code,
+            'item_name': self.item_name,
+            'item_type': self.item_type,
+            'batch_required': bool(self.batch_managed),
+            'serial_required': bool(self.serial_managed),
+            'manage_method': self.manage_method or 'N',
+            'uom': self.inventory_uom,
+        }
+
+
 class BinItem(db.Model):
     __tablename__ = 'bin_items'
     
@@ -504,6 +944,57 @@ class BinScanningLog(db.Model):
         return f'<BinScanningLog {self.bin_code} by {self.user_id}>'
 
 
+class OfflineSyncAction(db.Model):
+    """Scanner action replayed through /api/sync_offline, keyed by the client's idempotency key
+
+    Written in the same transaction as the action's effects, so a batch that is
+    sent again after a lost response returns the stored result instead of
+    applying the action twice.
+    """
+    __tablename__ = 'offline_sync_actions'
+
+    id = db.Column(db.Integer, primary_key=True)
+    idempotency_key = db.Column(db.String(100), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    action_type = db.Column(db.String(50), nullable=False)
+    document_key = db.Column(db.String(100), nullable=True)  # e.g. grpo:12, count:345
+    result = db.Column(db.Text, nullable=True)  # JSON result returned to the client
+    client_timestamp = db.Column(db.String(50), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<OfflineSyncAction {self.idempotency_key} {self.action_type}>'
+
+
+class ReplicationOutbox(db.Model):
+    """Row change waiting to be copied to the secondary MySQL database
+
+    Written in the same transaction as the change itself; the replicator in
+    db_dual_support applies pending rows in id order and marks them done.
+    """
+    __tablename__ = 'replication_outbox'
+
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(100), nullable=False)
+    operation = db.Column(db.String(10), nullable=False)  # UPSERT, INSERT, UPDATE, DELETE
+    row_data = db.Column(db.Text, nullable=True)  # JSON column -> value
+    key_data = db.Column(db.Text, nullable=True)  # JSON primary key column -> value
+    where_clause = db.Column(db.Text, nullable=True)  # legacy sync_model_change callers only
+    status = db.Column(db.String(10), nullable=False, default='pending')  # pending, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    next_attempt_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('idx_replication_outbox_status_id', 'status', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<ReplicationOutbox {self.id} {self.operation} {self.table_name} {self.status}>'
+
+
 class QRCodeLabel(db.Model):
     __tablename__ = 'qr_code_labels'
     
@@ -640,35 +1131,114 @@ class DocumentNumberSeries(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # Default prefixes for series rows created on first use
+    DEFAULT_PREFIXES = {
+        'GRPO': 'GRPO-',
+        'TRANSFER': 'TR-',
+        'PICKLIST': 'PL-',
+        'SERIAL_TRANSFER': 'ST-',
+        'SERIAL_ITEM_TRANSFER': 'SIT-',
+        'DIRECT_INVENTORY_TRANSFER': 'DIT-',
+    }
+
+    # Each worker process reserves a block of numbers with one atomic UPDATE and
+    # hands them out from memory, so creating a document never locks the series
+    # row. Numbers stay unique but can have gaps (unused block ends on restart)
+    # and interleave between workers. DOC_NUMBER_BLOCK_SIZE=1 gives strict order.
+    _blocks = {}
+    _blocks_pid = None
+    _blocks_lock = threading.Lock()
+
+    @classmethod
+    def _block_size(cls):
+        try:
+            return max(1, int(os.environ.get('DOC_NUMBER_BLOCK_SIZE', 20)))
+        except ValueError:
+            return 20
+
+    @classmethod
+    def _reserve_block(cls, document_type, size):
+        """Advance current_number by size in one statement; returns (first, end, prefix, year_suffix) or None"""
+        table = cls.__tablename__
+        params = {'size': size, 'doc_type': document_type, 'now': datetime.utcnow()}
+
+        with db.engine.begin() as conn:
+            if db.engine.dialect.name == 'mysql':
+                # MySQL has no RETURNING - LAST_INSERT_ID(expr) is its per-connection atomic sequence idiom
+                result = conn.execute(db.text(
+                    f"UPDATE {table} SET current_number = LAST_INSERT_ID(current_number + :size), "
+                    f"updated_at = :now WHERE document_type = :doc_type"), params)
+                if not result.rowcount:
+                    return None
+                row = conn.execute(db.text(
+                    f"SELECT LAST_INSERT_ID(), prefix, year_suffix FROM {table} "
+                    f"WHERE document_type = :doc_type"), params).first()
+            else:
+                row = conn.execute(db.text(
+                    f"UPDATE {table} SET current_number = current_number + :size, updated_at = :now "
+                    f"WHERE document_type = :doc_type RETURNING current_number, prefix, year_suffix"),
+                    params).first()
+            if row is not None:
+                # Raw SQL never reaches the outbox flush listener
+                capture_where(conn, cls.__table__, cls.__table__.c.document_type == document_type)
+
+        if row is None:
+            return None
+        end = int(row[0])
+        return end - size, end, row[1], bool(row[2]) if row[2] is not None else True
+
+    @classmethod
+    def _create_series(cls, document_type):
+        """Insert the series row in its own transaction; a concurrent insert by another worker is fine"""
+        from sqlalchemy.exc import IntegrityError
+
+        now = datetime.utcnow()
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(cls.__table__.insert().values(
+                    document_type=document_type,
+                    prefix=cls.DEFAULT_PREFIXES.get(document_type, 'DOC-'),
+                    current_number=1,
+                    year_suffix=True,
+                    created_at=now,
+                    updated_at=now))
+                capture_where(conn, cls.__table__, cls.__table__.c.document_type == document_type)
+        except IntegrityError:
+            pass
+
+    @classmethod
+    def allocate(cls, document_type):
+        """Next unique number for the series as (number, prefix, year_suffix)"""
+        with cls._blocks_lock:
+            # Blocks reserved in the gunicorn master must not be reused by forked workers
+            if cls._blocks_pid != os.getpid():
+                cls._blocks = {}
+                cls._blocks_pid = os.getpid()
+
+            block = cls._blocks.get(document_type)
+            if block is None or block['next'] >= block['end']:
+                size = cls._block_size()
+                reserved = cls._reserve_block(document_type, size)
+                if reserved is None:
+                    cls._create_series(document_type)
+                    reserved = cls._reserve_block(document_type, size)
+                    if reserved is None:
+                        raise RuntimeError(f"Could not reserve document numbers for {document_type}")
+                first, end, prefix, year_suffix = reserved
+                block = cls._blocks[document_type] = {
+                    'next': first, 'end': end, 'prefix': prefix, 'year_suffix': year_suffix
+                }
+
+            number = block['next']
+            block['next'] += 1
+            return number, block['prefix'], block['year_suffix']
+
     @classmethod
     def get_next_number(cls, document_type):
         """Generate next document number for given document type"""
-        series = cls.query.filter_by(document_type=document_type).first()
-        
-        if not series:
-            # Create default series if not exists
-            prefixes = {
-                'GRPO': 'GRPO-',
-                'TRANSFER': 'TR-',
-                'PICKLIST': 'PL-'
-            }
-            series = cls(
-                document_type=document_type,
-                prefix=prefixes.get(document_type, 'DOC-'),
-                current_number=1
-            )
-            db.session.add(series)
-        
-        # Generate document number
-        year_suffix = datetime.now().strftime('%Y') if series.year_suffix else ''
-        doc_number = f"{series.prefix}{series.current_number:04d}{'-' + year_suffix if year_suffix else ''}"
-        
-        # Increment counter
-        series.current_number += 1
-        series.updated_at = datetime.utcnow()
-        db.session.commit()
-        
-        return doc_number
+        number, prefix, year_suffix = cls.allocate(document_type)
+        year = datetime.now().strftime('%Y') if year_suffix else ''
+        return f"{prefix}{number:04d}{'-' + year if year else ''}"
 
 # ================================
 # Serial Number Transfer Models
@@ -690,7 +1260,7 @@ class SerialNumberTransfer(db.Model):
     to_warehouse = db.Column(db.String(10), nullable=False)
     priority = db.Column(db.String(10), default='normal')  # low, normal, high, urgent
     notes = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
@@ -758,7 +1328,7 @@ class SerialItemTransfer(db.Model):
     to_warehouse = db.Column(db.String(10), nullable=False)
     priority = db.Column(db.String(10), default='normal')  # low, normal, high, urgent
     notes = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
@@ -810,7 +1380,7 @@ class DirectInventoryTransfer(db.Model):
     from_bin = db.Column(db.String(50))
     to_bin = db.Column(db.String(50))
     notes = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
@@ -2,12 +2,16 @@
 GRPO (Goods Receipt PO) Routes
 All routes related to goods receipt against purchase orders
 """
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context
 from flask_login import login_required, current_user
 from app import db
 from modules.grpo.models import GRPODocument, GRPOItem, GRPOSerialNumber, GRPOBatchNumber, GRPONonManagedItem
+from modules.grpo.services import (BulkIngestError, read_rows, read_upload, validate_serial_rows,
+                                   validate_batch_rows, build_serial_mappings, build_batch_mappings,
+                                   serial_bags_error, batch_bags_error, insert_all, insert_in_chunks)
 from models import User
 from sap_integration import SAPIntegration
+from wms_metrics import record_label_render
 import logging
 from datetime import datetime
 import qrcode
@@ -298,6 +302,11 @@ def add_grpo_item(grpo_id):
         expiry_date = request.form.get('expiry_date')
         serial_numbers_json = request.form.get('serial_numbers_json', '')
         batch_numbers_json = request.form.get('batch_numbers_json', '')
+        # CSV/NDJSON uploads - an alternative to the JSON fields for large receipts
+        serial_numbers_file = request.files.get('serial_numbers_file')
+        batch_numbers_file = request.files.get('batch_numbers_file')
+        has_serial_input = bool(serial_numbers_json) or bool(serial_numbers_file and serial_numbers_file.filename)
+        has_batch_input = bool(batch_numbers_json) or bool(batch_numbers_file and batch_numbers_file.filename)
         
         # Safely parse number_of_bags with validation
         try:
@@ -335,11 +344,11 @@ def add_grpo_item(grpo_id):
         logging.info(f"🔍 Item {item_code} validation: Batch={is_batch_managed}, Serial={is_serial_managed}")
         
         # **VALIDATION: Enforce serial/batch data for managed items**
-        if is_serial_managed and not serial_numbers_json:
+        if is_serial_managed and not has_serial_input:
             flash(f'Item {item_code} is serial managed - serial numbers are required', 'error')
             return redirect(url_for('grpo.detail', grpo_id=grpo_id))
         
-        if is_batch_managed and not batch_numbers_json:
+        if is_batch_managed and not has_batch_input:
             flash(f'Item {item_code} is batch managed - batch numbers are required', 'error')
             return redirect(url_for('grpo.detail', grpo_id=grpo_id))
         
@@ -364,67 +373,53 @@ def add_grpo_item(grpo_id):
             bin_location=bin_location,
             batch_number=batch_number,
             expiry_date=expiry_date_obj,
-            qc_status='pending'
+            qc_status='pending',
+            batch_required='Y' if is_batch_managed else 'N',
+            serial_required='Y' if is_serial_managed else 'N',
+            manage_method=validation_result.get('manage_method', 'N')
         )
         
         db.session.add(grpo_item)
         db.session.flush()
         
         # **SERIAL NUMBER HANDLING**
-        if is_serial_managed and serial_numbers_json:
+        if is_serial_managed and has_serial_input:
             try:
-                serial_numbers = json.loads(serial_numbers_json)
+                if serial_numbers_file and serial_numbers_file.filename:
+                    serial_rows = read_upload(serial_numbers_file)
+                else:
+                    serial_rows = read_rows(serial_numbers_json, 'ndjson')
                 
                 # Validate quantity matches serial entries
-                if len(serial_numbers) != int(quantity):
-                    flash(f'Serial managed item requires {int(quantity)} serial numbers, but {len(serial_numbers)} provided', 'error')
+                if len(serial_rows) != int(quantity):
+                    flash(f'Serial managed item requires {int(quantity)} serial numbers, but {len(serial_rows)} provided', 'error')
                     db.session.rollback()
                     return redirect(url_for('grpo.detail', grpo_id=grpo_id))
                 
                 # Calculate qty per pack based on number of serials per bag
                 # For serials, we distribute the serials across bags, so qty_per_pack is serials per bag
-                total_serials = len(serial_numbers)
+                total_serials = len(serial_rows)
                 
-                # Validate that number_of_bags doesn't exceed total serials
-                if number_of_bags > total_serials:
-                    flash(f'Number of bags ({number_of_bags}) cannot exceed number of serial items ({total_serials})', 'error')
+                # Bags must not outnumber the serials and must all hold the same integer count
+                bags_error = serial_bags_error(total_serials, number_of_bags)
+                if bags_error:
+                    flash(bags_error, 'error')
                     db.session.rollback()
                     return redirect(url_for('grpo.detail', grpo_id=grpo_id))
                 
-                # Validate that serials can be evenly divided into bags (integer pack sizes only)
-                if total_serials % number_of_bags != 0:
-                    flash(f'Number of serials ({total_serials}) must be evenly divisible by number of bags ({number_of_bags}). Each bag must contain the same integer number of serials.', 'error')
+                serial_rows, row_errors = validate_serial_rows(serial_rows)
+                if row_errors:
+                    flash(_format_row_errors('serial', row_errors), 'error')
                     db.session.rollback()
                     return redirect(url_for('grpo.detail', grpo_id=grpo_id))
                 
-                qty_per_pack = total_serials / number_of_bags
-                no_of_packs = number_of_bags
+                # Create serial number records (GRN numbers follow generate_unique_grn_number)
+                insert_all(GRPOSerialNumber, build_serial_mappings(grpo_item, serial_rows, number_of_bags))
                 
-                # Create serial number records with automatic barcode generation
-                for idx, serial_data in enumerate(serial_numbers):
-                    # Generate unique GRN number for this serial
-                    grn_number = generate_unique_grn_number(grpo, idx + 1)
-                    
-                    serial = GRPOSerialNumber(
-                        grpo_item_id=grpo_item.id,
-                        manufacturer_serial_number=serial_data.get('manufacturer_serial_number', ''),
-                        internal_serial_number=serial_data.get('internal_serial_number'),
-                        expiry_date=datetime.strptime(serial_data['expiry_date'], '%Y-%m-%d').date() if serial_data.get('expiry_date') else None,
-                        manufacture_date=datetime.strptime(serial_data['manufacture_date'], '%Y-%m-%d').date() if serial_data.get('manufacture_date') else None,
-                        notes=serial_data.get('notes', ''),
-                        quantity=1.0,
-                        base_line_number=idx,
-                        grn_number=grn_number,
-                        qty_per_pack=qty_per_pack,
-                        no_of_packs=no_of_packs
-                    )
-                    db.session.add(serial)
-                    logging.info(f"✅ Created serial {serial_data.get('internal_serial_number')} with GRN {grn_number}")
+                logging.info(f"✅ Added {total_serials} serial numbers for item {item_code} (Qty per pack: {total_serials / number_of_bags}, No of packs: {number_of_bags})")
                 
-                logging.info(f"✅ Added {len(serial_numbers)} serial numbers for item {item_code} (Qty per pack: {qty_per_pack}, No of packs: {no_of_packs})")
-                
-            except json.JSONDecodeError:
-                flash('Invalid serial numbers data format', 'error')
+            except BulkIngestError as e:
+                flash(f'Invalid serial numbers data format: {str(e)}', 'error')
                 db.session.rollback()
                 return redirect(url_for('grpo.detail', grpo_id=grpo_id))
             except Exception as e:
@@ -433,55 +428,40 @@ def add_grpo_item(grpo_id):
                 return redirect(url_for('grpo.detail', grpo_id=grpo_id))
         
         # **BATCH NUMBER HANDLING**
-        if is_batch_managed and batch_numbers_json:
+        if is_batch_managed and has_batch_input:
             try:
-                batch_numbers = json.loads(batch_numbers_json)
+                if batch_numbers_file and batch_numbers_file.filename:
+                    batch_rows = read_upload(batch_numbers_file)
+                else:
+                    batch_rows = read_rows(batch_numbers_json, 'ndjson')
+                
+                batch_rows, row_errors = validate_batch_rows(batch_rows)
+                if row_errors:
+                    flash(_format_row_errors('batch', row_errors), 'error')
+                    db.session.rollback()
+                    return redirect(url_for('grpo.detail', grpo_id=grpo_id))
                 
                 # Validate total batch quantity matches item quantity
-                total_batch_qty = sum(float(b.get('quantity', 0)) for b in batch_numbers)
+                total_batch_qty = sum(b['quantity'] for b in batch_rows)
                 if abs(total_batch_qty - quantity) > 0.001:
                     flash(f'Total batch quantity ({total_batch_qty}) must equal item quantity ({quantity})', 'error')
                     db.session.rollback()
                     return redirect(url_for('grpo.detail', grpo_id=grpo_id))
                 
-                # Create batch number records with automatic barcode generation
-                for idx, batch_data in enumerate(batch_numbers):
-                    batch_qty = float(batch_data.get('quantity', 0))
-                    
-                    # Validate that batch quantity can be evenly divided into bags
-                    if batch_qty % number_of_bags != 0:
-                        flash(f'Batch quantity ({batch_qty}) for batch {batch_data.get("batch_number")} must be evenly divisible by number of bags ({number_of_bags}). Each bag must contain the same integer quantity.', 'error')
-                        db.session.rollback()
-                        return redirect(url_for('grpo.detail', grpo_id=grpo_id))
-                    
-                    # Calculate qty per pack for this batch
-                    qty_per_pack = batch_qty / number_of_bags if number_of_bags > 0 else batch_qty
-                    no_of_packs = number_of_bags
-                    
-                    logging.info(f"📦 Batch {batch_data.get('batch_number')}: Quantity={batch_qty}, Number of bags={number_of_bags}, Qty per pack={qty_per_pack}, No of packs={no_of_packs}")
-                    
-                    # Generate unique GRN number for this batch
-                    grn_number = generate_unique_grn_number(grpo, idx + 1)
-                    
-                    batch = GRPOBatchNumber(
-                        grpo_item_id=grpo_item.id,
-                        batch_number=batch_data.get('batch_number'),
-                        quantity=batch_qty,
-                        manufacturer_serial_number=batch_data.get('manufacturer_serial_number', ''),
-                        internal_serial_number=batch_data.get('internal_serial_number', ''),
-                        expiry_date=datetime.strptime(batch_data['expiry_date'], '%Y-%m-%d').date() if batch_data.get('expiry_date') else None,
-                        base_line_number=idx,
-                        grn_number=grn_number,
-                        qty_per_pack=qty_per_pack,
-                        no_of_packs=no_of_packs
-                    )
-                    db.session.add(batch)
-                    logging.info(f"✅ Created batch {batch_data.get('batch_number')} with GRN {grn_number} (Qty={batch_qty}, Qty per pack={qty_per_pack}, No of packs={no_of_packs})")
+                # Validate that each batch quantity can be evenly divided into bags
+                bags_error = batch_bags_error(batch_rows, number_of_bags)
+                if bags_error:
+                    flash(bags_error, 'error')
+                    db.session.rollback()
+                    return redirect(url_for('grpo.detail', grpo_id=grpo_id))
                 
-                logging.info(f"✅ Added {len(batch_numbers)} batch numbers for item {item_code}")
+                # Create batch number records (GRN numbers follow generate_unique_grn_number)
+                insert_all(GRPOBatchNumber, build_batch_mappings(grpo_item, batch_rows, number_of_bags))
                 
-            except json.JSONDecodeError:
-                flash('Invalid batch numbers data format', 'error')
+                logging.info(f"✅ Added {len(batch_rows)} batch numbers for item {item_code} (No of packs: {number_of_bags})")
+                
+            except BulkIngestError as e:
+                flash(f'Invalid batch numbers data format: {str(e)}', 'error')
                 db.session.rollback()
                 return redirect(url_for('grpo.detail', grpo_id=grpo_id))
             except Exception as e:
@@ -508,6 +488,9 @@ def add_grpo_item(grpo_id):
                 except (json.JSONDecodeError, TypeError):
                     pass
             
+            has_serial_data = has_serial_data or bool(serial_numbers_file and serial_numbers_file.filename)
+            has_batch_data = has_batch_data or bool(batch_numbers_file and batch_numbers_file.filename)
+            
             if has_serial_data or has_batch_data:
                 logging.error(f"❌ CRITICAL: Attempted to create non-managed items for {item_code} but serial/batch data was provided! is_batch_managed={is_batch_managed}, is_serial_managed={is_serial_managed}, has_serial_data={has_serial_data}, has_batch_data={has_batch_data}")
                 flash(f'Data inconsistency: Item {item_code} has batch/serial data but SAP validation indicates it is not managed. Please check SAP item master data.', 'error')
@@ -541,12 +524,12 @@ def add_grpo_item(grpo_id):
                 flash(f'Error processing non-managed item: {str(e)}', 'error')
                 db.session.rollback()
                 return redirect(url_for('grpo.detail', grpo_id=grpo_id))
-        elif is_batch_managed and not batch_numbers_json:
+        elif is_batch_managed and not has_batch_input:
             logging.error(f"❌ Batch-managed item {item_code} added without batch data")
             flash(f'Item {item_code} is batch managed but no batch numbers were provided', 'error')
             db.session.rollback()
             return redirect(url_for('grpo.detail', grpo_id=grpo_id))
-        elif is_serial_managed and not serial_numbers_json:
+        elif is_serial_managed and not has_serial_input:
             logging.error(f"❌ Serial-managed item {item_code} added without serial data")
             flash(f'Item {item_code} is serial managed but no serial numbers were provided', 'error')
             db.session.rollback()
@@ -810,6 +793,127 @@ def generate_unique_grn_number(grpo_document, sequence_number):
     seq = str(sequence_number).zfill(4)
     return f"GRN/{year_suffix}/{base_id}{seq}"
 
+def _format_row_errors(kind, row_errors, limit=5):
+    """One flash message for the first few row-level validation errors"""
+    shown = '; '.join(f"row {e['row']}: {e['error']}" for e in row_errors[:limit])
+    more = f' (and {len(row_errors) - limit} more)' if len(row_errors) > limit else ''
+    return f'{len(row_errors)} invalid {kind} rows - {shown}{more}'
+
+@grpo_bp.route('/items/<int:item_id>/bulk-numbers', methods=['POST'])
+@login_required
+def bulk_add_numbers(item_id):
+    """Append serial or batch numbers to a draft GRPO item from a CSV or NDJSON upload
+
+    Send the file as multipart field 'file' or as the raw request body
+    (text/csv or application/x-ndjson). Query/form parameters:
+        number_of_bags - packs per serial set / batch (default: as already received, else 1)
+        stream=1       - respond with NDJSON progress lines while inserting
+    """
+    item = GRPOItem.query.get_or_404(item_id)
+    grpo = item.grpo_document
+    
+    if grpo.user_id != current_user.id and current_user.role not in ['admin', 'manager']:
+        return jsonify({'success': False, 'error': 'Access denied'}), 403
+    if grpo.status != 'draft':
+        return jsonify({'success': False, 'error': 'Cannot add numbers to non-draft GRPO'}), 400
+    
+    is_serial = item.serial_required == 'Y' or bool(item.serial_numbers)
+    is_batch = item.batch_required == 'Y' or bool(item.batch_numbers)
+    if not is_serial and not is_batch:
+        validation = SAPIntegration().validate_item_code(item.item_code)
+        is_serial = validation.get('serial_required', False)
+        is_batch = validation.get('batch_required', False)
+    if not is_serial and not is_batch:
+        return jsonify({'success': False, 'error': f'Item {item.item_code} is neither serial nor batch managed'}), 400
+    
+    # Appended rows are packed like the rows already received, so their labels agree
+    existing_rows = item.serial_numbers if is_serial else item.batch_numbers
+    existing_bags = existing_rows[0].no_of_packs if existing_rows and existing_rows[0].no_of_packs else None
+    try:
+        number_of_bags = max(1, int(request.values.get('number_of_bags') or existing_bags or 1))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'number_of_bags must be a whole number'}), 400
+    if existing_bags and number_of_bags != existing_bags:
+        return jsonify({'success': False, 'error': f'number_of_bags must be {existing_bags}, as for the '
+                                                   f'{len(existing_rows)} numbers already received'}), 400
+    
+    try:
+        upload = request.files.get('file')
+        rows = read_upload(upload) if upload else read_upload(raw=request.get_data(), content_type=request.content_type)
+    except BulkIngestError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    if not rows:
+        return jsonify({'success': False, 'error': 'Upload contains no rows'}), 400
+    
+    existing_count = len(existing_rows)
+    if is_serial:
+        model = GRPOSerialNumber
+        # The item's quantity is what add_grpo_item requires the full serial set to match
+        item_quantity = int(item.quantity)
+        if existing_count + len(rows) > item_quantity:
+            return jsonify({'success': False, 'error': f'Item quantity is {item_quantity}: {existing_count} serials already '
+                                                       f'received, {len(rows)} more would exceed it'}), 400
+        bags_error = serial_bags_error(item_quantity, number_of_bags)
+        if bags_error:
+            return jsonify({'success': False, 'error': bags_error}), 400
+        rows, row_errors = validate_serial_rows(rows)
+    else:
+        model = GRPOBatchNumber
+        rows, row_errors = validate_batch_rows(rows)
+    
+    if row_errors:
+        return jsonify({'success': False, 'error': f'{len(row_errors)} invalid rows',
+                        'errors': row_errors[:100], 'error_count': len(row_errors)}), 400
+    
+    if not is_serial:
+        received = sum(float(batch.quantity or 0) for batch in existing_rows)
+        uploaded = sum(row['quantity'] for row in rows)
+        if received + uploaded - float(item.quantity) > 0.001:
+            return jsonify({'success': False, 'error': f'Item quantity is {float(item.quantity)}: {received} already received '
+                                                       f'in batches, {uploaded} more would exceed it'}), 400
+        bags_error = batch_bags_error(rows, number_of_bags)
+        if bags_error:
+            return jsonify({'success': False, 'error': bags_error}), 400
+    
+    if is_serial:
+        mappings = build_serial_mappings(item, rows, number_of_bags, start_line=existing_count, total=item_quantity)
+    else:
+        mappings = build_batch_mappings(item, rows, number_of_bags, start_line=existing_count)
+    kind = 'serial' if is_serial else 'batch'
+    
+    def summary():
+        return {'success': True, 'kind': kind, 'inserted': len(mappings),
+                'total_for_item': existing_count + len(mappings)}
+    
+    if request.values.get('stream') not in ('1', 'true', 'yes'):
+        try:
+            insert_all(model, mappings)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"❌ Bulk {kind} upload for GRPO item {item_id} failed: {str(e)}")
+            return jsonify({'success': False, 'error': str(e)}), 500
+        logging.info(f"✅ Bulk added {len(mappings)} {kind} numbers to GRPO item {item_id}")
+        return jsonify(summary())
+    
+    def generate():
+        total = len(mappings)
+        yield json.dumps({'stage': 'validated', 'total': total}) + '\n'
+        try:
+            for done in insert_in_chunks(model, mappings):
+                yield json.dumps({'stage': 'inserting', 'done': done, 'total': total}) + '\n'
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"❌ Bulk {kind} upload for GRPO item {item_id} failed: {str(e)}")
+            yield json.dumps({'stage': 'failed', 'success': False, 'error': str(e)}) + '\n'
+            return
+        logging.info(f"✅ Bulk added {total} {kind} numbers to GRPO item {item_id}")
+        yield json.dumps(dict(summary(), stage='done')) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'X-Accel-Buffering': 'no', 'Cache-Control': 'no-cache'})
+
 @grpo_bp.route('/items/<int:item_id>/serial-numbers', methods=['GET', 'POST'])
 @login_required
 def manage_serial_numbers(item_id):
@@ -1326,6 +1430,7 @@ def generate_barcode_labels_api():
                 }
                 labels.append(label)
         
+        record_label_render('grpo', len(labels))
         return jsonify({
             'success': True,
             'labels': labels,
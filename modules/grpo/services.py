@@ -0,0 +1,301 @@
+"""
+GRPO Bulk Serial/Batch Ingestion
+Parses CSV or NDJSON uploads of serial and batch numbers, validates them in a
+few whole-list passes (required fields, dates, duplicates in the file,
+serials already received) and inserts them with bulk_insert_mappings in chunks.
+
+Environment:
+    GRPO_BULK_CHUNK_SIZE  - rows per bulk insert (default 1000)
+    GRPO_BULK_MAX_ROWS    - largest accepted upload (default 50000)
+"""
+
+import io
+import os
+import csv
+import json
+import logging
+from collections import Counter
+from datetime import datetime
+from functools import lru_cache
+
+from app import db
+from db_dual_support import captures, capture_keys
+from modules.grpo.models import GRPOSerialNumber, GRPOBatchNumber
+
+
+def _env_int(name, default):
+    try:
+        return max(1, int(os.environ.get(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+CHUNK_SIZE = _env_int('GRPO_BULK_CHUNK_SIZE', 1000)
+MAX_ROWS = _env_int('GRPO_BULK_MAX_ROWS', 50000)
+MAX_REPORTED_ERRORS = 100
+
+SERIAL_FIELDS = ('internal_serial_number', 'manufacturer_serial_number', 'expiry_date', 'manufacture_date', 'notes')
+BATCH_FIELDS = ('batch_number', 'quantity', 'manufacturer_serial_number', 'internal_serial_number', 'expiry_date')
+
+# Column names scanners/spreadsheets commonly use for the same fields
+_ALIASES = {
+    'serial_number': 'internal_serial_number',
+    'serial': 'internal_serial_number',
+    'internalserialnumber': 'internal_serial_number',
+    'manufacturerserialnumber': 'manufacturer_serial_number',
+    'batch': 'batch_number',
+    'batchnumber': 'batch_number',
+    'qty': 'quantity',
+    'expirydate': 'expiry_date',
+    'manufacturedate': 'manufacture_date',
+}
+
+
+class BulkIngestError(Exception):
+    """Upload could not be read at all (bad format, too many rows)"""
+
+
+def _normalise_key(key):
+    key = (key or '').strip().lower().replace(' ', '_')
+    return _ALIASES.get(key, _ALIASES.get(key.replace('_', ''), key))
+
+
+def detect_format(filename='', content_type='', head=''):
+    """'csv' or 'ndjson' from the file name, the content type or the first character"""
+    name = (filename or '').lower()
+    content_type = (content_type or '').lower()
+    if name.endswith(('.ndjson', '.jsonl', '.json')) or 'json' in content_type:
+        return 'ndjson'
+    if name.endswith(('.csv', '.txt')) or 'csv' in content_type:
+        return 'csv'
+    return 'ndjson' if head.lstrip()[:1] in ('{', '[') else 'csv'
+
+
+def read_rows(text, fmt):
+    """Rows of the upload as dicts with normalised keys
+
+    NDJSON is one object per line; a plain JSON array (the format of the
+    add-item form's serial_numbers_json) is accepted too.
+    """
+    if fmt == 'ndjson':
+        stripped = text.lstrip()
+        if stripped.startswith('['):
+            try:
+                records = json.loads(stripped)
+            except json.JSONDecodeError as e:
+                raise BulkIngestError(f'Invalid JSON array: {e}')
+        else:
+            records = []
+            for line_no, line in enumerate(text.splitlines(), start=1):
+                if not line.strip():
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError as e:
+                    raise BulkIngestError(f'Invalid JSON on line {line_no}: {e}')
+    else:
+        records = list(csv.DictReader(io.StringIO(text)))
+
+    if len(records) > MAX_ROWS:
+        raise BulkIngestError(f'Upload has {len(records)} rows - the limit is {MAX_ROWS}')
+
+    rows = []
+    for record in records:
+        if not isinstance(record, dict):
+            raise BulkIngestError('Each row must be an object with named fields')
+        rows.append({_normalise_key(k): (v.strip() if isinstance(v, str) else v) for k, v in record.items()})
+    return rows
+
+
+def read_upload(file_storage=None, raw=None, content_type=''):
+    """Rows from an uploaded file (werkzeug FileStorage) or a raw request body"""
+    if file_storage is not None:
+        data = file_storage.read()
+        filename = file_storage.filename
+        content_type = file_storage.content_type or content_type
+    else:
+        data = raw or b''
+        filename = ''
+    try:
+        text = data.decode('utf-8-sig') if isinstance(data, bytes) else data
+    except UnicodeDecodeError:
+        raise BulkIngestError('Upload must be UTF-8 text')
+    return read_rows(text, detect_format(filename, content_type, text[:64]))
+
+
+@lru_cache(maxsize=4096)
+def _parse_date(value):
+    """YYYY-MM-DD -> date; receipts repeat the same few dates, so parse each once"""
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def _check_dates(rows, fields, errors):
+    for field in fields:
+        for idx, row in enumerate(rows):
+            value = row.get(field)
+            if not value:
+                row[field] = None
+                continue
+            try:
+                row[field] = _parse_date(str(value))
+            except ValueError:
+                errors.append({'row': idx + 1, 'error': f'{field} must be YYYY-MM-DD, got {value!r}'})
+
+
+def existing_serials(serials):
+    """Subset of serials that are already stored on any GRPO item"""
+    found = set()
+    serials = list(serials)
+    for start in range(0, len(serials), CHUNK_SIZE):
+        chunk = serials[start:start + CHUNK_SIZE]
+        found.update(value for (value,) in db.session.query(GRPOSerialNumber.internal_serial_number)
+                     .filter(GRPOSerialNumber.internal_serial_number.in_(chunk)).all())
+    return found
+
+
+def validate_serial_rows(rows):
+    """Validate serial rows as whole-list passes; returns (rows, errors)"""
+    errors = []
+    rows = [{field: row.get(field) for field in SERIAL_FIELDS} for row in rows]
+
+    for idx, row in enumerate(rows):
+        row['internal_serial_number'] = str(row['internal_serial_number'] or '').strip()
+        if not row['internal_serial_number']:
+            errors.append({'row': idx + 1, 'error': 'internal_serial_number is required'})
+
+    counts = Counter(row['internal_serial_number'] for row in rows if row['internal_serial_number'])
+    duplicates = {serial for serial, count in counts.items() if count > 1}
+    if duplicates:
+        for idx, row in enumerate(rows):
+            if row['internal_serial_number'] in duplicates:
+                errors.append({'row': idx + 1, 'error': f"serial {row['internal_serial_number']} appears more than once"})
+
+    taken = existing_serials(counts.keys())
+    if taken:
+        for idx, row in enumerate(rows):
+            if row['internal_serial_number'] in taken:
+                errors.append({'row': idx + 1, 'error': f"serial {row['internal_serial_number']} already exists"})
+
+    _check_dates(rows, ('expiry_date', 'manufacture_date'), errors)
+    errors.sort(key=lambda e: e['row'])
+    return rows, errors
+
+
+def validate_batch_rows(rows):
+    """Validate batch rows as whole-list passes; returns (rows, errors)"""
+    errors = []
+    rows = [{field: row.get(field) for field in BATCH_FIELDS} for row in rows]
+
+    for idx, row in enumerate(rows):
+        row['batch_number'] = str(row['batch_number'] or '').strip()
+        if not row['batch_number']:
+            errors.append({'row': idx + 1, 'error': 'batch_number is required'})
+        try:
+            row['quantity'] = float(row['quantity'])
+            if row['quantity'] <= 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            errors.append({'row': idx + 1, 'error': f"quantity must be a positive number, got {row['quantity']!r}"})
+            row['quantity'] = 0.0
+
+    _check_dates(rows, ('expiry_date',), errors)
+    errors.sort(key=lambda e: e['row'])
+    return rows, errors
+
+
+def grn_prefix(grpo_document):
+    """Fixed part of generate_unique_grn_number for this document"""
+    return f"GRN/{grpo_document.created_at.strftime('%y')}/{str(grpo_document.id).zfill(8)}"
+
+
+def serial_bags_error(total_serials, number_of_bags):
+    """Why total_serials cannot be packed into number_of_bags equal bags, or None"""
+    if number_of_bags > total_serials:
+        return f'Number of bags ({number_of_bags}) cannot exceed number of serial items ({total_serials})'
+    if total_serials % number_of_bags != 0:
+        return (f'Number of serials ({total_serials}) must be evenly divisible by number of bags ({number_of_bags}). '
+                f'Each bag must contain the same integer number of serials.')
+    return None
+
+
+def batch_bags_error(rows, number_of_bags):
+    """Why a batch of rows cannot be split into number_of_bags equal bags, or None"""
+    for row in rows:
+        if row['quantity'] % number_of_bags != 0:
+            return (f'Batch quantity ({row["quantity"]}) for batch {row["batch_number"]} must be evenly divisible '
+                    f'by number of bags ({number_of_bags}). Each bag must contain the same integer quantity.')
+    return None
+
+
+def build_serial_mappings(grpo_item, rows, number_of_bags, start_line=0, total=None):
+    """Serial rows for bulk insert; qty_per_pack is total / number_of_bags, where total is
+    the item's full serial count (defaults to the rows so far plus these)"""
+    grpo = grpo_item.grpo_document
+    prefix = grn_prefix(grpo)
+    total = total or start_line + len(rows)
+    qty_per_pack = total / number_of_bags if number_of_bags else total
+    now = datetime.utcnow()
+    return [{
+        'grpo_item_id': grpo_item.id,
+        'internal_serial_number': row['internal_serial_number'],
+        'manufacturer_serial_number': row['manufacturer_serial_number'] or '',
+        'expiry_date': row['expiry_date'],
+        'manufacture_date': row['manufacture_date'],
+        'notes': row['notes'] or '',
+        'quantity': 1,
+        'base_line_number': line,
+        'grn_number': f"{prefix}{str(line + 1).zfill(4)}",
+        'qty_per_pack': qty_per_pack,
+        'no_of_packs': number_of_bags,
+        'created_at': now,
+    } for line, row in enumerate(rows, start=start_line)]
+
+
+def build_batch_mappings(grpo_item, rows, number_of_bags, start_line=0):
+    grpo = grpo_item.grpo_document
+    prefix = grn_prefix(grpo)
+    now = datetime.utcnow()
+    return [{
+        'grpo_item_id': grpo_item.id,
+        'batch_number': row['batch_number'],
+        'quantity': row['quantity'],
+        'manufacturer_serial_number': row['manufacturer_serial_number'] or '',
+        'internal_serial_number': row['internal_serial_number'] or '',
+        'expiry_date': row['expiry_date'],
+        'base_line_number': line,
+        'grn_number': f"{prefix}{str(line + 1).zfill(4)}",
+        'qty_per_pack': row['quantity'] / number_of_bags if number_of_bags else row['quantity'],
+        'no_of_packs': number_of_bags,
+        'created_at': now,
+    } for line, row in enumerate(rows, start=start_line)]
+
+
+def insert_in_chunks(model, mappings, chunk_size=None):
+    """bulk_insert_mappings in chunks, flushing each; yields the running row count
+
+    The caller owns the transaction - nothing is committed here.
+    """
+    chunk_size = chunk_size or CHUNK_SIZE
+    # Bulk mappings bypass the outbox flush listener, so replicated tables
+    # fetch the new ids and queue the rows explicitly
+    replicate = captures(model.__tablename__)
+    done = 0
+    for start in range(0, len(mappings), chunk_size):
+        chunk = mappings[start:start + chunk_size]
+        db.session.bulk_insert_mappings(model, chunk, return_defaults=replicate)
+        db.session.flush()
+        if replicate:
+            capture_keys(db.session.connection(), model.__table__, [row['id'] for row in chunk])
+        done += len(chunk)
+        yield done
+    if not mappings:
+        yield 0
+
+
+def insert_all(model, mappings, chunk_size=None):
+    """insert_in_chunks without progress; returns the number of rows inserted"""
+    done = 0
+    for done in insert_in_chunks(model, mappings, chunk_size):
+        pass
+    logging.info(f"📥 Bulk inserted {done} {model.__tablename__} rows")
+    return done
@@ -5,12 +5,13 @@ All routes related to inventory transfers between warehouses/bins
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
 from app import db
-from models import InventoryTransfer, InventoryTransferItem, User, SerialNumberTransfer, SerialNumberTransferItem, SerialNumberTransferSerial
+from models import InventoryTransfer, InventoryTransferItem, User, SerialNumberTransfer, SerialNumberTransferItem, SerialNumberTransferSerial, \
+    DocumentNumberSeries
 from sqlalchemy import or_
+from wms_metrics import record_label_render
+import fanout
 import logging
-import random
 import re
-import string
 from datetime import datetime
 
 transfer_bp = Blueprint('inventory_transfer', __name__, 
@@ -19,16 +20,10 @@ transfer_bp = Blueprint('inventory_transfer', __name__,
 
 def generate_transfer_number():
     """Generate unique transfer number for serial transfers"""
-    while True:
-        # Generate format: ST-YYYYMMDD-XXXX (e.g., ST-20250822-A1B2)
-        date_part = datetime.now().strftime('%Y%m%d')
-        random_part = ''.join(random.choices(string.ascii_uppercase + string.digits, k=4))
-        transfer_number = f'ST-{date_part}-{random_part}'
-        
-        # Check if it already exists
-        existing = SerialNumberTransfer.query.filter_by(transfer_number=transfer_number).first()
-        if not existing:
-            return transfer_number
+    # Format: ST-YYYYMMDD-NNNN (e.g., ST-20250822-0042), numbered from the shared document series
+    date_part = datetime.now().strftime('%Y%m%d')
+    number, _, _ = DocumentNumberSeries.allocate('SERIAL_TRANSFER')
+    return f'ST-{date_part}-{number:04d}'
 
 @transfer_bp.route('/')
 @login_required
@@ -61,8 +56,14 @@ def detail(transfer_id):
         sap_b1 = SAPIntegration()
         
         # Always fetch SAP data to get available items (regardless of warehouse fields)
+        # The WMS quantities are read at the same time, in one grouped query
         logging.info(f"🔍 Fetching SAP data for transfer {transfer.transfer_request_number}")
-        sap_transfer_data = sap_b1.get_inventory_transfer_request(transfer.transfer_request_number)
+        transfer_id, request_number = transfer.id, transfer.transfer_request_number
+        lookups = fanout.gather(
+            sap_transfer_data=lambda: sap_b1.get_inventory_transfer_request(request_number),
+            wms_quantities=lambda: InventoryTransferItem.transfer_quantities(transfer_id, request_number))
+        sap_transfer_data = lookups['sap_transfer_data']
+        transferred_here, transferred_for_request = lookups['wms_quantities']
         
         logging.info(f"🔍 SAP response type: {type(sap_transfer_data)}")
         if sap_transfer_data:
@@ -79,19 +80,14 @@ def detail(transfer_id):
                 
                 logging.info(f"🔍 Processing line: {item_code} - Qty: {requested_qty}")
                 
-                # Calculate total transferred quantity for this item from WMS database
-                transferred_qty = 0
-                wms_item = InventoryTransferItem.query.filter_by(
-                    inventory_transfer_id=transfer.id,
-                    item_code=item_code
-                ).first()
-                
-                if wms_item:
-                    transferred_qty = float(wms_item.quantity or 0)
-                    logging.info(f"🔍 WMS item found - transferred: {transferred_qty}")
+                # Quantity of this item in this transfer, and in every WMS transfer of the request
+                transferred_qty = transferred_here.get(item_code, 0.0)
+                request_transferred_qty = transferred_for_request.get(item_code, 0.0)
+                if request_transferred_qty:
+                    logging.info(f"🔍 WMS transferred: {transferred_qty} here, {request_transferred_qty} for the request")
                 
                 # Calculate remaining quantity
-                remaining_qty = max(0, requested_qty - transferred_qty)
+                remaining_qty = max(0, requested_qty - request_transferred_qty)
                 
                 # Determine actual line status based on remaining quantity
                 actual_line_status = 'bost_Close' if remaining_qty <= 0 else 'bost_Open'
@@ -104,6 +100,7 @@ def detail(transfer_id):
                     'ItemDescription': sap_line.get('ItemDescription', ''),
                     'Quantity': requested_qty,
                     'TransferredQuantity': transferred_qty,
+                    'RequestTransferredQuantity': request_transferred_qty,
                     'RemainingQuantity': remaining_qty,
                     'UnitOfMeasure': sap_line.get('UoMCode', sap_line.get('MeasureUnit', '')),
                     'FromWarehouseCode': sap_line.get('FromWarehouseCode') or sap_transfer_data.get('FromWarehouse'),
@@ -1845,6 +1842,7 @@ def get_transfer_item_for_qr(item_id):
             }
             labels.append(label_data)
         
+        record_label_render('inventory_transfer', len(labels))
         return jsonify({
             'success': True,
             'labels': labels,
@@ -2,6 +2,8 @@
 Multiple GRN Creation Module Models
 Database models for batch GRN creation from multiple POs
 """
+import json
+from sqlalchemy.dialects import mysql
 from app import db
 from datetime import datetime
 
@@ -19,6 +21,9 @@ class MultiGRNBatch(db.Model):
     total_grns_created = db.Column(db.Integer, default=0)
     sap_session_metadata = db.Column(db.Text)
     error_log = db.Column(db.Text)
+    # JSON open POs fetched in step 2, reused by the later steps - a whole supplier's POs, beyond MySQL's 64 KB TEXT
+    po_snapshot = db.Column(db.Text().with_variant(mysql.LONGTEXT(), 'mysql'))
+    po_snapshot_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     posted_at = db.Column(db.DateTime)
     completed_at = db.Column(db.DateTime)
@@ -29,6 +34,40 @@ class MultiGRNBatch(db.Model):
     def __repr__(self):
         return f'<MultiGRNBatch {self.id} - {self.customer_name}>'
 
+    @classmethod
+    def ensure_schema(cls):
+        """Add the PO snapshot columns to tables created before they existed
+
+        On MySQL the snapshot is LONGTEXT; a column an earlier version added
+        as TEXT (64 KB) is widened.
+        """
+        from sqlalchemy import inspect
+        from models import _add_missing_columns
+        is_mysql = db.engine.dialect.name == 'mysql'
+        _add_missing_columns(cls.__tablename__, {
+            'po_snapshot': 'LONGTEXT' if is_mysql else 'TEXT',
+            'po_snapshot_at': 'TIMESTAMP NULL',
+        })
+        if is_mysql:
+            column = next(col for col in inspect(db.engine).get_columns(cls.__tablename__)
+                          if col['name'] == 'po_snapshot')
+            if not isinstance(column['type'], mysql.LONGTEXT):
+                with db.engine.begin() as conn:
+                    conn.execute(db.text(f"ALTER TABLE {cls.__tablename__} MODIFY po_snapshot LONGTEXT"))
+
+    def get_po_snapshot(self):
+        """Open POs stored for this batch as a list, or None if never fetched"""
+        if not self.po_snapshot:
+            return None
+        try:
+            return json.loads(self.po_snapshot)
+        except ValueError:
+            return None
+
+    def set_po_snapshot(self, purchase_orders, fetched_at=None):
+        self.po_snapshot = json.dumps(purchase_orders, default=str)
+        self.po_snapshot_at = fetched_at or datetime.utcnow()
+
 class MultiGRNPOLink(db.Model):
     """Links between GRN batch and selected Purchase Orders"""
     __tablename__ = 'multi_grn_po_links'
@@ -7,6 +7,7 @@ from flask_login import login_required, current_user
 from app import db
 from modules.multi_grn_creation.models import MultiGRNBatch, MultiGRNPOLink, MultiGRNLineSelection
 from modules.multi_grn_creation.services import SAPMultiGRNService
+import os
 import logging
 from datetime import datetime, date
 import json
@@ -14,6 +15,71 @@ from decimal import Decimal, InvalidOperation
 
 multi_grn_bp = Blueprint('multi_grn', __name__, url_prefix='/multi-grn')
 
+# How long the open-PO snapshot taken in step 2 is reused before SAP is asked again
+try:
+    PO_SNAPSHOT_SECONDS = int(os.environ.get('MULTI_GRN_PO_SNAPSHOT_SECONDS', 300))
+except ValueError:
+    PO_SNAPSHOT_SECONDS = 300
+
+
+def _is_fresh(fetched_at):
+    return bool(fetched_at) and (datetime.utcnow() - fetched_at).total_seconds() < PO_SNAPSHOT_SECONDS
+
+
+def _load_po_snapshot(batch, refresh=False):
+    """Step 2: the supplier's open POs, fetched once and stored on the batch"""
+    if not refresh and _is_fresh(batch.po_snapshot_at):
+        snapshot = batch.get_po_snapshot()
+        if snapshot is not None:
+            return {'success': True, 'purchase_orders': snapshot}
+
+    result = SAPMultiGRNService().fetch_open_purchase_orders_by_name(batch.customer_name)
+    if result.get('success'):
+        fetched_at = datetime.utcnow().isoformat()
+        for po in result['purchase_orders']:
+            po['SnapshotAt'] = fetched_at
+        batch.set_po_snapshot(result['purchase_orders'])
+        try:
+            db.session.commit()
+        except Exception as e:
+            # The POs were fetched; without a stored snapshot the later steps read them again
+            db.session.rollback()
+            logging.error(f"❌ Could not store the PO snapshot of batch {batch.id}: {str(e)}")
+    return result
+
+
+def _selected_purchase_orders(batch):
+    """Step 3: {DocEntry: PO} for the selected POs
+
+    Served from the step 2 snapshot; POs whose entry is older than
+    PO_SNAPSHOT_SECONDS (or missing) are re-read by DocEntry in one request.
+    """
+    snapshot = {po['DocEntry']: po for po in batch.get_po_snapshot() or []}
+    selected = [link.po_doc_entry for link in batch.po_links]
+    stale = [doc_entry for doc_entry in selected
+             if doc_entry not in snapshot
+             or not _is_fresh(datetime.fromisoformat(snapshot[doc_entry]['SnapshotAt'])
+                              if snapshot[doc_entry].get('SnapshotAt') else None)]
+    if not stale:
+        return snapshot
+
+    result = SAPMultiGRNService().fetch_purchase_orders_by_doc_entries(stale)
+    if not result.get('success'):
+        logging.warning(f"⚠️ Could not refresh POs {stale} for batch {batch.id}, using the stored snapshot: {result.get('error')}")
+        return snapshot
+
+    fetched_at = datetime.utcnow().isoformat()
+    refreshed = {po['DocEntry']: dict(po, SnapshotAt=fetched_at) for po in result['purchase_orders']}
+    for doc_entry in stale:
+        # A PO missing from the reply has been closed since step 2
+        if doc_entry in refreshed:
+            snapshot[doc_entry] = refreshed[doc_entry]
+        else:
+            snapshot.pop(doc_entry, None)
+    batch.set_po_snapshot(list(snapshot.values()), fetched_at=batch.po_snapshot_at)
+    db.session.commit()
+    return snapshot
+
 @multi_grn_bp.route('/')
 @login_required
 def index():
@@ -98,10 +164,9 @@ def create_step2_select_pos(batch_id):
         flash(f'Selected {len(selected_pos)} Purchase Orders', 'success')
         return redirect(url_for('multi_grn.create_step3_select_lines', batch_id=batch_id))
     
-    sap_service = SAPMultiGRNService()
-    result = sap_service.fetch_open_purchase_orders_by_name(batch.customer_name)
+    result = _load_po_snapshot(batch, refresh=request.args.get('refresh') == '1')
     
-    if not result['success']:
+    if not result.get('success'):
         flash(f"Error fetching Purchase Orders: {result.get('error')}", 'error')
         return redirect(url_for('multi_grn.index'))
     
@@ -150,20 +215,10 @@ def create_step3_select_lines(batch_id):
         flash('Line items selected successfully', 'success')
         return redirect(url_for('multi_grn.create_step4_review', batch_id=batch_id))
     
-    sap_service = SAPMultiGRNService()
-    po_details = []
-    
-    for po_link in batch.po_links:
-        result = sap_service.fetch_open_purchase_orders_by_name(batch.customer_name)
-        logging.info(f"📊 Step 3 - Fetched PO details for {batch.customer_name}: {result.get('success')}")
-        if result['success']:
-            for po in result['purchase_orders']:
-                if po['DocEntry'] == po_link.po_doc_entry:
-                    po_details.append({
-                        'po_link': po_link,
-                        'lines': po.get('OpenLines', [])
-                    })
-                    break
+    purchase_orders = _selected_purchase_orders(batch)
+    po_details = [{'po_link': po_link, 'lines': purchase_orders[po_link.po_doc_entry].get('OpenLines', [])}
+                  for po_link in batch.po_links if po_link.po_doc_entry in purchase_orders]
+    logging.info(f"📊 Step 3 - {len(po_details)} of {len(batch.po_links)} selected POs still open for batch {batch_id}")
     
     return render_template('multi_grn/step3_select_lines.html', batch=batch, po_details=po_details)
 
@@ -192,6 +247,7 @@ def create_step5_post(batch_id):
         sap_service = SAPMultiGRNService()
         results = []
         success_count = 0
+        postings = []
         
         for po_link in batch.po_links:
             if not po_link.line_selections:
@@ -239,7 +295,15 @@ def create_step5_post(batch_id):
                 'DocumentLines': document_lines
             }
             
-            result = sap_service.create_purchase_delivery_note(grn_data)
+            postings.append((po_link, grn_data))
+        
+        # One GRN per PO, posted concurrently instead of one after another
+        from sap_async import fan_out
+        outcomes = fan_out(sap_service, [('create_purchase_delivery_note', grn_data) for _, grn_data in postings])
+        
+        for (po_link, grn_data), result in zip(postings, outcomes):
+            if isinstance(result, Exception):
+                result = {'success': False, 'error': str(result)}
             
             if result['success']:
                 po_link.status = 'posted'
@@ -285,6 +349,23 @@ def view_batch(batch_id):
     
     return render_template('multi_grn/view_batch.html', batch=batch)
 
+def _search_business_partners(term, card_type=None, page=1, per_page=20):
+    """Search the local business partner index; (partners, has_more) or None when it is unavailable"""
+    from models import BusinessPartner
+    from sap_integration import ensure_business_partner_index
+
+    try:
+        ensure_business_partner_index()
+        rows, has_more = BusinessPartner.search(term, card_type=card_type, page=page, per_page=per_page)
+    except Exception as e:
+        logging.error(f"❌ Business partner index search failed: {str(e)}")
+        db.session.rollback()
+        return None
+
+    if not rows and page == 1 and not term and BusinessPartner.last_synced() is None:
+        return None  # never synced (SAP unreachable) - let the caller fall back
+    return [row.to_dict() for row in rows], has_more
+
 @multi_grn_bp.route('/api/search-customers')
 @login_required
 def api_search_customers():
@@ -294,29 +375,42 @@ def api_search_customers():
     if len(query) < 2:
         return jsonify({'customers': []})
     
-    sap_service = SAPMultiGRNService()
-    result = sap_service.fetch_business_partners('S')
-    
-    if not result['success']:
-        return jsonify({'error': result.get('error')}), 500
+    result = _search_business_partners(query, card_type=request.args.get('type', 'S'))
+    if result is None:
+        return jsonify({'error': 'Business partner index is not available'}), 500
     
-    partners = result.get('partners', [])
-    filtered = [p for p in partners if query.lower() in p['CardName'].lower() or query.lower() in p['CardCode'].lower()]
-    
-    return jsonify({'customers': filtered[:20]})
+    partners, has_more = result
+    return jsonify({'customers': partners, 'has_more': has_more})
 
 @multi_grn_bp.route('/api/customers-dropdown')
 @login_required
 def api_customers_dropdown():
-    """API endpoint to fetch all valid customers for dropdown"""
-    sap_service = SAPMultiGRNService()
-    result = sap_service.fetch_all_valid_customers()
+    """Paginated type-ahead for the customer dropdown, served from the local business partner index
+
+    Query parameters: q (search text), page (1-based), per_page (max 100)
+    """
+    query = request.args.get('q', '').strip()
+    page = max(1, request.args.get('page', 1, type=int) or 1)
+    per_page = min(max(1, request.args.get('per_page', 50, type=int) or 50), 100)
     
-    if not result['success']:
-        return jsonify({'success': False, 'error': result.get('error')}), 500
+    result = _search_business_partners(query, page=page, per_page=per_page)
+    if result is None:
+        # Index empty and SAP sync failed - fall back to the direct (or mock) lookup
+        sap_service = SAPMultiGRNService()
+        fallback = sap_service.fetch_all_valid_customers()
+        if not fallback['success']:
+            return jsonify({'success': False, 'error': fallback.get('error')}), 500
+        customers = fallback.get('customers', [])
+        if query:
+            needle = query.lower()
+            customers = [c for c in customers
+                         if needle in (c.get('CardName') or '').lower() or needle in (c.get('CardCode') or '').lower()]
+        start = (page - 1) * per_page
+        return jsonify({'success': True, 'customers': customers[start:start + per_page],
+                        'page': page, 'has_more': len(customers) > start + per_page})
     
-    customers = result.get('customers', [])
-    return jsonify({'success': True, 'customers': customers})
+    customers, has_more = result
+    return jsonify({'success': True, 'customers': customers, 'page': page, 'has_more': has_more})
 
 @multi_grn_bp.route('/api/generate-barcode', methods=['POST'])
 @login_required
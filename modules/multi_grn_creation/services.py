@@ -10,6 +10,8 @@ import os
 from flask import current_app
 import urllib.parse
 import urllib3
+from sap_instrumentation import InstrumentedSession
+from sap_circuit import breaker
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 class SAPMultiGRNService:
@@ -21,7 +23,7 @@ class SAPMultiGRNService:
         self.password = os.environ.get('SAP_B1_PASSWORD', '')
         self.company_db = os.environ.get('SAP_B1_COMPANY_DB', '')
         self.session_id = None
-        self.session = requests.Session()
+        self.session = InstrumentedSession()
         self.session.verify = False  # For development, in production use proper SSL
         self.is_offline = False
         self.enable_mock_data = os.environ.get('ENABLE_MOCK_SAP_DATA', 'false').lower() == 'true'
@@ -73,6 +75,10 @@ class SAPMultiGRNService:
     
     def ensure_logged_in(self):
         """Ensure we have a valid session, login if needed"""
+        # Fail fast while the SAP circuit is open instead of waiting on the login timeout
+        self.is_offline = breaker.is_open()
+        if self.is_offline:
+            return False
         if not self.session_id:
             return self.login()
         return True
@@ -202,18 +208,7 @@ class SAPMultiGRNService:
             response = self.session.get(url, params=params, timeout=30)
 
             if response.status_code == 200:
-                data = response.json()
-                pos = data.get('value', [])
-                open_pos = []
-                for po in pos:
-                    open_lines = [
-                        line for line in po.get('DocumentLines')
-                        if line.get('LineStatus') == 'bost_Open' and line.get('Quantity', 0) > 0
-                    ]
-                    if open_lines:
-                        po['OpenLines'] = open_lines
-                        po['TotalOpenLines'] = len(open_lines)
-                        open_pos.append(po)
+                open_pos = self._open_purchase_orders(response.json().get('value', []))
 
                 logging.info(f"✅ Fetched {len(open_pos)} open POs for CardName {card_name}")
                 return {'success': True, 'purchase_orders': open_pos}
@@ -238,6 +233,59 @@ class SAPMultiGRNService:
     
 
     
+    @staticmethod
+    def _open_purchase_orders(pos):
+        """POs that still have open lines, with OpenLines / TotalOpenLines added"""
+        open_pos = []
+        for po in pos:
+            open_lines = [
+                line for line in po.get('DocumentLines') or []
+                if line.get('LineStatus') == 'bost_Open' and line.get('Quantity', 0) > 0
+            ]
+            if open_lines:
+                po['OpenLines'] = open_lines
+                po['TotalOpenLines'] = len(open_lines)
+                open_pos.append(po)
+        return open_pos
+
+    def fetch_purchase_orders_by_doc_entries(self, doc_entries):
+        """
+        Re-read specific open Purchase Orders by DocEntry in one request
+        Used to refresh the POs selected in the Multi GRN wizard without
+        downloading the supplier's whole open-PO list again
+        """
+        doc_entries = sorted({int(doc_entry) for doc_entry in doc_entries})
+        if not doc_entries:
+            return {'success': True, 'purchase_orders': []}
+        if self.enable_mock_data or not self.ensure_logged_in():
+            return {'success': False, 'error': 'SAP B1 not available'}
+
+        try:
+            url = f"{self.base_url}/b1s/v1/PurchaseOrders"
+            doc_filter = ' or '.join(f"DocEntry eq {doc_entry}" for doc_entry in doc_entries)
+            params = {
+                '$filter': f"({doc_filter}) and DocumentStatus eq 'bost_Open'",
+                '$select': 'DocEntry,DocNum,CardCode,CardName,DocDate,DocDueDate,DocTotal,DocumentStatus,DocumentLines'
+            }
+            headers = {'Prefer': f'odata.maxpagesize={len(doc_entries)}'}
+
+            logging.info(f"🔍 Refreshing {len(doc_entries)} selected POs: {doc_entries}")
+            response = self.session.get(url, params=params, headers=headers, timeout=30)
+
+            if response.status_code == 200:
+                return {'success': True, 'purchase_orders': self._open_purchase_orders(response.json().get('value', []))}
+            elif response.status_code == 401:
+                self.session_id = None
+                if self.login():
+                    return self.fetch_purchase_orders_by_doc_entries(doc_entries)
+                return {'success': False, 'error': 'Authentication failed'}
+            logging.warning(f"⚠️ Failed to refresh selected POs: {response.text}")
+            return {'success': False, 'error': response.text}
+
+        except Exception as e:
+            logging.warning(f"⚠️ Error refreshing selected POs {doc_entries}: {str(e)}")
+            return {'success': False, 'error': str(e)}
+
     def create_purchase_delivery_note(self, grn_data):
 
         
@@ -286,67 +334,80 @@ class SAPMultiGRNService:
     def validate_item_code(self, item_code):
         """
         Validate item code and get batch/serial management info
-        Uses SAP B1 SQLQueries endpoint to check item properties
+        Uses SAP B1 SQLQueries endpoint to check item properties; items already
+        in the local item master index are answered from it
         """
-        if not self.ensure_logged_in():
-            logging.warning(f"⚠️ SAP login failed - cannot validate item {item_code}")
-            return {'success': False, 'error': 'SAP login failed'}
-        
-        try:
-            url = f"{self.base_url}/b1s/v1/SQLQueries('ItemCode_Batch_Serial_Val')/List"
-            payload = {
-                "ParamList": f"itemCode='{item_code}'"
+        from sap_integration import local_item
+
+        item = local_item(item_code)
+        if item is not None:
+            item_data = {
+                'ItemCode': item.item_code,
+                'BatchNum': 'Y' if item.batch_managed else 'N',
+                'SerialNum': 'Y' if item.serial_managed else 'N',
+                'NonBatch_NonSerialMethod': item.manage_method or 'N'
             }
-            
-            logging.info(f"🔍 Validating item code: {item_code}")
-            response = self.session.post(url, json=payload, timeout=30)
-            
-            if response.status_code == 200:
-                data = response.json()
-                items = data.get('value', [])
-                
-                if not items:
-                    logging.warning(f"⚠️ Item code {item_code} not found in SAP")
-                    return {'success': False, 'error': f'Item code {item_code} not found'}
-                
-                item_data = items[0]
-                batch_managed = item_data.get('BatchNum', 'N') == 'Y'
-                serial_managed = item_data.get('SerialNum', 'N') == 'Y'
-                management_method = item_data.get('NonBatch_NonSerialMethod', 'N')
-                
-                # Determine inventory type
-                if serial_managed:
-                    inventory_type = 'serial'
-                elif batch_managed:
-                    inventory_type = 'batch'
-                elif management_method == 'R':
-                    inventory_type = 'quantity_based'
-                else:
-                    inventory_type = 'standard'
-                
-                logging.info(f"✅ Item {item_code} validated: Type={inventory_type}")
-                return {
-                    'success': True,
-                    'item_code': item_data.get('ItemCode'),
-                    'batch_managed': batch_managed,
-                    'serial_managed': serial_managed,
-                    'inventory_type': inventory_type,
-                    'management_method': management_method,
-                    'item_data': item_data
+        else:
+            if not self.ensure_logged_in():
+                logging.warning(f"⚠️ SAP login failed - cannot validate item {item_code}")
+                return {'success': False, 'error': 'SAP login failed'}
+
+            try:
+                url = f"{self.base_url}/b1s/v1/SQLQueries('ItemCode_Batch_Serial_Val')/List"
+                payload = {
+                    "ParamList": f"itemCode='{item_code}'"
                 }
-            elif response.status_code == 401:
-                self.session_id = None
-                if self.login():
-                    return self.validate_item_code(item_code)
-                return {'success': False, 'error': 'Authentication failed'}
-            else:
-                error_msg = response.text
-                logging.error(f"❌ Failed to validate item {item_code}: {error_msg}")
-                return {'success': False, 'error': error_msg}
-                
-        except Exception as e:
-            logging.error(f"❌ Error validating item {item_code}: {str(e)}")
-            return {'success': False, 'error': str(e)}
+
+                logging.info(f"🔍 Validating item code: {item_code}")
+                response = self.session.post(url, json=payload, timeout=30)
+
+                if response.status_code == 200:
+                    data = response.json()
+                    items = data.get('value', [])
+
+                    if not items:
+                        logging.warning(f"⚠️ Item code {item_code} not found in SAP")
+                        return {'success': False, 'error': f'Item code {item_code} not found'}
+
+                    item_data = items[0]
+                elif response.status_code == 401:
+                    self.session_id = None
+                    if self.login():
+                        return self.validate_item_code(item_code)
+                    return {'success': False, 'error': 'Authentication failed'}
+                else:
+                    error_msg = response.text
+                    logging.error(f"❌ Failed to validate item {item_code}: {error_msg}")
+                    return {'success': False, 'error': error_msg}
+
+            except Exception as e:
+                logging.error(f"❌ Error validating item {item_code}: {str(e)}")
+                return {'success': False, 'error': str(e)}
+
+        batch_managed = item_data.get('BatchNum', 'N') == 'Y'
+        serial_managed = item_data.get('SerialNum', 'N') == 'Y'
+        management_method = item_data.get('NonBatch_NonSerialMethod', 'N')
+
+        # Determine inventory type
+        if serial_managed:
+            inventory_type = 'serial'
+        elif batch_managed:
+            inventory_type = 'batch'
+        elif management_method == 'R':
+            inventory_type = 'quantity_based'
+        else:
+            inventory_type = 'standard'
+
+        logging.info(f"✅ Item {item_code} validated: Type={inventory_type}")
+        return {
+            'success': True,
+            'item_code': item_data.get('ItemCode'),
+            'batch_managed': batch_managed,
+            'serial_managed': serial_managed,
+            'inventory_type': inventory_type,
+            'management_method': management_method,
+            'item_data': item_data
+        }
     
     def get_item_details(self, item_code):
         """
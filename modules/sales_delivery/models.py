@@ -24,7 +24,7 @@ class DeliveryDocument(db.Model):
     qc_approver_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     qc_approved_at = db.Column(db.DateTime, nullable=True)
     qc_notes = db.Column(db.Text, nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     submitted_at = db.Column(db.DateTime, nullable=True)
     last_updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
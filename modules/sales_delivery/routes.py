@@ -3,6 +3,7 @@ from flask_login import login_required, current_user
 from app import db
 from modules.sales_delivery.models import DeliveryDocument, DeliveryItem
 from sap_integration import SAPIntegration
+import fanout
 from datetime import datetime
 import logging
 
@@ -48,7 +49,12 @@ def create():
             return redirect(url_for('sales_delivery.index'))
         
         logging.info(f"📥 Loading SO data for DocEntry: {doc_entry}")
-        so_data = sap.get_sales_order_by_doc_entry(doc_entry)
+        user_id = current_user.id
+        lookups = fanout.gather(
+            so_data=lambda: sap.get_sales_order_by_doc_entry(doc_entry),
+            existing_id=lambda: db.session.query(DeliveryDocument.id).filter_by(
+                so_doc_entry=doc_entry, user_id=user_id, status='draft').scalar())
+        so_data = lookups['so_data']
         
         if not so_data:
             logging.error(f"❌ SO data not found for DocEntry: {doc_entry}")
@@ -57,14 +63,8 @@ def create():
         
         logging.info(f"✅ SO data loaded: CardCode={so_data.get('CardCode')}, CardName={so_data.get('CardName')}, Lines={len(so_data.get('DocumentLines', []))}")
         
-        existing = DeliveryDocument.query.filter_by(
-            so_doc_entry=doc_entry,
-            user_id=current_user.id,
-            status='draft'
-        ).first()
-        
-        if existing:
-            return redirect(url_for('sales_delivery.detail', delivery_id=existing.id))
+        if lookups['existing_id']:
+            return redirect(url_for('sales_delivery.detail', delivery_id=lookups['existing_id']))
         
         delivery = DeliveryDocument(
             so_doc_entry=doc_entry,
@@ -169,8 +169,17 @@ def api_add_item():
     if not delivery or delivery.user_id != current_user.id:
         return jsonify({'success': False, 'error': 'Access denied'})
     
+    # The SO, the item validation and the next line number are independent lookups
     sap = SAPIntegration()
-    so_data = sap.get_sales_order_by_doc_entry(delivery.so_doc_entry)
+    sap.ensure_logged_in()
+    validator = sap.sibling()
+    so_doc_entry = delivery.so_doc_entry
+    lookups = fanout.gather(
+        so_data=lambda: sap.get_sales_order_by_doc_entry(so_doc_entry),
+        validation=lambda: validator.validate_item_code(item_code),
+        last_line_num=lambda: db.session.query(db.func.max(DeliveryItem.line_number)).filter_by(
+            delivery_id=delivery_id).scalar())
+    so_data = lookups['so_data']
     
     if not so_data:
         return jsonify({'success': False, 'error': 'Sales Order not found'})
@@ -184,11 +193,9 @@ def api_add_item():
     if not so_line:
         return jsonify({'success': False, 'error': 'Line not found in Sales Order'})
     
-    validation = sap.validate_item_code(item_code)
+    validation = lookups['validation']
     
-    next_line_num = db.session.query(db.func.max(DeliveryItem.line_number)).filter_by(
-        delivery_id=delivery_id
-    ).scalar() or 0
+    next_line_num = lookups['last_line_num'] or 0
     
     item = DeliveryItem(
         delivery_id=delivery_id,
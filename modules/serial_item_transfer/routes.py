@@ -8,6 +8,7 @@ import re
 from app import db
 from models import SerialItemTransfer, SerialItemTransferItem, DocumentNumberSeries
 from sap_integration import SAPIntegration
+from serial_index import serial_index
 from sqlalchemy import or_
 
 # Create blueprint for Serial Item Transfer module
@@ -696,6 +697,7 @@ def post_to_sap(transfer_id):
 
             if response.status_code == 201:
                 sap_doc = response.json()
+                serial_index.apply_stock_transfer(sap_transfer_data)
                 sap_result = {
                     'success': True,
                     'document_number': sap_doc.get('DocNum'),
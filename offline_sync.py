@@ -0,0 +1,372 @@
+"""
+Offline Scanner Sync
+Replays batches of actions that handhelds queued while offline (static/js/app.js
+keeps them under wms_offline_* keys) and POST to /api/sync_offline.
+
+Actions are grouped by the document they touch and each group is applied in
+its own transaction, together with an OfflineSyncAction row per action. A
+batch that is sent again (e.g. the response was lost with the Wi-Fi) returns
+the stored results for actions that were already applied.
+
+Action format:
+    {"id": "<idempotency key>", "type": "<action type>", "payload": {...}, "client_ts": "..."}
+
+Action types:
+    bin_scan        {bin_code, items_found?, scan_data?}
+    grpo_item_add   {grpo_id, item_code, quantity, item_name?, unit_of_measure?, warehouse_code?,
+                     bin_location?, batch_number?, expiry_date?, number_of_bags?, serials?, batches?}
+    grpo_serial_add {grpo_id, item_code, serials: [{internal_serial_number, expiry_date?, ...}]}
+    count_update    {doc_entry, line_number, counted_quantity}
+
+Environment:
+    OFFLINE_SYNC_MAX_ACTIONS - largest accepted batch (default 1000)
+"""
+
+import os
+import json
+import hashlib
+import logging
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from models import BinScanningLog, OfflineSyncAction, SAPInventoryCount, SAPInventoryCountLine, ItemMaster
+
+try:
+    MAX_ACTIONS = max(1, int(os.environ.get('OFFLINE_SYNC_MAX_ACTIONS', 1000)))
+except ValueError:
+    MAX_ACTIONS = 1000
+
+
+class OfflineActionError(Exception):
+    """An action cannot be applied; its document group is rolled back"""
+
+
+class _IdempotencyConflict(Exception):
+    """Another request stored the same idempotency key first"""
+
+
+def _keys_stored(keys):
+    return OfflineSyncAction.query.filter(OfflineSyncAction.idempotency_key.in_(keys)).count() > 0
+
+
+def _can_edit_grpo(user, grpo):
+    return grpo.user_id == user.id or user.role in ('admin', 'manager')
+
+
+def _load_draft_grpo(user, grpo_id):
+    from modules.grpo.models import GRPODocument
+
+    grpo = db.session.get(GRPODocument, int(grpo_id)) if grpo_id else None
+    if grpo is None:
+        raise OfflineActionError(f'GRPO {grpo_id} not found')
+    if not _can_edit_grpo(user, grpo):
+        raise OfflineActionError('Access denied - you can only modify your own GRPOs')
+    if grpo.status != 'draft':
+        raise OfflineActionError(f'GRPO {grpo.id} is {grpo.status}, not draft')
+    return grpo
+
+
+def _item_flags(item_code):
+    """(batch_managed, serial_managed) from the local item index; SAP is not called during replay"""
+    item = ItemMaster.get_by_code(item_code)
+    if item is None:
+        return None
+    return bool(item.batch_managed), bool(item.serial_managed)
+
+
+def _add_serials(grpo_item, serials, number_of_bags=1):
+    from modules.grpo.models import GRPOSerialNumber
+    from modules.grpo.services import validate_serial_rows, build_serial_mappings, insert_all
+
+    rows, errors = validate_serial_rows(serials)
+    if errors:
+        raise OfflineActionError('; '.join(f"serial row {e['row']}: {e['error']}" for e in errors[:5]))
+    # Count in SQL - bulk inserts earlier in this batch are not in the loaded relationship
+    start = GRPOSerialNumber.query.filter_by(grpo_item_id=grpo_item.id).count()
+    if start + len(rows) > int(grpo_item.quantity):
+        raise OfflineActionError(f'Item {grpo_item.item_code} quantity is {int(grpo_item.quantity)}, '
+                                 f'{start + len(rows)} serials would exceed it')
+    insert_all(GRPOSerialNumber, build_serial_mappings(grpo_item, rows, number_of_bags, start_line=start))
+    return len(rows)
+
+
+def apply_bin_scan(user, payload):
+    bin_code = (payload.get('bin_code') or '').strip()
+    if not bin_code:
+        raise OfflineActionError('bin_code is required')
+    log = BinScanningLog(
+        bin_code=bin_code,
+        user_id=user.id,
+        scan_type=payload.get('scan_type') or 'BIN_SCAN',
+        scan_data=payload.get('scan_data') or f"Offline scan of bin {bin_code}",
+        items_found=int(payload.get('items_found') or 0)
+    )
+    db.session.add(log)
+    db.session.flush()
+    return {'scan_log_id': log.id}
+
+
+def apply_grpo_item_add(user, payload):
+    from modules.grpo.models import GRPOItem, GRPOBatchNumber
+    from modules.grpo.services import validate_batch_rows, build_batch_mappings, insert_all
+
+    grpo = _load_draft_grpo(user, payload.get('grpo_id'))
+    item_code = (payload.get('item_code') or '').strip()
+    try:
+        quantity = float(payload.get('quantity') or 0)
+    except (TypeError, ValueError):
+        quantity = 0
+    if not item_code or quantity <= 0:
+        raise OfflineActionError('item_code and a positive quantity are required')
+    if GRPOItem.query.filter_by(grpo_id=grpo.id, item_code=item_code).first():
+        raise OfflineActionError(f'Item {item_code} has already been added to GRPO {grpo.id}')
+
+    flags = _item_flags(item_code)
+    serials = payload.get('serials') or []
+    batches = payload.get('batches') or []
+    if flags is None:
+        # Unknown to the local index - trust what the scanner captured
+        flags = (bool(batches), bool(serials))
+    batch_managed, serial_managed = flags
+    if serial_managed and len(serials) != int(quantity):
+        raise OfflineActionError(f'Serial managed item {item_code} needs {int(quantity)} serials, got {len(serials)}')
+    if batch_managed and not batches and payload.get('batch_number'):
+        batches = [{'batch_number': payload['batch_number'], 'quantity': quantity,
+                    'expiry_date': payload.get('expiry_date')}]
+    if batch_managed and not batches:
+        raise OfflineActionError(f'Batch managed item {item_code} needs batch numbers')
+
+    expiry_date = None
+    if payload.get('expiry_date'):
+        try:
+            expiry_date = datetime.strptime(payload['expiry_date'], '%Y-%m-%d').date()
+        except ValueError:
+            raise OfflineActionError('expiry_date must be YYYY-MM-DD')
+
+    local_item = ItemMaster.get_by_code(item_code)
+    grpo_item = GRPOItem(
+        grpo_id=grpo.id,
+        item_code=item_code,
+        item_name=payload.get('item_name') or (local_item.item_name if local_item else item_code),
+        quantity=quantity,
+        received_quantity=quantity,
+        unit_of_measure=payload.get('unit_of_measure') or (local_item.inventory_uom if local_item else None),
+        warehouse_code=payload.get('warehouse_code'),
+        bin_location=payload.get('bin_location'),
+        batch_number=payload.get('batch_number'),
+        expiry_date=expiry_date,
+        qc_status='pending',
+        batch_required='Y' if batch_managed else 'N',
+        serial_required='Y' if serial_managed else 'N',
+        manage_method=local_item.manage_method if local_item and local_item.manage_method else 'N'
+    )
+    db.session.add(grpo_item)
+    db.session.flush()
+
+    number_of_bags = max(1, int(payload.get('number_of_bags') or 1))
+    serial_count = _add_serials(grpo_item, serials, number_of_bags) if serial_managed else 0
+    batch_count = 0
+    if batch_managed:
+        rows, errors = validate_batch_rows(batches)
+        if errors:
+            raise OfflineActionError('; '.join(f"batch row {e['row']}: {e['error']}" for e in errors[:5]))
+        if abs(sum(r['quantity'] for r in rows) - quantity) > 0.001:
+            raise OfflineActionError(f'Batch quantities must add up to {quantity}')
+        batch_count = insert_all(GRPOBatchNumber, build_batch_mappings(grpo_item, rows, number_of_bags))
+
+    return {'grpo_item_id': grpo_item.id, 'serials': serial_count, 'batches': batch_count}
+
+
+def apply_grpo_serial_add(user, payload):
+    from modules.grpo.models import GRPOItem
+
+    grpo = _load_draft_grpo(user, payload.get('grpo_id'))
+    grpo_item = GRPOItem.query.filter_by(grpo_id=grpo.id, item_code=payload.get('item_code')).first()
+    if grpo_item is None:
+        raise OfflineActionError(f"Item {payload.get('item_code')} is not on GRPO {grpo.id}")
+    serials = payload.get('serials') or []
+    if not serials and payload.get('internal_serial_number'):
+        serials = [payload]
+    if not serials:
+        raise OfflineActionError('serials are required')
+    count = _add_serials(grpo_item, serials, max(1, int(payload.get('number_of_bags') or 1)))
+    return {'grpo_item_id': grpo_item.id, 'serials': count}
+
+
+def apply_count_update(user, payload):
+    """Record a counted quantity locally; it reaches SAP with the next counting update"""
+    document = SAPInventoryCount.query.filter_by(doc_entry=int(payload.get('doc_entry') or 0)).first()
+    if document is None:
+        raise OfflineActionError(f"Counting document {payload.get('doc_entry')} is not loaded locally")
+    line = SAPInventoryCountLine.query.filter_by(count_id=document.id,
+                                                 line_number=int(payload.get('line_number') or 0)).first()
+    if line is None:
+        raise OfflineActionError(f"Line {payload.get('line_number')} not found on counting document {document.doc_entry}")
+    try:
+        counted = float(payload.get('counted_quantity'))
+    except (TypeError, ValueError):
+        raise OfflineActionError('counted_quantity must be a number')
+
+    line.uom_counted_quantity = counted
+    line.counted = 'tYES'
+    line.variance = counted - (line.in_warehouse_quantity or 0)
+    line.updated_at = datetime.utcnow()
+    document.last_updated_at = datetime.utcnow()
+    return {'doc_entry': document.doc_entry, 'line_number': line.line_number, 'variance': line.variance}
+
+
+# type -> (handler, permission, document key)
+ACTIONS = {
+    'bin_scan': (apply_bin_scan, 'bin_scanning', lambda p: 'bin_scans'),
+    'grpo_item_add': (apply_grpo_item_add, 'grpo', lambda p: f"grpo:{p.get('grpo_id')}"),
+    'grpo_serial_add': (apply_grpo_serial_add, 'grpo', lambda p: f"grpo:{p.get('grpo_id')}"),
+    'count_update': (apply_count_update, 'inventory_counting', lambda p: f"count:{p.get('doc_entry')}"),
+}
+
+
+def normalise_request(body):
+    """Actions from a /api/sync_offline body
+
+    Accepts {"actions": [...]} and the older {"key": ..., "data"/"value": ...}
+    shape where the value is one action, a list of them or a bare payload. Actions without an id get a
+    key derived from their content.
+    """
+    if isinstance(body, dict) and isinstance(body.get('actions'), list):
+        actions = body['actions']
+    elif isinstance(body, dict) and ('data' in body or 'value' in body):
+        # service-worker.js sends {key, value} with the wms_offline_ prefix still on the key
+        data = body['data'] if 'data' in body else body['value']
+        key = str(body.get('key') or '').replace('wms_offline_', '')
+        if key == 'actions' or isinstance(data, list):
+            actions = data if isinstance(data, list) else [data]
+        elif isinstance(data, dict) and 'type' not in data:
+            actions = [{'type': key, 'payload': data}]
+        else:
+            actions = [data]
+    elif isinstance(body, list):
+        actions = body
+    else:
+        actions = []
+
+    normalised = []
+    for action in actions:
+        if not isinstance(action, dict):
+            normalised.append({'id': None, 'type': None, 'payload': {}})
+            continue
+        payload = action.get('payload')
+        if payload is None:
+            payload = {k: v for k, v in action.items() if k not in ('id', 'idempotency_key', 'type', 'client_ts')}
+        key = action.get('id') or action.get('idempotency_key')
+        if not key:
+            digest = json.dumps({'type': action.get('type'), 'payload': payload}, sort_keys=True, default=str)
+            key = 'auto-' + hashlib.sha1(digest.encode('utf-8')).hexdigest()
+        normalised.append({'id': str(key)[:100], 'type': action.get('type'), 'payload': payload or {},
+                           'client_ts': action.get('client_ts')})
+    return normalised
+
+
+def replay(user, actions):
+    """Apply a batch of offline actions; returns per-action results in request order"""
+    results = [None] * len(actions)
+
+    keys = [a['id'] for a in actions if a['id']]
+    stored = {}
+    for start in range(0, len(keys), 500):
+        for record in OfflineSyncAction.query.filter(
+                OfflineSyncAction.idempotency_key.in_(keys[start:start + 500])).all():
+            stored[record.idempotency_key] = record
+
+    groups = {}
+    seen = set()
+    for index, action in enumerate(actions):
+        spec = ACTIONS.get(action['type'])
+        if spec is None:
+            results[index] = {'id': action['id'], 'status': 'failed', 'error': f"Unknown action type {action['type']!r}"}
+            continue
+        if action['id'] in seen:
+            results[index] = {'id': action['id'], 'status': 'failed', 'error': 'Duplicate id in batch'}
+            continue
+        seen.add(action['id'])
+        record = stored.get(action['id'])
+        if record is not None:
+            if record.user_id != user.id:
+                results[index] = {'id': action['id'], 'status': 'failed', 'error': 'Idempotency key already used'}
+            else:
+                results[index] = {'id': action['id'], 'status': 'replayed',
+                                  'result': json.loads(record.result) if record.result else None}
+            continue
+        handler, permission, document_key = spec
+        if not user.has_permission(permission):
+            results[index] = {'id': action['id'], 'status': 'failed', 'error': f'{permission} permission required'}
+            continue
+        groups.setdefault(document_key(action['payload']), []).append(index)
+
+    for document, indexes in groups.items():
+        applied = {}
+        failed, error = (), None
+        try:
+            for index in indexes:
+                action = actions[index]
+                handler = ACTIONS[action['type']][0]
+                try:
+                    outcome = handler(user, action['payload'])
+                    # Flushed per action so a constraint violation is charged to the action that caused it
+                    db.session.flush()
+                except OfflineActionError as e:
+                    failed, error = (index,), str(e)
+                    raise
+                except (TypeError, ValueError) as e:
+                    failed, error = (index,), f'Invalid payload: {e}'
+                    raise OfflineActionError(error)
+                except IntegrityError as e:
+                    failed, error = (index,), f'Rejected by the database: {str(e.orig).splitlines()[0]}'
+                    raise OfflineActionError(error)
+                db.session.add(OfflineSyncAction(
+                    idempotency_key=action['id'],
+                    user_id=user.id,
+                    action_type=action['type'],
+                    document_key=document,
+                    result=json.dumps(outcome, default=str),
+                    client_timestamp=(str(action.get('client_ts')) if action.get('client_ts') else None)
+                ))
+                try:
+                    db.session.flush()
+                except IntegrityError:
+                    raise _IdempotencyConflict()
+                applied[index] = outcome
+            try:
+                db.session.commit()
+            except IntegrityError as e:
+                db.session.rollback()
+                if _keys_stored([actions[index]['id'] for index in indexes]):
+                    raise _IdempotencyConflict()
+                # Not attributable to one action: fail the whole group rather than retry it forever
+                failed, error = indexes, f'Rejected by the database: {str(e.orig).splitlines()[0]}'
+                raise OfflineActionError(error)
+        except (OfflineActionError, _IdempotencyConflict) as e:
+            db.session.rollback()
+            if isinstance(e, _IdempotencyConflict):
+                # Another request replayed the same batch concurrently - retry to get the stored results
+                failed, error = (), 'Conflict with a concurrent sync, retry'
+            logging.warning(f"⚠️ Offline sync group {document} rolled back: {error}")
+            for index in indexes:
+                if index in failed:
+                    results[index] = {'id': actions[index]['id'], 'status': 'failed', 'error': error}
+                else:
+                    results[index] = {'id': actions[index]['id'], 'status': 'skipped',
+                                      'error': f'Not applied - another action for {document} failed'
+                                      if failed else error}
+            continue
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"❌ Offline sync group {document} failed: {str(e)}")
+            for index in indexes:
+                results[index] = {'id': actions[index]['id'], 'status': 'skipped', 'error': 'Server error, retry'}
+            continue
+
+        for index, outcome in applied.items():
+            results[index] = {'id': actions[index]['id'], 'status': 'applied', 'result': outcome}
+
+    return results
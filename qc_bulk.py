@@ -0,0 +1,368 @@
+"""
+Bulk QC Review
+Approves or rejects many documents of different types in one request
+(POST /api/qc/bulk) instead of one blocking POST per document.
+
+Every status change is written in one transaction first. Each document is
+claimed with a conditional UPDATE (... WHERE status = 'submitted'), so a
+document another request has reviewed meanwhile is skipped rather than posted
+twice. Approved documents that go to SAP are claimed as 'posting', not
+'qc_approved': the postings then run on a small thread pool, each in its own
+app context, DB session and SAP session, so N documents take about
+N / workers SAP round trips of wall time. The request waits up to
+QC_BULK_WAIT_SECONDS for the postings; anything still running is reported as
+'posting' and finishes in the background.
+
+A document left in 'posting' for QC_BULK_STALE_POSTING_SECONDS (its process
+died mid-post) is returned to 'submitted' by release_stale_postings - run at
+the start of every bulk review and by `flask qc-release-postings` - with a
+note to check SAP B1 before approving it again.
+
+Per-document outcomes:
+    rejected      rejected by QC
+    approved      approved; this document type is posted to SAP separately
+    posted        approved and posted to SAP (sap_document_number is set)
+    post_failed   SAP rejected the posting (document_status says where it is now)
+    posting       still posting when the request stopped waiting
+    skipped       not in 'submitted' status
+    not_found / invalid
+
+Environment:
+    QC_BULK_MAX_DOCUMENTS  - largest accepted request (default 500)
+    QC_BULK_POST_WORKERS   - concurrent SAP postings per worker process (default 4)
+    QC_BULK_WAIT_SECONDS   - how long the request waits for postings (default 90)
+    QC_BULK_STALE_POSTING_SECONDS - age after which a 'posting' document is released (default 900)
+"""
+
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app import db
+import qc_queues
+
+
+def _env_int(name, default):
+    try:
+        return max(1, int(os.environ.get(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+MAX_DOCUMENTS = _env_int('QC_BULK_MAX_DOCUMENTS', 500)
+POST_WORKERS = _env_int('QC_BULK_POST_WORKERS', 4)
+WAIT_SECONDS = _env_int('QC_BULK_WAIT_SECONDS', 90)
+STALE_POSTING_SECONDS = _env_int('QC_BULK_STALE_POSTING_SECONDS', 900)
+
+
+def build_delivery_payload(delivery, approver_name):
+    """SAP B1 DeliveryNotes body for a QC-approved sales delivery"""
+    document_lines = []
+    for item in delivery.items:
+        line_data = {
+            'BaseType': 17,
+            'BaseEntry': delivery.so_doc_entry,
+            'BaseLine': item.base_line,
+            'ItemCode': item.item_code,
+            'Quantity': item.quantity,
+            'WarehouseCode': item.warehouse_code,
+            'UnitPrice': item.unit_price
+        }
+
+        if item.batch_required and item.batch_number:
+            line_data['BatchNumbers'] = [{
+                'BatchNumber': item.batch_number,
+                'Quantity': item.quantity
+            }]
+
+        if item.serial_required and item.serial_number:
+            line_data['SerialNumbers'] = [{
+                'InternalSerialNumber': item.serial_number,
+                'Quantity': 1
+            }]
+
+        document_lines.append(line_data)
+
+    return {
+        'CardCode': delivery.card_code,
+        'DocDate': delivery.doc_date.strftime('%Y-%m-%d') if delivery.doc_date else datetime.utcnow().strftime('%Y-%m-%d'),
+        'DocCurrency': delivery.doc_currency or 'INR',
+        'Series': delivery.delivery_series or delivery.so_series,
+        'Comments': delivery.remarks or f'Delivery against SO {delivery.so_doc_num} - QC Approved by {approver_name}',
+        'DocumentLines': document_lines
+    }
+
+
+# Each poster returns (success, SAP document number, error) and stores the number on the document
+def _post_grpo(sap, grpo, approver_name):
+    result = sap.post_grpo_to_sap(grpo)
+    if result.get('success'):
+        grpo.sap_document_number = result.get('sap_document_number')
+        return True, grpo.sap_document_number, None
+    return False, None, result.get('error', 'Unknown SAP error')
+
+
+def _post_inventory_transfer(sap, transfer, approver_name):
+    result = sap.post_inventory_transfer_to_sap(transfer)
+    if result.get('success'):
+        transfer.sap_document_number = result.get('document_number')
+        return True, transfer.sap_document_number, None
+    return False, None, result.get('error', 'Unknown SAP error')
+
+
+def _post_direct_transfer(sap, transfer, approver_name):
+    result = sap.post_direct_inventory_transfer_to_sap(transfer)
+    if result.get('success'):
+        transfer.sap_document_number = result.get('document_number')
+        return True, transfer.sap_document_number, None
+    return False, None, result.get('error', 'Unknown SAP error')
+
+
+def _post_sales_delivery(sap, delivery, approver_name):
+    result = sap.create_delivery_note(build_delivery_payload(delivery, approver_name))
+    if result.get('success'):
+        delivery.sap_doc_entry = result.get('doc_entry')
+        delivery.sap_doc_num = result.get('doc_num')
+        return True, delivery.sap_doc_num, None
+    return False, None, result.get('error', 'Unknown SAP error')
+
+
+# type: (SAP poster or None, back to 'submitted' when posting fails)
+# The single-document endpoints only keep a GRPO approved when SAP rejects it;
+# the other types roll the approval back, and so does the bulk review.
+# Types with a poster are claimed as 'posting' until SAP has answered.
+DOCUMENT_TYPES = {
+    'grpo': (_post_grpo, False),
+    'inventory_transfer': (_post_inventory_transfer, True),
+    'serial_item_transfer': (None, False),
+    'direct_inventory_transfer': (_post_direct_transfer, True),
+    'sales_delivery': (_post_sales_delivery, True),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+_thread_state = threading.local()
+
+
+def _pipeline():
+    """Posting thread pool, created on first use in each worker process"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=POST_WORKERS, thread_name_prefix='qc-post')
+        return _executor
+
+
+def _thread_sap():
+    """One SAPIntegration (and so one Service Layer login) per posting thread"""
+    sap = getattr(_thread_state, 'sap', None)
+    if sap is None:
+        from sap_integration import SAPIntegration
+        sap = _thread_state.sap = SAPIntegration()
+    return sap
+
+
+def normalise_request(body):
+    """[(type, id, action, qc_notes)] and [invalid outcomes] from the request body"""
+    body = body or {}
+    default_action = body.get('action', 'approve')
+    default_notes = (body.get('qc_notes') or '').strip()
+    entries, invalid, seen = [], [], set()
+    for index, doc in enumerate(body.get('documents') or []):
+        if not isinstance(doc, dict):
+            invalid.append({'index': index, 'status': 'invalid', 'error': 'Each document must be an object'})
+            continue
+        doc_type = doc.get('type')
+        action = doc.get('action', default_action)
+        notes = (doc.get('qc_notes') or default_notes).strip()
+        try:
+            doc_id = int(doc.get('id'))
+        except (TypeError, ValueError):
+            doc_id = None
+        outcome = {'index': index, 'type': doc_type, 'id': doc_id}
+        if doc_type not in DOCUMENT_TYPES:
+            invalid.append(dict(outcome, status='invalid', error=f'Unknown document type {doc_type!r}'))
+        elif doc_id is None:
+            invalid.append(dict(outcome, status='invalid', error='id must be an integer'))
+        elif action not in ('approve', 'reject'):
+            invalid.append(dict(outcome, status='invalid', error="action must be 'approve' or 'reject'"))
+        elif action == 'reject' and not notes:
+            invalid.append(dict(outcome, status='invalid', error='Rejection reason is required'))
+        elif (doc_type, doc_id) in seen:
+            invalid.append(dict(outcome, status='invalid', error='Document listed more than once'))
+        else:
+            seen.add((doc_type, doc_id))
+            entries.append((doc_type, doc_id, action, notes))
+    return entries, invalid
+
+
+def _log_status_change(doc_type, doc_id, previous_status, new_status, user_id, notes):
+    """The status history entry the single-document endpoints write for this type"""
+    if doc_type == 'inventory_transfer':
+        from modules.inventory_transfer.routes import log_status_change
+        log_status_change(doc_id, previous_status, new_status, user_id, notes)
+
+
+def _claim(model, doc_id, from_status, values):
+    """Conditional UPDATE of one document; True when this request moved it out of from_status"""
+    return db.session.query(model).filter(model.id == doc_id, model.status == from_status) \
+        .update(values, synchronize_session=False) == 1
+
+
+def _apply_reviews(user, entries):
+    """Status changes for every entry in one transaction; returns (outcomes, [(type, id)] to post)"""
+    outcomes, to_post, history = {}, [], []
+    now = datetime.utcnow()
+    by_type = {}
+    for entry in entries:
+        by_type.setdefault(entry[0], []).append(entry)
+
+    for doc_type, type_entries in by_type.items():
+        model, line_model, line_fk = qc_queues.queue_models(doc_type)
+        poster = DOCUMENT_TYPES[doc_type][0]
+        documents = {doc.id: doc for doc in model.query.filter(model.id.in_([e[1] for e in type_entries])).all()}
+        item_status = {'approve': [], 'reject': []}
+
+        for _, doc_id, action, notes in type_entries:
+            document = documents.get(doc_id)
+            if document is None:
+                outcomes[(doc_type, doc_id)] = {'status': 'not_found', 'error': 'Document not found'}
+                continue
+            if document.status != 'submitted':
+                outcomes[(doc_type, doc_id)] = {'status': 'skipped', 'document_status': document.status,
+                                                'error': 'Only submitted documents can be reviewed'}
+                continue
+
+            if action == 'reject':
+                new_status = 'rejected'
+            else:
+                new_status = 'qc_approved' if poster is None else 'posting'
+            values = {'status': new_status, 'qc_approver_id': user.id, 'qc_approved_at': now, 'qc_notes': notes}
+            if hasattr(model, 'updated_at'):
+                values['updated_at'] = now
+            if not _claim(model, doc_id, 'submitted', values):
+                outcomes[(doc_type, doc_id)] = {'status': 'skipped',
+                                                'error': 'Reviewed by another request in the meantime'}
+                continue
+            item_status[action].append(doc_id)
+
+            if action == 'reject':
+                outcomes[(doc_type, doc_id)] = {'status': 'rejected'}
+                history.append((doc_type, doc_id, 'rejected', f'Transfer rejected by QC: {notes}'))
+            elif poster is None:
+                outcomes[(doc_type, doc_id)] = {'status': 'approved'}
+            else:
+                to_post.append((doc_type, doc_id))
+
+        for action, ids in item_status.items():
+            if ids:
+                db.session.query(line_model).filter(line_fk.in_(ids)).update(
+                    {'qc_status': 'approved' if action == 'approve' else 'rejected'},
+                    synchronize_session=False)
+
+    db.session.commit()
+    for doc_type, doc_id, new_status, notes in history:
+        _log_status_change(doc_type, doc_id, 'submitted', new_status, user.id, notes)
+    return outcomes, to_post
+
+
+def _release(model, line_model, line_fk, doc_id, status, values=None):
+    """Move a 'posting' document to status, with its lines back to pending when that is 'submitted'"""
+    values = dict(values or {}, status=status)
+    if status == 'submitted':
+        values.update(qc_approver_id=None, qc_approved_at=None)
+    if not _claim(model, doc_id, 'posting', values):
+        return False
+    if status == 'submitted':
+        db.session.query(line_model).filter(line_fk == doc_id).update(
+            {'qc_status': 'pending'}, synchronize_session=False)
+    return True
+
+
+def _post_document(app, doc_type, doc_id, approver_id, approver_name):
+    """Post one claimed document to SAP in its own app context and DB session"""
+    poster, revert_on_failure = DOCUMENT_TYPES[doc_type]
+    with app.app_context():
+        model, line_model, line_fk = qc_queues.queue_models(doc_type)
+        document = db.session.get(model, doc_id)
+        if document is None or document.status != 'posting':
+            return {'status': 'skipped', 'error': 'Document is no longer waiting for SAP posting'}
+
+        sap = _thread_sap()
+        try:
+            if not sap.ensure_logged_in():
+                ok, number, error = False, None, 'SAP B1 authentication failed'
+            else:
+                ok, number, error = poster(sap, document, approver_name)
+        except Exception as e:
+            logging.error(f"❌ Bulk QC posting of {doc_type} {doc_id} raised: {e}")
+            ok, number, error = False, None, str(e)
+
+        if ok:
+            # SAP has the document - record it even if the row was released as stale meanwhile
+            document.status = 'posted'
+            db.session.commit()
+            _log_status_change(doc_type, doc_id, 'submitted', 'posted', approver_id,
+                               f'Transfer QC approved and posted to SAP B1 as {number}')
+            logging.info(f"✅ Bulk QC: {doc_type} {doc_id} posted to SAP B1 as {number}")
+            return {'status': 'posted', 'sap_document_number': number}
+
+        # Drop whatever the poster changed, and force a fresh SAP login next time
+        db.session.rollback()
+        sap.session_id = None
+        document_status = 'submitted' if revert_on_failure else 'qc_approved'
+        _release(model, line_model, line_fk, doc_id, document_status)
+        db.session.commit()
+        logging.warning(f"⚠️ Bulk QC: SAP posting failed for {doc_type} {doc_id}: {error}")
+        return {'status': 'post_failed', 'error': error, 'document_status': document_status}
+
+
+def release_stale_postings(older_than=None):
+    """Return documents stuck in 'posting' to 'submitted'; returns how many were released
+
+    A document stays in 'posting' only while a posting thread owns it, so one
+    older than STALE_POSTING_SECONDS lost its thread (worker restart or crash).
+    SAP may or may not have accepted it, so it goes back to the QC queue with a
+    note instead of being posted again automatically.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=older_than or STALE_POSTING_SECONDS)
+    released = 0
+    for doc_type, (poster, _) in DOCUMENT_TYPES.items():
+        if poster is None:
+            continue
+        model, line_model, line_fk = qc_queues.queue_models(doc_type)
+        stale = model.query.filter(model.status == 'posting', model.qc_approved_at < cutoff).all()
+        for document in stale:
+            notes = (f"{document.qc_notes or ''}\n[SAP posting interrupted at "
+                     f"{document.qc_approved_at:%Y-%m-%d %H:%M} UTC - check SAP B1 before approving again]").strip()
+            if _release(model, line_model, line_fk, document.id, 'submitted', {'qc_notes': notes}):
+                released += 1
+                logging.warning(f"⚠️ Bulk QC: {doc_type} {document.id} was left in 'posting' - returned to QC")
+    db.session.commit()
+    return released
+
+
+def bulk_review(user, entries):
+    """Apply the reviews, post the approvals concurrently and return {(type, id): outcome}"""
+    release_stale_postings()
+    outcomes, to_post = _apply_reviews(user, entries)
+    if not to_post:
+        return outcomes
+
+    app = current_app._get_current_object()
+    futures = {_pipeline().submit(_post_document, app, doc_type, doc_id, user.id, user.username): (doc_type, doc_id)
+               for doc_type, doc_id in to_post}
+    logging.info(f"🚀 Bulk QC: posting {len(futures)} documents to SAP B1 with {POST_WORKERS} workers")
+    done, pending = wait(futures, timeout=WAIT_SECONDS)
+    for future in done:
+        try:
+            outcomes[futures[future]] = future.result()
+        except Exception as e:
+            outcomes[futures[future]] = {'status': 'post_failed', 'error': str(e)}
+    for future in pending:
+        outcomes[futures[future]] = {'status': 'posting', 'document_status': 'posting'}
+    return outcomes
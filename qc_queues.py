@@ -0,0 +1,255 @@
+"""
+QC Approval Queues
+Keyset-paginated pages of the documents waiting in each QC queue, used by the
+QC dashboard and /api/qc/queues/<queue>.
+
+Pages are ordered oldest first by (created_at, id) and continue after a cursor
+instead of an OFFSET, so every page costs the same however long the backlog
+is. created_at is NOT NULL on the queue tables (`flask migrate` back-fills
+older rows), so the plain (status, created_at, id) index serves every page. Line and serial counts are read with correlated COUNT subqueries in the
+page query and the creating user is joined in, so rendering a page does not
+lazy-load anything per document.
+
+Environment:
+    QC_PAGE_SIZE - documents per queue page (default 50, at most 200)
+"""
+
+import os
+import json
+import base64
+import logging
+import importlib
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import joinedload
+
+from app import db
+
+try:
+    PAGE_SIZE = max(1, int(os.environ.get('QC_PAGE_SIZE', 50)))
+except ValueError:
+    PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# queue: model, status, (line model, FK to document), (serial model, FK to line) or None, extra fields
+QUEUES = {
+    'grpo': {
+        'model': ('modules.grpo.models', 'GRPODocument'),
+        'status': 'submitted',
+        'lines': ('modules.grpo.models', 'GRPOItem', 'grpo_id'),
+        'serials': ('modules.grpo.models', 'GRPOSerialNumber', 'grpo_item_id'),
+        'number': 'po_number',
+        'fields': ('po_number', 'supplier_code', 'supplier_name', 'po_total', 'warehouse_code'),
+    },
+    'inventory_transfer': {
+        'model': ('models', 'InventoryTransfer'),
+        'status': 'submitted',
+        'lines': ('models', 'InventoryTransferItem', 'inventory_transfer_id'),
+        'serials': None,
+        'number': 'transfer_request_number',
+        'fields': ('transfer_request_number', 'from_warehouse', 'to_warehouse'),
+    },
+    'serial_transfer': {
+        'model': ('models', 'SerialNumberTransfer'),
+        'status': 'submitted',
+        'lines': ('models', 'SerialNumberTransferItem', 'serial_transfer_id'),
+        'serials': ('models', 'SerialNumberTransferSerial', 'transfer_item_id'),
+        'number': 'transfer_number',
+        'fields': ('transfer_number', 'from_warehouse', 'to_warehouse', 'priority'),
+    },
+    'serial_item_transfer': {
+        'model': ('models', 'SerialItemTransfer'),
+        'status': 'submitted',
+        'lines': ('models', 'SerialItemTransferItem', 'serial_item_transfer_id'),
+        'serials': None,
+        'number': 'transfer_number',
+        'fields': ('transfer_number', 'from_warehouse', 'to_warehouse', 'priority'),
+    },
+    'serial_item_transfer_posting': {
+        'model': ('models', 'SerialItemTransfer'),
+        'status': 'qc_approved',
+        'lines': ('models', 'SerialItemTransferItem', 'serial_item_transfer_id'),
+        'serials': None,
+        'number': 'transfer_number',
+        'fields': ('transfer_number', 'from_warehouse', 'to_warehouse', 'priority', 'qc_notes'),
+    },
+    'direct_inventory_transfer': {
+        'model': ('models', 'DirectInventoryTransfer'),
+        'status': 'submitted',
+        'lines': ('models', 'DirectInventoryTransferItem', 'direct_inventory_transfer_id'),
+        'serials': None,
+        'number': 'transfer_number',
+        'fields': ('transfer_number', 'from_warehouse', 'to_warehouse', 'from_bin', 'to_bin'),
+    },
+    'sales_delivery': {
+        'model': ('modules.sales_delivery.models', 'DeliveryDocument'),
+        'status': 'submitted',
+        'lines': ('modules.sales_delivery.models', 'DeliveryItem', 'delivery_id'),
+        'serials': None,
+        'number': 'so_doc_num',
+        'fields': ('so_doc_num', 'card_code', 'card_name'),
+    },
+}
+
+
+def _class(module_path, name):
+    return getattr(importlib.import_module(module_path), name)
+
+
+def queue_models(queue):
+    """(document model, line model, line FK column) of a queue"""
+    spec = QUEUES[queue]
+    line_model = _class(*spec['lines'][:2])
+    return _class(*spec['model']), line_model, getattr(line_model, spec['lines'][2])
+
+
+def page_size(value=None):
+    """Requested page size clamped to 1..MAX_PAGE_SIZE"""
+    try:
+        return min(max(1, int(value)), MAX_PAGE_SIZE) if value else PAGE_SIZE
+    except (TypeError, ValueError):
+        return PAGE_SIZE
+
+
+def encode_cursor(document):
+    """Opaque cursor pointing just after this document"""
+    raw = json.dumps([document.created_at.isoformat(), document.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(created_at, id) from a cursor; ValueError when it was not made by encode_cursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created, doc_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created), int(doc_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def queue_page(queue, after=None, limit=None):
+    """One page of a queue: (documents, next_cursor)
+
+    Each document gets ``line_count`` and ``serial_count`` attributes (the
+    latter is None for queues without serial rows). ``next_cursor`` is None on
+    the last page.
+    """
+    spec = QUEUES[queue]
+    model, line_model, line_fk = queue_models(queue)
+    limit = page_size(limit)
+
+    columns = [model,
+               db.select(db.func.count(line_model.id)).where(line_fk == model.id)
+               .correlate(model).scalar_subquery().label('line_count')]
+    if spec['serials']:
+        serial_model = _class(*spec['serials'][:2])
+        columns.append(
+            db.select(db.func.count(serial_model.id))
+            .join(line_model, getattr(serial_model, spec['serials'][2]) == line_model.id)
+            .where(line_fk == model.id)
+            .correlate(model).scalar_subquery().label('serial_count'))
+
+    query = db.session.query(*columns).options(joinedload(model.user)) \
+        .filter(model.status == spec['status'])
+    if after:
+        created_at, doc_id = decode_cursor(after)
+        query = query.filter(or_(model.created_at > created_at,
+                                 and_(model.created_at == created_at, model.id > doc_id)))
+
+    rows = query.order_by(model.created_at, model.id).limit(limit + 1).all()
+    has_more = len(rows) > limit
+
+    documents = []
+    for row in rows[:limit]:
+        document = row[0]
+        document.line_count = row[1] or 0
+        document.serial_count = (row[2] or 0) if spec['serials'] else None
+        documents.append(document)
+
+    next_cursor = encode_cursor(documents[-1]) if has_more and documents else None
+    return documents, next_cursor
+
+
+def queue_counts(queues=None):
+    """{queue: number of documents waiting}"""
+    counts = {}
+    for queue in queues or QUEUES:
+        spec = QUEUES[queue]
+        model = _class(*spec['model'])
+        try:
+            counts[queue] = db.session.query(db.func.count(model.id)) \
+                .filter(model.status == spec['status']).scalar() or 0
+        except Exception as e:
+            logging.warning(f"⚠️ QC queue count for {queue} failed: {e}")
+            db.session.rollback()
+            counts[queue] = 0
+    return counts
+
+
+def serialise(queue, document):
+    """JSON form of a queue document"""
+    spec = QUEUES[queue]
+    user = document.user
+    data = {
+        'id': document.id,
+        'number': getattr(document, spec['number']),
+        'status': document.status,
+        'created_at': document.created_at.isoformat() if document.created_at else None,
+        'created_by': f"{user.first_name or ''} {user.last_name or ''}".strip() or user.username if user else None,
+        'line_count': getattr(document, 'line_count', None),
+        'serial_count': getattr(document, 'serial_count', None),
+    }
+    for field in spec['fields']:
+        value = getattr(document, field, None)
+        data[field] = float(value) if field == 'po_total' and value is not None else value
+    return data
+
+
+def ensure_created_at(tables):
+    """Back-fill NULL created_at (from updated_at, else the epoch) and make the column NOT NULL
+
+    A NULL created_at has no place in the (created_at, id) keyset order.
+    SQLite cannot change a column's nullability in place; there the back-fill
+    runs on every migrate and tables created since the model change are
+    NOT NULL already.
+    """
+    dialect = db.engine.dialect.name
+    inspector = db.inspect(db.engine)
+    for table in tables:
+        columns = {column['name']: column for column in inspector.get_columns(table)}
+        if not columns.get('created_at', {}).get('nullable', True):
+            continue
+        fill = "COALESCE(updated_at, '1970-01-01 00:00:00')" if 'updated_at' in columns else "'1970-01-01 00:00:00'"
+        statements = [f"UPDATE {table} SET created_at = {fill} WHERE created_at IS NULL"]
+        if dialect == 'postgresql':
+            statements.append(f"ALTER TABLE {table} ALTER COLUMN created_at SET NOT NULL")
+        elif dialect == 'mysql':
+            statements.append(f"ALTER TABLE {table} MODIFY created_at DATETIME NOT NULL")
+        for sql in statements:
+            try:
+                with db.engine.begin() as conn:
+                    result = conn.execute(db.text(sql))
+                    if sql.startswith('UPDATE') and result.rowcount:
+                        logging.info(f"🕒 Back-filled created_at on {result.rowcount} {table} rows")
+            except Exception as e:
+                logging.warning(f"⚠️ QC queue created_at statement failed ({sql}): {e}")
+
+
+def ensure_indexes():
+    """NOT NULL created_at and a (status, created_at, id) index on every queue table,
+    so each page is an index range scan"""
+    dialect = db.engine.dialect.name
+    tables = sorted({_class(*spec['model']).__tablename__ for spec in QUEUES.values()})
+    ensure_created_at(tables)
+    for table in tables:
+        if dialect == 'mysql':
+            sql = f"CREATE INDEX ix_{table}_qc_queue ON {table} (status, created_at, id)"
+        else:
+            sql = f"CREATE INDEX IF NOT EXISTS ix_{table}_qc_queue ON {table} (status, created_at, id)"
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(db.text(sql))
+        except Exception as e:
+            # MySQL has no IF NOT EXISTS - the index is usually there already
+            logging.debug(f"QC queue index statement skipped ({sql}): {e}")
@@ -9,7 +9,7 @@ from barcode_generator import BarcodeGenerator
 from app import app, db, login_manager
 from models import User, InventoryTransfer, InventoryTransferItem, PickList, PickListItem, \
     InventoryCount, InventoryCountItem, SAPInventoryCount, SAPInventoryCountLine, BarcodeLabel, BinScanningLog, DocumentNumberSeries, QRCodeLabel, PickListLine, \
-    DirectInventoryTransfer, DirectInventoryTransferItem
+    DirectInventoryTransfer, DirectInventoryTransferItem, load_identity
 from modules.grpo.models import GRPODocument, GRPOItem, GRPOSerialNumber, GRPOBatchNumber, PurchaseDeliveryNote
 from modules.multi_grn_creation.models import MultiGRNBatch
 from sap_integration import SAPIntegration
@@ -804,6 +804,16 @@ def get_item_name():
         if not item_code:
             return jsonify({'success': False, 'error': 'Item code required'}), 400
         
+        # Local item master index first - no SAP round trip for known items
+        from sap_integration import local_item
+        indexed = local_item(item_code)
+        if indexed:
+            return jsonify({
+                'success': True,
+                'item_code': indexed.item_code,
+                'item_name': indexed.item_name or f'Item {item_code}'
+            })
+        
         sap = SAPIntegration()
         
         # Try to get item name from SAP B1
@@ -860,9 +870,43 @@ def get_item_name():
         logging.error(f"Error in get_item_name API: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/items/search', methods=['GET'])
+@login_required
+def search_items():
+    """Ranked item type-ahead from the local item master index
+
+    Query parameters: q (part of the code or description), type (serial, batch
+    or none), page (1-based), per_page (max 100)
+    """
+    from models import ItemMaster
+    from sap_integration import ensure_item_index
+
+    query = request.args.get('q', '').strip()
+    item_type = request.args.get('type') or None
+    page = max(1, request.args.get('page', 1, type=int) or 1)
+    per_page = min(max(1, request.args.get('per_page', 20, type=int) or 20), 100)
+
+    if item_type and item_type not in ('serial', 'batch', 'none'):
+        return jsonify({'success': False, 'error': 'type must be serial, batch or none'}), 400
+
+    try:
+        ensure_item_index()
+        items, has_more = ItemMaster.search(query, item_type=item_type, page=page, per_page=per_page)
+    except Exception as e:
+        logging.error(f"❌ Item search failed: {str(e)}")
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+    return jsonify({
+        'success': True,
+        'items': [item.to_dict() for item in items],
+        'page': page,
+        'has_more': has_more
+    })
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return load_identity(int(user_id))
 
 @app.route('/')
 def index():
@@ -2040,29 +2084,20 @@ def qc_dashboard():
         flash('Access denied - QC permissions required', 'error')
         return redirect(url_for('dashboard'))
     
-    # Get pending transfers for QC approval
-    pending_transfers = InventoryTransfer.query.filter_by(status='submitted').order_by(InventoryTransfer.created_at.desc()).all()
-    
-    # Get pending GRPOs for QC approval
-    pending_grpos = GRPODocument.query.filter_by(status='submitted').order_by(GRPODocument.created_at.desc()).all()
-    
-    # Get pending Serial Number Transfers for QC approval
-    from models import SerialNumberTransfer, SerialItemTransfer
-    pending_serial_transfers = SerialNumberTransfer.query.filter_by(status='submitted').order_by(SerialNumberTransfer.created_at.desc()).all()
-    
-    # Get pending Serial Item Transfers for QC approval
-    pending_serial_item_transfers = SerialItemTransfer.query.filter_by(status='submitted').order_by(SerialItemTransfer.created_at.desc()).all()
-    
-    # Get QC approved Serial Item Transfers ready for SAP posting
-    qc_approved_serial_item_transfers = SerialItemTransfer.query.filter_by(status='qc_approved').order_by(SerialItemTransfer.qc_approved_at.desc()).all()
-    
-    # Get pending Direct Inventory Transfers for QC approval
-    from models import DirectInventoryTransfer
-    pending_direct_transfers = DirectInventoryTransfer.query.filter_by(status='submitted').order_by(DirectInventoryTransfer.created_at.desc()).all()
-    
-    # Get pending Sales Deliveries for QC approval
+    # First keyset page of each QC queue; "Load more" fetches the next ones from /api/qc/queues/<queue>
+    import qc_queues
+    queue_pages = {queue: qc_queues.queue_page(queue) for queue in qc_queues.QUEUES}
+    queue_counts = qc_queues.queue_counts()
+    pending_transfers = queue_pages['inventory_transfer'][0]
+    pending_grpos = queue_pages['grpo'][0]
+    pending_serial_transfers = queue_pages['serial_transfer'][0]
+    pending_serial_item_transfers = queue_pages['serial_item_transfer'][0]
+    qc_approved_serial_item_transfers = queue_pages['serial_item_transfer_posting'][0]
+    pending_direct_transfers = queue_pages['direct_inventory_transfer'][0]
+    pending_deliveries = queue_pages['sales_delivery'][0]
+    
+    from models import SerialNumberTransfer, SerialItemTransfer, DirectInventoryTransfer
     from modules.sales_delivery.models import DeliveryDocument
-    pending_deliveries = DeliveryDocument.query.filter_by(status='submitted').order_by(DeliveryDocument.created_at.desc()).all()
     
     # Calculate metrics for today
     from datetime import datetime, date
@@ -2246,11 +2281,90 @@ def qc_dashboard():
                          pending_direct_transfers=pending_direct_transfers,
                          pending_deliveries=pending_deliveries,
                          qc_approved_serial_item_transfers=qc_approved_serial_item_transfers,
-                         pending_count=len(pending_transfers) + len(pending_grpos) + len(pending_serial_transfers) + len(pending_serial_item_transfers) + len(pending_direct_transfers) + len(pending_deliveries),
+                         pending_count=sum(count for queue, count in queue_counts.items() if queue != 'serial_item_transfer_posting'),
+                         queue_counts=queue_counts,
+                         next_cursors={queue: page[1] for queue, page in queue_pages.items()},
                          approved_today=approved_today,
                          rejected_today=rejected_today,
                          avg_processing_time=avg_processing_time)
 
+@app.route('/api/qc/queues')
+@login_required
+def api_qc_queue_counts():
+    """Number of documents waiting in each QC queue"""
+    if not current_user.has_permission('qc_dashboard') and current_user.role not in ['admin', 'manager']:
+        return jsonify({'success': False, 'error': 'QC permissions required'}), 403
+
+    import qc_queues
+    return jsonify({'success': True, 'queues': qc_queues.queue_counts()})
+
+@app.route('/api/qc/queues/<queue>')
+@login_required
+def api_qc_queue_page(queue):
+    """One keyset page of a QC queue, oldest first
+
+    Query params: after (cursor from the previous page), limit, format=html to
+    also get the rows rendered for the QC dashboard tables.
+    """
+    if not current_user.has_permission('qc_dashboard') and current_user.role not in ['admin', 'manager']:
+        return jsonify({'success': False, 'error': 'QC permissions required'}), 403
+
+    import qc_queues
+    if queue not in qc_queues.QUEUES:
+        return jsonify({'success': False, 'error': f'Unknown queue {queue}'}), 404
+
+    try:
+        documents, next_cursor = qc_queues.queue_page(queue, request.args.get('after'), request.args.get('limit'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    result = {
+        'success': True,
+        'queue': queue,
+        'documents': [qc_queues.serialise(queue, document) for document in documents],
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None,
+    }
+    if request.args.get('format') == 'html':
+        result['html'] = render_template('qc_queue_rows.html', queue=queue, documents=documents)
+    return jsonify(result)
+
+@app.route('/api/qc/bulk', methods=['POST'])
+@login_required
+def api_qc_bulk_review():
+    """Approve or reject many documents across types in one request
+
+    Body: {"action": "approve"|"reject", "qc_notes": "...",
+           "documents": [{"type": "grpo", "id": 12, "action"?: ..., "qc_notes"?: ...}, ...]}
+    Status changes are committed together; SAP postings run concurrently.
+    """
+    if not current_user.has_permission('qc_dashboard') and current_user.role not in ['admin', 'manager']:
+        return jsonify({'success': False, 'error': 'QC permissions required'}), 403
+
+    import qc_bulk
+    entries, invalid = qc_bulk.normalise_request(request.get_json(silent=True))
+    if not entries and not invalid:
+        return jsonify({'success': False, 'error': 'No documents to review'}), 400
+    if len(entries) + len(invalid) > qc_bulk.MAX_DOCUMENTS:
+        return jsonify({'success': False,
+                        'error': f'At most {qc_bulk.MAX_DOCUMENTS} documents per request'}), 413
+
+    try:
+        outcomes = qc_bulk.bulk_review(current_user, entries)
+    except Exception as e:
+        logging.error(f"❌ Bulk QC review failed: {str(e)}")
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+    results = [dict({'type': doc_type, 'id': doc_id, 'action': action}, **outcomes[(doc_type, doc_id)])
+               for doc_type, doc_id, action, _ in entries] + invalid
+    counts = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+
+    logging.info(f"📋 Bulk QC review by {current_user.username}: {counts}")
+    return jsonify({'success': True, 'results': results, 'counts': counts})
+
 @app.route('/serial_item_transfer/<int:transfer_id>/qc_approve', methods=['POST'])
 @login_required
 def approve_serial_item_transfer_qc(transfer_id):
@@ -2457,40 +2571,8 @@ def approve_sales_delivery_qc(delivery_id):
             flash('SAP B1 authentication failed. Please try again.', 'error')
             return redirect(url_for('qc_dashboard'))
         
-        document_lines = []
-        for item in delivery.items:
-            line_data = {
-                'BaseType': 17,
-                'BaseEntry': delivery.so_doc_entry,
-                'BaseLine': item.base_line,
-                'ItemCode': item.item_code,
-                'Quantity': item.quantity,
-                'WarehouseCode': item.warehouse_code,
-                'UnitPrice': item.unit_price
-            }
-            
-            if item.batch_required and item.batch_number:
-                line_data['BatchNumbers'] = [{
-                    'BatchNumber': item.batch_number,
-                    'Quantity': item.quantity
-                }]
-            
-            if item.serial_required and item.serial_number:
-                line_data['SerialNumbers'] = [{
-                    'InternalSerialNumber': item.serial_number,
-                    'Quantity': 1
-                }]
-            
-            document_lines.append(line_data)
-        
-        delivery_data = {
-            'CardCode': delivery.card_code,
-            'DocDate': delivery.doc_date.strftime('%Y-%m-%d') if delivery.doc_date else datetime.utcnow().strftime('%Y-%m-%d'),
-            'DocCurrency': delivery.doc_currency or 'INR',
-            'Series': delivery.delivery_series or delivery.so_series,
-            'Comments': delivery.remarks or f'Delivery against SO {delivery.so_doc_num} - QC Approved by {current_user.username}',
-            'DocumentLines': document_lines
-        }
+        from qc_bulk import build_delivery_payload
+        delivery_data = build_delivery_payload(delivery, current_user.username)
         
         result = sap.create_delivery_note(delivery_data)
         
@@ -4808,3 +4890,68 @@ def preview_grpo_json(grpo_id):
         import traceback
         logging.error(f"🔍 Full traceback: {traceback.format_exc()}")
         return jsonify({'success': False, 'error': str(e)})
+
+
+@app.route('/api/sync_offline', methods=['POST'])
+@login_required
+def sync_offline():
+    """Replay scanner actions queued while offline - see offline_sync.py for the action format"""
+    import offline_sync
+
+    actions = offline_sync.normalise_request(request.get_json(silent=True))
+    if not actions:
+        return jsonify({'success': False, 'error': 'No actions to sync'}), 400
+    if len(actions) > offline_sync.MAX_ACTIONS:
+        return jsonify({'success': False,
+                        'error': f'Batch has {len(actions)} actions - send at most {offline_sync.MAX_ACTIONS}'}), 413
+
+    results = offline_sync.replay(current_user, actions)
+    counts = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    logging.info(f"📶 Offline sync by {current_user.username}: {len(actions)} actions {counts}")
+
+    return jsonify({
+        'success': all(r['status'] in ('applied', 'replayed') for r in results),
+        'results': results,
+        'counts': counts
+    })
+
+@app.route('/api/sap-metrics', methods=['GET', 'POST'])
+@login_required
+def sap_metrics():
+    """SAP Service Layer call counters for this worker process, per endpoint and per route (POST resets)"""
+    if not (current_user.role == 'admin' or current_user.has_permission('user_management')):
+        return jsonify({'success': False, 'error': 'Access denied'}), 403
+
+    from sap_instrumentation import recorder
+    if request.method == 'POST':
+        recorder.reset()
+        return jsonify({'success': True, 'message': 'SAP call metrics reset'})
+
+    from sap_integration import lookup_strategies, single_flight
+    from serial_index import serial_index
+    return jsonify({'success': True, **recorder.snapshot(), 'lookup_strategies': lookup_strategies.snapshot(),
+                    'single_flight': single_flight.snapshot(), 'serial_index': serial_index.snapshot()})
+
+
+@app.route('/api/sap-status', methods=['GET'])
+@login_required
+def sap_status():
+    """SAP circuit breaker state of this worker process"""
+    from sap_circuit import breaker
+    status = breaker.snapshot()
+    return jsonify({'success': True, 'online': status['state'] == 'closed' or not status['enabled'], **status})
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint - merges every worker's metrics in multi-process mode"""
+    import os
+    import wms_metrics
+
+    token = os.environ.get('WMS_METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return 'Unauthorized\n', 401, {'Content-Type': 'text/plain; charset=utf-8'}
+
+    return wms_metrics.render_latest(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
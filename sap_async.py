@@ -0,0 +1,230 @@
+"""
+Async SAP Service Layer Client
+asyncio client for call-heavy SAP work (bulk serial validation, pick list bin
+resolution, multi-PO GRN posting) that would otherwise make its requests one
+after another.
+
+Requests go through the same InstrumentedSession as SAPIntegration (so they
+are timed, counted and guarded by the circuit breaker) on a process-wide
+connection pool and thread pool; asyncio drives them and a semaphore bounds
+how many are in flight per client. A client reuses the Service Layer session
+of the SAPIntegration / SAPMultiGRNService it was built from, logs in when it
+has none and logs in again once when SAP answers 401.
+
+Flask routes are synchronous, so fan_out() is the entry point:
+
+    results = fan_out(sap, [('get_bin_location_details', 12), ('get_bin_location_details', 14)])
+
+Environment:
+    SAP_ASYNC_CONCURRENCY - requests in flight per fan_out call (default 8)
+    SAP_ASYNC_POOL_SIZE   - shared HTTP connections / I/O threads per worker process (default 32)
+"""
+
+import os
+import json
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from requests.adapters import HTTPAdapter
+
+from sap_circuit import breaker
+from sap_instrumentation import InstrumentedSession
+
+
+def _env_int(name, default):
+    try:
+        return max(1, int(os.environ.get(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+CONCURRENCY = _env_int('SAP_ASYNC_CONCURRENCY', 8)
+POOL_SIZE = _env_int('SAP_ASYNC_POOL_SIZE', 32)
+
+_shared = {'pid': None, 'executor': None, 'adapter': None}
+_shared_lock = threading.Lock()
+
+
+def _pool():
+    """(executor, adapter) shared by every client in this worker process"""
+    with _shared_lock:
+        if _shared['pid'] != os.getpid():
+            _shared.update(pid=os.getpid(),
+                           executor=ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix='sap-async'),
+                           adapter=HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE))
+        return _shared['executor'], _shared['adapter']
+
+
+def _result(status, text):
+    """{'status', 'ok', 'data', 'text'} plus 'error' for failures"""
+    data = None
+    if text and text[:1] in '{[':
+        try:
+            data = json.loads(text)
+        except ValueError:
+            data = None
+    result = {'status': status, 'ok': 200 <= status < 300, 'data': data, 'text': text}
+    if not result['ok']:
+        message = text or f'HTTP {status}'
+        if isinstance(data, dict) and isinstance(data.get('error'), dict):
+            error = data['error'].get('message')
+            message = error.get('value', message) if isinstance(error, dict) else (error or message)
+        result['error'] = message
+    return result
+
+
+class AsyncSAPClient:
+    """Service Layer client whose calls are coroutines; use inside one event loop"""
+
+    def __init__(self, base_url=None, username=None, password=None, company_db=None,
+                 cookies=None, session_id=None, concurrency=None):
+        self.base_url = base_url if base_url is not None else os.environ.get('SAP_B1_SERVER', '')
+        self.username = username if username is not None else os.environ.get('SAP_B1_USERNAME', '')
+        self.password = password if password is not None else os.environ.get('SAP_B1_PASSWORD', '')
+        self.company_db = company_db if company_db is not None else os.environ.get('SAP_B1_COMPANY_DB', '')
+        self.session_id = session_id
+        self.concurrency = concurrency or CONCURRENCY
+
+        self._executor, adapter = _pool()
+        self.session = InstrumentedSession()
+        self.session.verify = False
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        if cookies:
+            self.session.cookies.update(cookies)
+        self._semaphore = None
+        self._login_lock = None
+
+    @classmethod
+    def from_integration(cls, sap, concurrency=None):
+        """Client sharing the configuration and Service Layer session of a sync SAP client"""
+        return cls(sap.base_url, sap.username, sap.password, sap.company_db,
+                   cookies=sap.session.cookies, session_id=sap.session_id, concurrency=concurrency)
+
+    async def __aenter__(self):
+        # Created here so they belong to the running loop
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._login_lock = asyncio.Lock()
+        return self
+
+    async def __aexit__(self, *exc):
+        # Nothing to close: the session's only adapters are the process-wide pool from _pool(),
+        # and Session.close() would close them under every other client in this process
+        return False
+
+    async def _send(self, method, url, body, timeout):
+        loop = asyncio.get_running_loop()
+
+        def call():
+            response = self.session.request(method, url, json=body, timeout=timeout)
+            return response.status_code, response.text.strip()
+
+        async with self._semaphore:
+            return await loop.run_in_executor(self._executor, call)
+
+    async def login(self):
+        if not all([self.base_url, self.username, self.password, self.company_db]):
+            return False
+        if breaker.is_open():
+            return False
+        try:
+            status, text = await self._send('POST', f"{self.base_url}/b1s/v1/Login",
+                                            {'UserName': self.username, 'Password': self.password,
+                                             'CompanyDB': self.company_db}, 30)
+        except Exception as e:
+            logging.warning(f"SAP B1 async login error: {str(e)}")
+            return False
+        if status != 200:
+            logging.warning(f"SAP B1 async login failed: {text[:200]}")
+            return False
+        self.session_id = (_result(status, text)['data'] or {}).get('SessionId')
+        return True
+
+    async def ensure_logged_in(self, stale_session=None):
+        """Log in when there is no session (or it is still the one SAP just rejected); one login at a time"""
+        if breaker.is_open():
+            return False
+        async with self._login_lock:
+            if self.session_id and self.session_id != stale_session:
+                return True
+            self.session_id = None
+            return await self.login()
+
+    async def request(self, method, path, body=None, timeout=60):
+        """One Service Layer call (path relative to /b1s/v1/); re-logs in once on 401"""
+        if not await self.ensure_logged_in():
+            return dict(_result(0, ''), error='SAP B1 connection unavailable')
+        for attempt in (1, 2):
+            session_id = self.session_id
+            try:
+                status, text = await self._send(method, f"{self.base_url}/b1s/v1/{path}", body, timeout)
+            except Exception as e:
+                return dict(_result(0, ''), error=str(e))
+            if status == 401 and attempt == 1 and await self.ensure_logged_in(stale_session=session_id):
+                continue
+            return _result(status, text)
+
+    async def get(self, path, timeout=60):
+        return await self.request('GET', path, timeout=timeout)
+
+    async def post(self, path, body, timeout=60):
+        return await self.request('POST', path, body, timeout=timeout)
+
+    async def sql_query(self, query_name, params=None, timeout=60):
+        """Rows of a saved SQL query (SQLQueries('<name>')/List)"""
+        body = {'ParamList': params} if params else {}
+        result = await self.post(f"SQLQueries('{query_name}')/List", body, timeout)
+        return (result['data'] or {}).get('value', []) if result['ok'] else []
+
+    async def get_bin_location_details(self, bin_abs_entry):
+        """Mirrors SAPIntegration.get_bin_location_details"""
+        result = await self.get(f"BinLocations?$select=BinCode,Warehouse&$filter=AbsEntry eq {bin_abs_entry}", 30)
+        if not result['ok']:
+            logging.error(f"❌ SAP B1 API error getting bin location: {result['status']}")
+            return {'Warehouse': 'Error', 'BinCode': f'Bin-{bin_abs_entry}', 'AbsEntry': bin_abs_entry}
+        locations = (result['data'] or {}).get('value', [])
+        if not locations:
+            logging.warning(f"⚠️ Bin location not found for AbsEntry {bin_abs_entry}")
+            return {'Warehouse': 'Unknown', 'BinCode': f'Bin-{bin_abs_entry}', 'AbsEntry': bin_abs_entry}
+        return {'Warehouse': locations[0].get('Warehouse', ''), 'BinCode': locations[0].get('BinCode', ''),
+                'AbsEntry': bin_abs_entry}
+
+    async def create_document(self, entity, payload, timeout=60):
+        """POST a new document; {'success', 'doc_entry', 'doc_num', 'response'} or {'success': False, 'error'}"""
+        result = await self.post(entity, payload, timeout)
+        if result['status'] == 201:
+            document = result['data'] or {}
+            return {'success': True, 'doc_entry': document.get('DocEntry'), 'doc_num': document.get('DocNum'),
+                    'response': document}
+        return {'success': False, 'error': result.get('error'), 'status_code': result['status']}
+
+    async def create_purchase_delivery_note(self, grn_data):
+        """Mirrors SAPMultiGRNService.create_purchase_delivery_note"""
+        result = await self.create_document('PurchaseDeliveryNotes', grn_data)
+        if result['success']:
+            logging.info(f"✅ GRN created successfully: DocNum={result['doc_num']}, DocEntry={result['doc_entry']}")
+        else:
+            logging.error(f"❌ Failed to create GRN: {result['error']}")
+        return result
+
+
+def fan_out(sap, calls, concurrency=None):
+    """Run [(client method name, *args)] concurrently from synchronous code
+
+    sap is the SAPIntegration / SAPMultiGRNService whose session is reused (or
+    None for a fresh login). Returns the results in call order; a call that
+    raised returns its exception.
+    """
+    if not calls:
+        return []
+
+    async def main():
+        client = AsyncSAPClient.from_integration(sap, concurrency) if sap is not None \
+            else AsyncSAPClient(concurrency=concurrency)
+        async with client:
+            return await asyncio.gather(*(getattr(client, name)(*args) for name, *args in calls),
+                                        return_exceptions=True)
+
+    return asyncio.run(main())
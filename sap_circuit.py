@@ -0,0 +1,183 @@
+"""
+SAP Circuit Breaker
+Process-wide health state of the SAP B1 Service Layer, shared by every
+SAPIntegration / SAPMultiGRNService instance in the worker.
+
+    closed     calls go to SAP; SAP_CIRCUIT_FAILURES consecutive failures
+               (timeouts, connection errors, HTTP 5xx) open the circuit
+    open       calls fail immediately with SAPUnavailable, so routes fall back
+               to their offline data in milliseconds instead of waiting on
+               login and request timeouts; a background probe checks the
+               server every SAP_CIRCUIT_PROBE_SECONDS
+    half_open  the probe got an answer; one trial call at a time goes to SAP,
+               a success closes the circuit and a failure opens it again
+
+SAP_CIRCUIT_OPEN_SECONDS is the minimum time the circuit stays open before the
+first probe. State is served from /api/sap-status.
+
+Environment:
+    SAP_CIRCUIT_BREAKER        - 0 disables the breaker (default on)
+    SAP_CIRCUIT_FAILURES       - consecutive failures that open the circuit (default 5)
+    SAP_CIRCUIT_OPEN_SECONDS   - time open before probing starts (default 30)
+    SAP_CIRCUIT_PROBE_SECONDS  - interval between health probes while open (default 10)
+    SAP_CIRCUIT_PROBE_TIMEOUT  - timeout of one health probe (default 5)
+"""
+
+import os
+import time
+import logging
+import threading
+
+import requests
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+ENABLED = os.environ.get('SAP_CIRCUIT_BREAKER', '1').lower() not in ('0', 'false', 'no')
+FAILURE_THRESHOLD = max(1, int(_env_float('SAP_CIRCUIT_FAILURES', 5)))
+OPEN_SECONDS = _env_float('SAP_CIRCUIT_OPEN_SECONDS', 30)
+PROBE_SECONDS = _env_float('SAP_CIRCUIT_PROBE_SECONDS', 10)
+PROBE_TIMEOUT = _env_float('SAP_CIRCUIT_PROBE_TIMEOUT', 5)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class SAPUnavailable(requests.exceptions.ConnectionError):
+    """Raised instead of calling SAP while the circuit is open"""
+
+
+class CircuitBreaker:
+
+    def __init__(self, base_url=None):
+        self.base_url = base_url if base_url is not None else os.environ.get('SAP_B1_SERVER', '')
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.last_failure = None
+        self.last_probe = None
+        self.trips = 0
+        self.fast_failures = 0
+        self._trial_started = None
+        self._prober_pid = None
+
+    def is_open(self):
+        """True while calls would be refused (open, or half-open with the trial call busy)"""
+        if not ENABLED:
+            return False
+        with self._lock:
+            return self.state == OPEN or (self.state == HALF_OPEN and self._trial_busy())
+
+    def _trial_busy(self):
+        # A trial that never reported back (killed thread) frees its slot after one probe timeout
+        return self._trial_started is not None and time.time() - self._trial_started < PROBE_TIMEOUT * 6
+
+    def before_call(self, description=''):
+        """Let a call through or raise SAPUnavailable"""
+        if not ENABLED:
+            return
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            if self.state == HALF_OPEN and not self._trial_busy():
+                self._trial_started = time.time()
+                return
+            self.fast_failures += 1
+        self._ensure_prober()
+        raise SAPUnavailable(f"SAP B1 circuit is {self.state}; not calling {description or 'SAP'}")
+
+    def record(self, status):
+        """Outcome of a call that went to SAP: 0 for transport errors, else the HTTP status"""
+        if not ENABLED:
+            return
+        if status and status < 500:
+            self._success()
+        else:
+            self._failure(f"HTTP {status}" if status else 'timeout or connection error')
+
+    def _success(self):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                logging.info("✅ SAP B1 circuit closed - Service Layer is answering again")
+            self.state = CLOSED
+            self.failures = 0
+            self.opened_at = None
+            self._trial_started = None
+
+    def _failure(self, reason):
+        with self._lock:
+            self.failures += 1
+            self.last_failure = {'at': time.time(), 'reason': reason}
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= FAILURE_THRESHOLD):
+                self.state = OPEN
+                self.opened_at = time.time()
+                self._trial_started = None
+                self.trips += 1
+                logging.error(f"🔌 SAP B1 circuit opened after {self.failures} failures ({reason}); "
+                              f"failing fast for at least {OPEN_SECONDS:.0f}s")
+            opened = self.state == OPEN
+        if opened:
+            self._ensure_prober()
+
+    def _ensure_prober(self):
+        """One probe thread per worker process while the circuit is open"""
+        with self._lock:
+            if self.state != OPEN or self._prober_pid == os.getpid():
+                return
+            self._prober_pid = os.getpid()
+        threading.Thread(target=self._probe_loop, name='sap-circuit-probe', daemon=True).start()
+
+    def probe(self):
+        """True when the Service Layer answers at all (any status below 500)"""
+        try:
+            response = requests.get(f"{self.base_url}/b1s/v1/", timeout=PROBE_TIMEOUT, verify=False)
+            healthy = response.status_code < 500
+        except requests.RequestException:
+            healthy = False
+        self.last_probe = {'at': time.time(), 'healthy': healthy}
+        return healthy
+
+    def _probe_loop(self):
+        try:
+            while True:
+                with self._lock:
+                    if self.state != OPEN:
+                        return
+                    wait = max(PROBE_SECONDS, (self.opened_at or 0) + OPEN_SECONDS - time.time())
+                time.sleep(wait)
+                if self.probe():
+                    with self._lock:
+                        if self.state == OPEN:
+                            self.state = HALF_OPEN
+                            self._trial_started = None
+                            logging.info("🔌 SAP B1 health probe succeeded - circuit half-open")
+                    return
+        finally:
+            with self._lock:
+                self._prober_pid = None
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'enabled': ENABLED,
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'failure_threshold': FAILURE_THRESHOLD,
+                'opened_at': self.opened_at,
+                'open_for_seconds': round(time.time() - self.opened_at, 1) if self.opened_at else None,
+                'last_failure': self.last_failure,
+                'last_probe': self.last_probe,
+                'trips': self.trips,
+                'fast_failures': self.fast_failures,
+                'pid': os.getpid(),
+            }
+
+
+breaker = CircuitBreaker()
@@ -0,0 +1,201 @@
+"""
+SAP Service Layer Call Instrumentation
+Times every Service Layer call made through SAPIntegration.session, attaches a
+per-request summary (call count, total SAP time, slowest call) to the Flask
+request and keeps process-wide per-endpoint and per-route counters that are
+served from /api/sap-metrics. Every call also goes through the SAP circuit
+breaker (sap_circuit.py).
+
+Environment:
+    SAP_SLOW_CALL_MS   - log a warning for single calls slower than this (default 1000)
+    SAP_FANOUT_WARN    - log a warning for requests making more calls than this (default 25)
+"""
+
+import os
+import re
+import time
+import logging
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from flask import g, has_request_context, request
+
+from sap_circuit import breaker
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+SLOW_CALL_MS = _env_float('SAP_SLOW_CALL_MS', 1000)
+FANOUT_WARN = int(_env_float('SAP_FANOUT_WARN', 25))
+
+_KEY_PATTERN = re.compile(r"\([^)]*\)")
+
+
+def normalize_endpoint(url):
+    """Reduce a Service Layer URL to a low-cardinality endpoint name
+
+    https://host:50000/b1s/v1/Items('A001')?$select=...  ->  Items()
+    .../SQLQueries('Item_Validation')/List               ->  SQLQueries('Item_Validation')/List
+    """
+    path = urlsplit(url).path
+    if '/b1s/v1/' in path:
+        path = path.split('/b1s/v1/', 1)[1]
+    if path.startswith('SQLQueries('):
+        return path
+    return _KEY_PATTERN.sub('()', path) or '/'
+
+
+class SAPCallRecorder:
+    """Thread-safe process-wide counters for SAP calls, grouped by endpoint and by route"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.endpoints = {}
+            self.routes = {}
+            self.started_at = time.time()
+
+    def record_call(self, method, endpoint, status, nbytes, duration_ms):
+        key = f"{method} {endpoint}"
+        with self._lock:
+            stats = self.endpoints.get(key)
+            if stats is None:
+                stats = self.endpoints[key] = {'count': 0, 'errors': 0, 'total_ms': 0.0,
+                                               'max_ms': 0.0, 'bytes': 0}
+            stats['count'] += 1
+            stats['total_ms'] += duration_ms
+            stats['max_ms'] = max(stats['max_ms'], duration_ms)
+            stats['bytes'] += nbytes
+            if not status or status >= 400:
+                stats['errors'] += 1
+
+    def record_request(self, route, summary):
+        with self._lock:
+            stats = self.routes.get(route)
+            if stats is None:
+                stats = self.routes[route] = {'requests': 0, 'sap_calls': 0, 'sap_ms': 0.0,
+                                              'max_calls': 0, 'max_sap_ms': 0.0}
+            stats['requests'] += 1
+            stats['sap_calls'] += summary['count']
+            stats['sap_ms'] += summary['total_ms']
+            stats['max_calls'] = max(stats['max_calls'], summary['count'])
+            stats['max_sap_ms'] = max(stats['max_sap_ms'], summary['total_ms'])
+
+    def snapshot(self):
+        """Copy of the counters with averages, sorted by total SAP time"""
+        with self._lock:
+            endpoints = {k: dict(v) for k, v in self.endpoints.items()}
+            routes = {k: dict(v) for k, v in self.routes.items()}
+            started_at = self.started_at
+
+        for stats in endpoints.values():
+            stats['avg_ms'] = round(stats['total_ms'] / stats['count'], 2) if stats['count'] else 0.0
+            stats['total_ms'] = round(stats['total_ms'], 2)
+            stats['max_ms'] = round(stats['max_ms'], 2)
+        for stats in routes.values():
+            stats['avg_calls'] = round(stats['sap_calls'] / stats['requests'], 2) if stats['requests'] else 0.0
+            stats['avg_sap_ms'] = round(stats['sap_ms'] / stats['requests'], 2) if stats['requests'] else 0.0
+            stats['sap_ms'] = round(stats['sap_ms'], 2)
+            stats['max_sap_ms'] = round(stats['max_sap_ms'], 2)
+
+        return {
+            'pid': os.getpid(),
+            'since': started_at,
+            'endpoints': dict(sorted(endpoints.items(), key=lambda kv: -kv[1]['total_ms'])),
+            'routes': dict(sorted(routes.items(), key=lambda kv: -kv[1]['sap_ms'])),
+        }
+
+
+recorder = SAPCallRecorder()
+
+# Extra callbacks (method, endpoint, status, bytes, duration_ms) - used by wms_metrics
+_listeners = []
+
+
+def add_listener(callback):
+    if callback not in _listeners:
+        _listeners.append(callback)
+
+
+class InstrumentedSession(requests.Session):
+    """requests.Session that times each call and reports it to the recorder"""
+
+    def request(self, method, url, *args, **kwargs):
+        endpoint = normalize_endpoint(url)
+        # Raises SAPUnavailable while the circuit is open - routes fall back without waiting on timeouts
+        breaker.before_call(f"{method.upper()} {endpoint}")
+        status = 0
+        nbytes = 0
+        start = time.perf_counter()
+        try:
+            response = super().request(method, url, *args, **kwargs)
+            status = response.status_code
+            nbytes = len(response.content or b'')
+            return response
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000.0
+            breaker.record(status)
+            _record(method.upper(), endpoint, status, nbytes, duration_ms)
+
+
+def _record(method, endpoint, status, nbytes, duration_ms):
+    recorder.record_call(method, endpoint, status, nbytes, duration_ms)
+    for listener in _listeners:
+        listener(method, endpoint, status, nbytes, duration_ms)
+
+    if duration_ms >= SLOW_CALL_MS:
+        route = request.endpoint if has_request_context() else None
+        logging.warning(f"🐢 Slow SAP call {method} {endpoint} took {duration_ms:.0f} ms "
+                        f"(status {status or 'error'}, route {route or '-'})")
+
+    if has_request_context():
+        calls = g.get('sap_calls')
+        if calls is None:
+            calls = g.sap_calls = []
+        calls.append({'method': method, 'endpoint': endpoint, 'status': status,
+                      'bytes': nbytes, 'duration_ms': round(duration_ms, 2)})
+
+
+def request_summary():
+    """Summary of the SAP calls made so far while handling the current request"""
+    calls = (g.get('sap_calls') or []) if has_request_context() else []
+    slowest = max(calls, key=lambda c: c['duration_ms']) if calls else None
+    return {
+        'count': len(calls),
+        'total_ms': round(sum(c['duration_ms'] for c in calls), 2),
+        'bytes': sum(c['bytes'] for c in calls),
+        'slowest': slowest,
+    }
+
+
+def init_app(app):
+    """Attach the per-request summary to every response that called SAP"""
+
+    @app.after_request
+    def attach_sap_summary(response):
+        if not g.get('sap_calls'):
+            return response
+
+        summary = request_summary()
+        g.sap_summary = summary
+        route = request.endpoint or request.path
+        recorder.record_request(route, summary)
+
+        response.headers['X-SAP-Calls'] = str(summary['count'])
+        response.headers['X-SAP-Time-Ms'] = f"{summary['total_ms']:.0f}"
+        response.headers.add('Server-Timing', f'sap;dur={summary["total_ms"]:.1f};desc="{summary["count"]} calls"')
+
+        if summary['count'] > FANOUT_WARN:
+            slowest = summary['slowest']
+            logging.warning(f"📡 {route} made {summary['count']} SAP calls ({summary['total_ms']:.0f} ms), "
+                            f"slowest {slowest['method']} {slowest['endpoint']} {slowest['duration_ms']:.0f} ms")
+        return response
@@ -3,12 +3,379 @@ import json
 import logging
 import os
 from datetime import datetime
+import time
+import threading
 import urllib.parse
+import re
+import uuid
+import copy
+import functools
 import urllib3
+from sap_instrumentation import InstrumentedSession
+from sap_circuit import breaker
+from serial_index import serial_index
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 
+class LookupStrategyUnavailable(Exception):
+    """A lookup method is not available on this SAP B1 company (e.g. SQL query not created)"""
+
+
+class LookupStrategyCache:
+    """Remembers which method of a multi-fallback lookup works for each company DB.
+
+    Lookups such as get_so_series try a SQL query, then the v2 Series endpoint,
+    then scanning recent documents. Once a method works it is tried first and
+    the known-failing ones are skipped until SAP_STRATEGY_REPROBE_SECONDS
+    (default 900) have passed or the remembered method fails.
+    """
+
+    def __init__(self, reprobe_seconds=None):
+        if reprobe_seconds is None:
+            try:
+                reprobe_seconds = float(os.environ.get('SAP_STRATEGY_REPROBE_SECONDS', 900))
+            except ValueError:
+                reprobe_seconds = 900
+        self.reprobe_seconds = reprobe_seconds
+        self._lock = threading.Lock()
+        self._working = {}
+
+    def order(self, company_db, lookup, strategies):
+        """Strategies to try: only the remembered one while fresh, otherwise all in preferred order"""
+        with self._lock:
+            entry = self._working.get((company_db, lookup))
+            if entry and time.time() - entry[1] >= self.reprobe_seconds:
+                # Expired - probe again from the preferred method
+                del self._working[(company_db, lookup)]
+                entry = None
+        if entry:
+            remembered = [s for s in strategies if s[0] == entry[0]]
+            if remembered:
+                return remembered + [s for s in strategies if s[0] != entry[0]]
+        return list(strategies)
+
+    def succeeded(self, company_db, lookup, method):
+        with self._lock:
+            entry = self._working.get((company_db, lookup))
+            # Keep the original timestamp so the preferred methods get re-probed on schedule
+            if not entry or entry[0] != method:
+                self._working[(company_db, lookup)] = (method, time.time())
+
+    def failed(self, company_db, lookup, method):
+        with self._lock:
+            entry = self._working.get((company_db, lookup))
+            if entry and entry[0] == method:
+                del self._working[(company_db, lookup)]
+
+    def snapshot(self):
+        with self._lock:
+            return {f"{db}:{lookup}": {'method': method, 'age_seconds': round(time.time() - at)}
+                    for (db, lookup), (method, at) in self._working.items()}
+
+
+lookup_strategies = LookupStrategyCache()
+
+
+class _Flight:
+    __slots__ = ('event', 'result', 'error', 'done', 'waiters')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.done = False
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Shares one in-flight SAP read between identical concurrent callers.
+
+    The first caller of a key runs the call; callers arriving while it runs
+    wait for it and get a deep copy of its result (or its exception) instead of
+    sending the same Service Layer request again. Nothing is cached: the next
+    call after completion goes to SAP. A waiter that has waited
+    SAP_SINGLE_FLIGHT_WAIT_SECONDS (default 60) runs the call itself.
+    SAP_SINGLE_FLIGHT=0 turns coalescing off.
+    """
+
+    def __init__(self, wait_seconds=None):
+        if wait_seconds is None:
+            try:
+                wait_seconds = float(os.environ.get('SAP_SINGLE_FLIGHT_WAIT_SECONDS', 60))
+            except ValueError:
+                wait_seconds = 60
+        self.wait_seconds = wait_seconds
+        self.enabled = os.environ.get('SAP_SINGLE_FLIGHT', '1').lower() not in ('0', 'false', 'no')
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._stats = {}
+
+    def _count(self, name, field):
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = {'calls': 0, 'shared': 0, 'timeouts': 0}
+        stats[field] += 1
+
+    def do(self, key, fn):
+        if not self.enabled:
+            return fn()
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self._count(key[0], 'calls')
+            else:
+                flight.waiters += 1
+                self._count(key[0], 'shared')
+
+        if not leader:
+            if not flight.event.wait(self.wait_seconds):
+                with self._lock:
+                    self._count(key[0], 'timeouts')
+                return fn()
+            if flight.error is not None:
+                raise flight.error
+            return copy.deepcopy(flight.result)
+
+        result, error = None, None
+        try:
+            result = fn()
+            return result
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+                waiters = flight.waiters
+            if waiters:
+                # Waiters copy from a private snapshot so the leader's caller may mutate its result
+                flight.result = copy.deepcopy(result) if error is None else None
+                flight.error = error
+            flight.done = True
+            flight.event.set()
+
+    def snapshot(self):
+        with self._lock:
+            return {'enabled': self.enabled, 'in_flight': len(self._flights),
+                    'lookups': {name: dict(stats) for name, stats in self._stats.items()}}
+
+
+single_flight = SingleFlight()
+
+
+def coalesced(method):
+    """Run a read-only SAPIntegration method through single_flight, keyed by server, company and arguments"""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = (method.__name__, self.base_url, self.company_db, args, tuple(sorted(kwargs.items())))
+        return single_flight.do(key, lambda: method(self, *args, **kwargs))
+
+    return wrapper
+
+_index_refresh_locks = {}
+_index_failed_syncs = {}  # table name -> time of the last initial sync that left the index empty
+INDEX_RETRY_SECONDS = 60
+
+
+def _ensure_master_index(model, sync_method, max_age_env, app=None):
+    """Make sure a local master data index has data and is reasonably fresh
+
+    Never waits on SAP: an empty index starts the initial sync in a background
+    thread and the caller falls back to its empty-index behaviour at once.
+    While that sync runs, while the SAP circuit is open, or within
+    INDEX_RETRY_SECONDS of a failed initial sync nothing new is started.
+    Afterwards a sync older than max_age_env minutes (default 60) is refreshed
+    the same way while searches keep being served from the existing rows.
+    The table itself is created by flask migrate, not here.
+    """
+    from flask import current_app
+
+    app = app or current_app._get_current_object()
+    table = model.__tablename__
+    lock = _index_refresh_locks.setdefault(table, threading.Lock())
+    last_synced = model.last_synced()
+
+    if last_synced is None:
+        if breaker.is_open() or time.time() - _index_failed_syncs.get(table, 0) < INDEX_RETRY_SECONDS:
+            return
+    else:
+        try:
+            max_age = float(os.environ.get(max_age_env, 60))
+        except ValueError:
+            max_age = 60
+        if (datetime.utcnow() - last_synced).total_seconds() < max_age * 60:
+            return
+    if not lock.acquire(blocking=False):
+        return  # a sync is already running in this process
+
+    def refresh():
+        try:
+            with app.app_context():
+                try:
+                    getattr(SAPIntegration(), sync_method)()
+                except Exception as e:
+                    logging.error(f"❌ {table} sync failed: {str(e)}")
+                finally:
+                    if last_synced is None and model.last_synced() is None:
+                        _index_failed_syncs[table] = time.time()
+        finally:
+            lock.release()
+
+    threading.Thread(target=refresh, name=f'{table}-refresh', daemon=True).start()
+
+
+def ensure_business_partner_index(app=None):
+    """Local business partner index, refreshed after BP_SYNC_MAX_AGE_MINUTES"""
+    from models import BusinessPartner
+    _ensure_master_index(BusinessPartner, 'sync_business_partners', 'BP_SYNC_MAX_AGE_MINUTES', app)
+
+
+def ensure_item_index(app=None):
+    """Local item master index, refreshed after ITEM_SYNC_MAX_AGE_MINUTES"""
+    from models import ItemMaster
+    _ensure_master_index(ItemMaster, 'sync_items', 'ITEM_SYNC_MAX_AGE_MINUTES', app)
+
+
+def local_item(item_code):
+    """Active ItemMaster row of an exact item code from the local index, or None to ask SAP"""
+    from flask import has_app_context
+
+    if not item_code or not has_app_context():
+        return None
+    try:
+        from models import ItemMaster
+        item = ItemMaster.get_by_code(item_code)
+        # Inactive, frozen or deleted items are left to SAP, which says why they cannot be used
+        return item if item is not None and item.is_active else None
+    except Exception as e:
+        from app import db
+        logging.warning(f"⚠️ Item index lookup failed for {item_code}: {str(e)}")
+        db.session.rollback()
+        return None
+
+
+# OData $batch: several Service Layer requests in one multipart/mixed round trip.
+# SAP_BATCH_MAX_REQUESTS caps the requests per $batch call (default 50).
+try:
+    BATCH_MAX_REQUESTS = max(1, int(os.environ.get('SAP_BATCH_MAX_REQUESTS', 50)))
+except ValueError:
+    BATCH_MAX_REQUESTS = 50
+
+# Service Layer servers that answered $batch with "not supported"
+_batch_unsupported = set()
+
+_BOUNDARY_PATTERN = re.compile(r'boundary="?([^";]+)"?', re.IGNORECASE)
+_URL_SAFE = "/?&=$(),'*:;@!+-._~%"
+
+
+def _is_changeset(operation):
+    """A list of requests is a changeset; a request is a (method, path[, body[, headers]]) tuple"""
+    return isinstance(operation, list)
+
+
+def _http_part(method, path, body=None, headers=None, content_id=None):
+    """One application/http MIME part of a $batch body"""
+    lines = ['Content-Type: application/http', 'Content-Transfer-Encoding: binary']
+    if content_id is not None:
+        lines.append(f'Content-ID: {content_id}')
+    lines += ['', f'{method.upper()} /b1s/v1/{urllib.parse.quote(path, safe=_URL_SAFE)} HTTP/1.1']
+    for name, value in (headers or {}).items():
+        lines.append(f'{name}: {value}')
+    if body is not None:
+        lines += ['Content-Type: application/json', '', json.dumps(body, default=str)]
+    else:
+        lines.append('')
+    return '\r\n'.join(lines) + '\r\n'
+
+
+def build_batch_body(operations, boundary):
+    """multipart/mixed $batch body for a list of requests and changesets"""
+    chunks = []
+    for index, operation in enumerate(operations):
+        chunks.append(f'--{boundary}\r\n')
+        if _is_changeset(operation):
+            changeset = f'changeset_{boundary}_{index}'
+            chunks.append(f'Content-Type: multipart/mixed; boundary={changeset}\r\n\r\n')
+            for content_id, request in enumerate(operation, 1):
+                chunks.append(f'--{changeset}\r\n')
+                chunks.append(_http_part(*request, content_id=content_id))
+            chunks.append(f'--{changeset}--\r\n')
+        else:
+            chunks.append(_http_part(*operation))
+    chunks.append(f'--{boundary}--\r\n')
+    return ''.join(chunks).encode('utf-8')
+
+
+def _split_head(block):
+    """(header lines, rest) of a MIME part or an embedded HTTP message"""
+    for separator in (b'\r\n\r\n', b'\n\n'):
+        position = block.find(separator)
+        if position != -1:
+            head, rest = block[:position], block[position + len(separator):]
+            break
+    else:
+        head, rest = block, b''
+    return head.decode('utf-8', 'replace').splitlines(), rest
+
+
+def _header_dict(lines):
+    headers = {}
+    for line in lines:
+        name, sep, value = line.partition(':')
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return headers
+
+
+def _batch_result(status, headers, text):
+    """Result dict of one $batch sub-request (or of a plain response, for the fallbacks)"""
+    data = None
+    if text and text[:1] in '{[':
+        try:
+            data = json.loads(text)
+        except ValueError:
+            data = None
+    result = {'status': status, 'ok': 200 <= status < 300, 'headers': headers, 'data': data, 'text': text}
+    if not result['ok']:
+        message = text or f'HTTP {status}'
+        if isinstance(data, dict) and isinstance(data.get('error'), dict):
+            error = data['error'].get('message')
+            message = error.get('value', message) if isinstance(error, dict) else (error or message)
+        result['error'] = message
+    return result
+
+
+def _parse_http_message(block):
+    lines, body = _split_head(block)
+    status_line = lines[0].split() if lines else []
+    try:
+        status = int(status_line[1])
+    except (IndexError, ValueError):
+        status = 0
+    return _batch_result(status, _header_dict(lines[1:]), body.decode('utf-8', 'replace').strip())
+
+
+def parse_batch_response(content, boundary):
+    """Parts of a $batch response: a result dict per request, a list of them per changeset"""
+    parts = []
+    for chunk in content.split(b'--' + boundary.encode())[1:]:
+        if chunk.startswith(b'--'):
+            break
+        lines, rest = _split_head(chunk.strip(b'\r\n'))
+        content_type = _header_dict(lines).get('content-type', '')
+        match = _BOUNDARY_PATTERN.search(content_type)
+        if content_type.lower().startswith('multipart/mixed') and match:
+            parts.append(parse_batch_response(rest, match.group(1)))
+        else:
+            parts.append(_parse_http_message(rest))
+    return parts
+
+
 class SAPIntegration:
 
     def __init__(self):
@@ -18,7 +385,7 @@ class SAPIntegration:
         self.password = os.environ.get('SAP_B1_PASSWORD', '')
         self.company_db = os.environ.get('SAP_B1_COMPANY_DB', '')
         self.session_id = None
-        self.session = requests.Session()
+        self.session = InstrumentedSession()
         self.session.verify = False  # For development, in production use proper SSL
         self.is_offline = False
 
@@ -37,6 +404,9 @@ class SAPIntegration:
             logging.warning(
                 "SAP B1 configuration not complete. Running in offline mode.")
             return False
+        if breaker.is_open():
+            self.is_offline = True
+            return False
 
         login_url = f"{self.base_url}/b1s/v1/Login"
         login_data = {
@@ -66,12 +436,138 @@ class SAPIntegration:
 
     def ensure_logged_in(self):
         """Ensure we have a valid session"""
+        # Fail fast while the SAP circuit is open instead of waiting on the login timeout
+        self.is_offline = breaker.is_open()
+        if self.is_offline:
+            return False
         if not self.session_id:
             return self.login()
         return True
 
+    def sibling(self):
+        """New instance sharing this one's Service Layer login, for use on another thread"""
+        other = SAPIntegration()
+        other.base_url, other.username, other.password, other.company_db = \
+            self.base_url, self.username, self.password, self.company_db
+        other.session.cookies.update(self.session.cookies)
+        other.session_id = self.session_id
+        return other
+
+    def batch(self, operations, timeout=60):
+        """Send several Service Layer requests in one $batch round trip
+
+        Each operation is a request tuple (method, path[, body[, headers]]) with
+        path relative to /b1s/v1/, or a list of request tuples forming a
+        changeset that SAP applies atomically. Returns a list shaped like
+        operations: a result dict ({'status', 'ok', 'headers', 'data', 'text'}
+        plus 'error' on failure) per request and a list of them per changeset.
+        When a changeset is rolled back every request in it carries SAP's error.
+        Returns None when the $batch call itself failed; callers then fall back
+        to individual requests.
+        """
+        if not operations:
+            return []
+        if self.base_url in _batch_unsupported or not self.ensure_logged_in():
+            return None
+
+        boundary = f'batch_{uuid.uuid4()}'
+        try:
+            response = self.session.post(f"{self.base_url}/b1s/v1/$batch",
+                                         data=build_batch_body(operations, boundary),
+                                         headers={'Content-Type': f'multipart/mixed; boundary={boundary}'},
+                                         timeout=timeout)
+        except Exception as e:
+            logging.warning(f"⚠️ SAP $batch call failed: {e}")
+            return None
+
+        if response.status_code in (404, 405, 501):
+            logging.warning(f"⚠️ SAP Service Layer does not accept $batch ({response.status_code}), "
+                            f"using individual requests")
+            _batch_unsupported.add(self.base_url)
+            return None
+        match = _BOUNDARY_PATTERN.search(response.headers.get('Content-Type', ''))
+        if response.status_code not in (200, 202) or not match:
+            logging.warning(f"⚠️ SAP $batch call returned {response.status_code}: {response.text[:200]}")
+            return None
+
+        parts = parse_batch_response(response.content, match.group(1))
+        missing = _batch_result(0, {}, 'No response for this request in the $batch reply')
+        results = []
+        for index, operation in enumerate(operations):
+            part = parts[index] if index < len(parts) else missing
+            if _is_changeset(operation):
+                if isinstance(part, list) and len(part) == len(operation):
+                    results.append(part)
+                else:
+                    # A failed changeset is answered with a single error for the whole set
+                    failure = part if isinstance(part, dict) else missing
+                    results.append([failure] * len(operation))
+            else:
+                results.append(part if isinstance(part, dict) else missing)
+        return results
+
+    def _single_request(self, method, path, body=None, headers=None, timeout=60):
+        """One request outside $batch, returned as a batch() result dict"""
+        try:
+            response = self.session.request(method, f"{self.base_url}/b1s/v1/{path}",
+                                            json=body, headers=headers, timeout=timeout)
+            return _batch_result(response.status_code, {k.lower(): v for k, v in response.headers.items()},
+                                 response.text.strip())
+        except Exception as e:
+            return dict(_batch_result(0, {}, ''), error=str(e))
+
+    def batch_get(self, paths, headers=None):
+        """GET several paths in as few round trips as possible
+
+        Paths go out BATCH_MAX_REQUESTS at a time as $batch calls; when $batch
+        is unavailable each path is fetched on its own. Returns one batch()
+        result dict per path, in order.
+        """
+        results = []
+        for start in range(0, len(paths), BATCH_MAX_REQUESTS):
+            chunk = paths[start:start + BATCH_MAX_REQUESTS]
+            batched = self.batch([('GET', path, None, headers) for path in chunk]) if len(chunk) > 1 else None
+            if batched is None:
+                batched = [self._single_request('GET', path, headers=headers) for path in chunk]
+            results.extend(batched)
+        return results
+
+    def post_changeset(self, posts):
+        """Create several documents atomically: all of them or none
+
+        posts is a list of (entity, payload) pairs such as ('DeliveryNotes', {...}).
+        Returns {'success', 'results', 'error'} where results holds one batch()
+        result dict per post (the created document is in result['data']).
+        """
+        results = self.batch([[('POST', entity, payload) for entity, payload in posts]])
+        if results is None:
+            return {'success': False, 'results': [], 'error': 'SAP $batch request failed'}
+        results = results[0]
+        failed = next((r for r in results if not r['ok']), None)
+        return {'success': failed is None, 'results': results,
+                'error': failed.get('error') if failed else None}
+
+    @coalesced
     def validate_item_code(self, item_code):
-        """Validate ItemCode and get BatchNum, SerialNum, and NonBatch_NonSerialMethod from SAP B1"""
+        """Validate ItemCode and get BatchNum, SerialNum, and NonBatch_NonSerialMethod from SAP B1
+
+        Items already in the local item master index are answered from it.
+        """
+        item = local_item(item_code)
+        if item is not None:
+            batch_num = 'Y' if item.batch_managed else 'N'
+            serial_num = 'Y' if item.serial_managed else 'N'
+            return {
+                'success': True,
+                'item_code': item.item_code,
+                'batch_required': item.batch_managed,
+                'serial_required': item.serial_managed,
+                'manage_method': item.manage_method or 'N',
+                'batch_num': batch_num,
+                'serial_num': serial_num,
+                'source': 'item_index'
+            }
+
         if not self.ensure_logged_in():
             logging.warning("SAP B1 not available, returning default validation for ItemCode")
             return {
@@ -225,10 +721,11 @@ class SAPIntegration:
                 f"❌ Error getting inventory transfer request: {str(e)}")
             return None
 
+    @coalesced
     def get_bins(self, warehouse_code):
         """Get bins for a specific warehouse"""
         if not self.ensure_logged_in():
-            return []
+            return self._get_local_bins(warehouse_code) if self.is_offline else []
 
         try:
             url = f"{self.base_url}/b1s/v1/BinLocations?$filter=Warehouse eq '{warehouse_code}'"
@@ -260,6 +757,19 @@ class SAPIntegration:
             logging.error(f"Error getting bins: {str(e)}")
             return []
 
+    def _get_local_bins(self, warehouse_code):
+        """Bins of a warehouse from the local bin_locations table, used while SAP is unreachable"""
+        try:
+            from models import BinLocation
+            rows = BinLocation.query.filter_by(warehouse_code=warehouse_code, is_active=True) \
+                .order_by(BinLocation.bin_code).all()
+            logging.info(f"📦 SAP B1 offline - serving {len(rows)} bins of {warehouse_code} from the local table")
+            return [{'BinCode': row.bin_code, 'Description': row.description or row.bin_name or '',
+                     'Warehouse': row.warehouse_code, 'Active': 'Y'} for row in rows]
+        except Exception as e:
+            logging.error(f"Error reading local bins for {warehouse_code}: {str(e)}")
+            return []
+
     def get_purchase_order(self, po_number):
         """Get purchase order details from SAP B1"""
         if not self.ensure_logged_in():
@@ -286,28 +796,57 @@ class SAPIntegration:
 
             }
 
+    def _run_lookup(self, lookup, strategies, default):
+        """Run a multi-fallback lookup, starting with the method remembered for this company DB
+
+        strategies is a list of (method name, callable); a callable raises
+        LookupStrategyUnavailable (or any error) to fall through to the next one.
+        """
+        for method, func in lookup_strategies.order(self.company_db, lookup, strategies):
+            try:
+                result = func()
+            except LookupStrategyUnavailable as e:
+                logging.info(f"{lookup}: {method} not available ({e}), trying next method")
+                lookup_strategies.failed(self.company_db, lookup, method)
+                continue
+            except Exception as e:
+                logging.debug(f"{lookup}: {method} failed: {str(e)}, trying next method")
+                lookup_strategies.failed(self.company_db, lookup, method)
+                continue
+            lookup_strategies.succeeded(self.company_db, lookup, method)
+            return result
+
+        logging.error(f"❌ {lookup}: no lookup method succeeded")
+        return default
+
+    def _sql_query_rows(self, query_name, payload=None):
+        """Rows of a SAP B1 SQLQueries(...)/List call; raises LookupStrategyUnavailable on HTTP errors"""
+        url = f"{self.base_url}/b1s/v1/SQLQueries('{query_name}')/List"
+        response = self.session.post(url, json=payload, timeout=30)
+        if response.status_code != 200:
+            raise LookupStrategyUnavailable(f"SQL query {query_name}: {response.status_code}")
+        return response.json().get('value', [])
+
+    def _series_v2_rows(self, object_code):
+        """Document series for an object code from the v2 Series endpoint"""
+        url = f"{self.base_url}/b1s/v2/Series?$filter=ObjectCode eq '{object_code}'&$select=Series,SeriesName"
+        response = self.session.get(url, timeout=30)
+        if response.status_code != 200:
+            raise LookupStrategyUnavailable(f"v2 Series: {response.status_code}")
+        return response.json().get('value', [])
+
     def get_po_series(self):
-        """Get PO series from SAP B1 using SQLQueries"""
+        """Get PO series from SAP B1 - SQL query Get_PO_Series, falling back to the v2 Series endpoint"""
         if not self.ensure_logged_in():
             logging.warning("SAP B1 not available, returning empty series list")
             return []
 
-        try:
-            url = f"{self.base_url}/b1s/v1/SQLQueries('Get_PO_Series')/List"
-            response = self.session.post(url, timeout=30)
-            
-            if response.status_code == 200:
-                data = response.json()
-                series_list = data.get('value', [])
-                logging.info(f"✅ Retrieved {len(series_list)} PO series from SAP")
-                return series_list
-            else:
-                logging.warning(f"Failed to get PO series: {response.status_code} - {response.text}")
-                return []
-                
-        except Exception as e:
-            logging.error(f"Error fetching PO series: {str(e)}")
-            return []
+        series_list = self._run_lookup('po_series', [
+            ('sql_query', lambda: self._sql_query_rows('Get_PO_Series')),
+            ('series_v2', lambda: self._series_v2_rows('22')),
+        ], default=[])
+        logging.info(f"✅ Retrieved {len(series_list)} PO series from SAP")
+        return series_list
 
     def get_po_doc_entry(self, series, doc_num):
         """Get DocEntry from SAP B1 using series and document number"""
@@ -440,89 +979,38 @@ class SAPIntegration:
             logging.warning("SAP B1 not available, returning empty series list")
             return []
 
-        # Try Method 1: SQL Query Get_SO_Series (preferred - uses custom SAP query)
-        try:
-            url_sql = f"{self.base_url}/b1s/v1/SQLQueries('Get_SO_Series')/List"
-            logging.debug(f"🔍 Attempting SQL query Get_SO_Series: {url_sql}")
-            
-            response = self.session.post(url_sql, json={}, timeout=30)
-            
-            if response.status_code == 200:
-                data = response.json()
-                series_data = data.get('value', [])
-                
-                series_list = [
-                    {
-                        'Series': item.get('Series'),
-                        'Name': item.get('SeriesName', f"Series {item.get('Series')}")
-                    }
-                    for item in series_data
-                ]
-                
-                logging.info(f"✅ Retrieved {len(series_list)} SO series from SAP (SQL Query)")
-                return series_list
-            else:
-                logging.info(f"SQL query Get_SO_Series not available ({response.status_code}), trying fallback methods")
-                
-        except Exception as e:
-            logging.debug(f"SQL query Get_SO_Series failed: {str(e)}, trying fallback")
+        def as_series_list(rows):
+            return [
+                {
+                    'Series': item.get('Series'),
+                    'Name': item.get('SeriesName', f"Series {item.get('Series')}")
+                }
+                for item in rows
+            ]
 
-        # Try Method 2: v2 Series endpoint
-        try:
-            url_v2 = f"{self.base_url}/b1s/v2/Series?$filter=ObjectCode eq '17'&$select=Series,SeriesName"
-            logging.debug(f"Attempting v2 Series endpoint: {url_v2}")
-            
-            response = self.session.get(url_v2, timeout=30)
-            
-            if response.status_code == 200:
-                data = response.json()
-                series_data = data.get('value', [])
-                
-                series_list = [
-                    {
-                        'Series': item.get('Series'),
-                        'Name': item.get('SeriesName', f"Series {item.get('Series')}")
-                    }
-                    for item in series_data
-                ]
-                
-                logging.info(f"✅ Retrieved {len(series_list)} SO series from SAP (v2 API)")
-                return series_list
-            else:
-                logging.info(f"v2 Series endpoint not available ({response.status_code}), trying final fallback")
-                
-        except Exception as e:
-            logging.debug(f"v2 Series endpoint failed: {str(e)}, trying final fallback")
-        
-        # Fallback Method 3: Query v1 Orders to extract series (works but limited to recent orders)
-        try:
+        def via_recent_orders():
+            # Works but limited to recent orders
             url_v1 = f"{self.base_url}/b1s/v1/Orders?$select=Series&$top=200&$orderby=DocEntry desc"
-            logging.debug(f"Using fallback v1 Orders query: {url_v1}")
-            
             response = self.session.get(url_v1, timeout=30)
-            
-            if response.status_code == 200:
-                data = response.json()
-                orders = data.get('value', [])
-                
-                # Extract unique series
-                series_set = set()
-                for order in orders:
-                    if 'Series' in order and order['Series'] is not None:
-                        series_set.add(order['Series'])
-                
-                # Convert to list of dicts
-                series_list = [{'Series': s, 'Name': f'Series {s}'} for s in sorted(series_set)]
-                
-                logging.warning(f"⚠️ Retrieved {len(series_list)} SO series using fallback method (v1 Orders). For best results, setup SQL query 'Get_SO_Series' in SAP B1.")
-                return series_list
-            else:
-                logging.error(f"Failed to get SO series via fallback: {response.status_code} - {response.text}")
-                return []
-                
-        except Exception as e:
-            logging.error(f"Error fetching SO series (fallback method): {str(e)}")
-            return []
+            if response.status_code != 200:
+                raise LookupStrategyUnavailable(f"v1 Orders: {response.status_code} - {response.text}")
+
+            series_set = {order['Series'] for order in response.json().get('value', [])
+                          if order.get('Series') is not None}
+            logging.warning("⚠️ Using fallback method (v1 Orders) for SO series. "
+                            "For best results, setup SQL query 'Get_SO_Series' in SAP B1.")
+            return [{'Series': s, 'Name': f'Series {s}'} for s in sorted(series_set)]
+
+        # Method 1: SQL Query Get_SO_Series (preferred - uses custom SAP query)
+        # Method 2: v2 Series endpoint
+        # Method 3: v1 Orders scan
+        series_list = self._run_lookup('so_series', [
+            ('sql_query', lambda: as_series_list(self._sql_query_rows('Get_SO_Series', {}))),
+            ('series_v2', lambda: as_series_list(self._series_v2_rows('17'))),
+            ('recent_orders', via_recent_orders),
+        ], default=[])
+        logging.info(f"✅ Retrieved {len(series_list)} SO series from SAP")
+        return series_list
 
     def get_so_doc_entry(self, series, doc_num):
         """Get Sales Order DocEntry from SAP B1 using series and document number"""
@@ -586,59 +1074,31 @@ class SAPIntegration:
             logging.warning("SAP B1 not available, returning empty list")
             return []
 
-        # Try Method 1: SQL Query Get_Open_SO_DocNum (preferred - uses custom SAP query)
-        try:
-            url_sql = f"{self.base_url}/b1s/v1/SQLQueries('Get_Open_SO_DocNum')/List"
-            body = {"ParamList": f"series='{series}'"}
-            
-            logging.debug(f"🔍 Attempting SQL query Get_Open_SO_DocNum: {url_sql} with series: {series}")
-            
-            response = self.session.post(url_sql, json=body, timeout=30)
-            
-            if response.status_code == 200:
-                data = response.json()
-                documents = data.get('value', [])
-                
-                logging.info(f"✅ Retrieved {len(documents)} open SOs from series {series} (SQL Query)")
-                return documents
-            else:
-                logging.info(f"SQL query Get_Open_SO_DocNum not available ({response.status_code}), trying OData fallback")
-                
-        except Exception as e:
-            logging.debug(f"SQL query Get_Open_SO_DocNum failed: {str(e)}, trying OData fallback")
-
-        # Try Method 2: OData filter (fallback)
-        try:
+        def via_odata():
             url = f"{self.base_url}/b1s/v1/Orders?$filter=Series eq {series} and DocumentStatus eq 'bost_Open'&$select=DocEntry,DocNum,CardCode,CardName,Series,DocStatus&$orderby=DocEntry desc"
-            logging.debug(f"Fetching open SOs with OData filter: {url}")
-            
             response = self.session.get(url, timeout=30)
-            
-            if response.status_code == 200:
-                data = response.json()
-                documents = data.get('value', [])
-                
-                # Format to match SQL query output
-                formatted_docs = [
-                    {
-                        'DocEntry': doc.get('DocEntry'),
-                        'DocNum': doc.get('DocNum'),
-                        'CardCode': doc.get('CardCode'),
-                        'CardName': doc.get('CardName'),
-                        'DocStatus': doc.get('DocStatus', 'O')
-                    }
-                    for doc in documents
-                ]
-                
-                logging.info(f"✅ Retrieved {len(formatted_docs)} open SOs from series {series} (OData)")
-                return formatted_docs
-            else:
-                logging.warning(f"Failed to get open SOs: {response.status_code} - {response.text}")
-                return []
-                
-        except Exception as e:
-            logging.error(f"Error fetching open SOs for series {series}: {str(e)}")
-            return []
+            if response.status_code != 200:
+                raise LookupStrategyUnavailable(f"v1 Orders: {response.status_code} - {response.text}")
+
+            # Format to match SQL query output
+            return [
+                {
+                    'DocEntry': doc.get('DocEntry'),
+                    'DocNum': doc.get('DocNum'),
+                    'CardCode': doc.get('CardCode'),
+                    'CardName': doc.get('CardName'),
+                    'DocStatus': doc.get('DocStatus', 'O')
+                }
+                for doc in response.json().get('value', [])
+            ]
+
+        # Method 1: SQL Query Get_Open_SO_DocNum (preferred), Method 2: OData filter
+        documents = self._run_lookup('open_so_docnums', [
+            ('sql_query', lambda: self._sql_query_rows('Get_Open_SO_DocNum', {"ParamList": f"series='{series}'"})),
+            ('odata', via_odata),
+        ], default=[])
+        logging.info(f"✅ Retrieved {len(documents)} open SOs from series {series}")
+        return documents
 
     def get_sales_order_by_doc_entry(self, doc_entry):
         """Get Sales Order details from SAP B1 using DocEntry - only open documents and lines"""
@@ -728,28 +1188,18 @@ class SAPIntegration:
             }
 
     def get_invt_series(self):
-        """Get Inventory Transfer series from SAP B1 using SQLQueries"""
+        """Get Inventory Transfer series from SAP B1 - SQL query Get_INVT_Series, falling back to the v2 Series endpoint"""
         if not self.ensure_logged_in():
             logging.warning("SAP B1 not available, returning empty series list")
             return []
 
-        try:
-            url = f"{self.base_url}/b1s/v1/SQLQueries('Get_INVT_Series')/List"
-            params = {
-            }
-            response = self.session.post(url,params=params, timeout=30)
-            if response.status_code == 200:
-                data = response.json()
-                series_list = data.get('value', [])
-                logging.info(f"✅ Retrieved {len(series_list)} INVT series from SAP")
-                return series_list
-            else:
-                logging.warning(f"Failed to get INVT series: {response.status_code} - {response.text}")
-                return []
-                
-        except Exception as e:
-            logging.error(f"Error fetching INVT series: {str(e)}")
-            return []
+        # 1250000001 = Inventory Transfer Request
+        series_list = self._run_lookup('invt_series', [
+            ('sql_query', lambda: self._sql_query_rows('Get_INVT_Series')),
+            ('series_v2', lambda: self._series_v2_rows('1250000001')),
+        ], default=[])
+        logging.info(f"✅ Retrieved {len(series_list)} INVT series from SAP")
+        return series_list
 
     def get_invt_doc_entry(self, series, doc_num):
         """Get Inventory Transfer DocEntry from SAP B1 using series and document number"""
@@ -811,27 +1261,18 @@ class SAPIntegration:
             return None
 
     def get_invcnt_series(self):
-        """Get Inventory Counting series from SAP B1 using SQLQueries"""
+        """Get Inventory Counting series from SAP B1 - SQL query Get_INVCNT_Series, falling back to the v2 Series endpoint"""
         if not self.ensure_logged_in():
             logging.warning("SAP B1 not available, returning empty series list")
             return []
 
-        try:
-            url = f"{self.base_url}/b1s/v1/SQLQueries('Get_INVCNT_Series')/List"
-            params = {}
-            response = self.session.post(url, params=params, timeout=30)
-            if response.status_code == 200:
-                data = response.json()
-                series_list = data.get('value', [])
-                logging.info(f"✅ Retrieved {len(series_list)} Inventory Counting series from SAP")
-                return series_list
-            else:
-                logging.warning(f"Failed to get Inventory Counting series: {response.status_code} - {response.text}")
-                return []
-                
-        except Exception as e:
-            logging.error(f"Error fetching Inventory Counting series: {str(e)}")
-            return []
+        # 1470000065 = Inventory Counting
+        series_list = self._run_lookup('invcnt_series', [
+            ('sql_query', lambda: self._sql_query_rows('Get_INVCNT_Series')),
+            ('series_v2', lambda: self._series_v2_rows('1470000065')),
+        ], default=[])
+        logging.info(f"✅ Retrieved {len(series_list)} Inventory Counting series from SAP")
+        return series_list
 
     def get_invcnt_doc_entry(self, series, doc_num):
         """Get Inventory Counting DocEntry from SAP B1 using series and document number"""
@@ -871,70 +1312,42 @@ class SAPIntegration:
             logging.warning("SAP B1 not available, returning empty list")
             return []
 
-        # Try Method 1: SQL Query Get_Open_INVCNT_DocNum (preferred - uses custom SAP query)
-        try:
-            url_sql = f"{self.base_url}/b1s/v1/SQLQueries('Get_Open_INVCNT_DocNum')/List"
-            body = {"ParamList": f"series='{series}'"}
-            
-            logging.debug(f"🔍 Attempting SQL query Get_Open_INVCNT_DocNum: {url_sql} with series: {series}")
-            
-            response = self.session.post(url_sql, json=body, timeout=30)
-            
-            if response.status_code == 200:
-                data = response.json()
-                documents = data.get('value', [])
-                
-                logging.info(f"✅ Retrieved {len(documents)} open inventory counting documents from series {series} (SQL Query)")
-                return documents
-            else:
-                logging.info(f"SQL query Get_Open_INVCNT_DocNum not available ({response.status_code}), trying OData fallback")
-                
-        except Exception as e:
-            logging.debug(f"SQL query Get_Open_INVCNT_DocNum failed: {str(e)}, trying OData fallback")
-
-        # Try Method 2: OData filter (fallback)
-        try:
+        def via_odata():
             url = f"{self.base_url}/b1s/v1/InventoryCounting?$filter=Series eq {series} and DocumentStatus eq 'cdsOpen'&$select=DocumentEntry,DocumentNumber,CountDate,DocumentStatus&$orderby=CountDate desc,DocumentNumber"
-            logging.debug(f"Fetching open inventory counting documents with OData filter: {url}")
-            
             response = self.session.get(url, timeout=30)
-            
-            if response.status_code == 200:
-                data = response.json()
-                documents = data.get('value', [])
-                
-                # Get series name for the series
-                series_name = f"Series {series}"
-                try:
-                    series_url = f"{self.base_url}/b1s/v1/SeriesService_GetDocumentSeries?DocumentTypeParams={{'Document':1250000045,'Series':{series}}}"
-                    series_response = self.session.get(series_url, timeout=10)
-                    if series_response.status_code == 200:
-                        series_data = series_response.json()
-                        series_name = series_data.get('Name', series_name)
-                except:
-                    pass
-                
-                # Format to match SQL query output
-                formatted_docs = [
-                    {
-                        'DocEntry': doc.get('DocumentEntry'),
-                        'DocNum': doc.get('DocumentNumber'),
-                        'SeriesName': series_name,
-                        'CountDate': doc.get('CountDate'),
-                        'Status': 'O'  # Open status
-                    }
-                    for doc in documents
-                ]
-                
-                logging.info(f"✅ Retrieved {len(formatted_docs)} open inventory counting documents from series {series} (OData)")
-                return formatted_docs
-            else:
-                logging.warning(f"Failed to get open inventory counting documents: {response.status_code} - {response.text}")
-                return []
-                
-        except Exception as e:
-            logging.error(f"Error fetching open inventory counting documents for series {series}: {str(e)}")
-            return []
+            if response.status_code != 200:
+                raise LookupStrategyUnavailable(f"InventoryCounting: {response.status_code} - {response.text}")
+            documents = response.json().get('value', [])
+
+            # Get series name for the series
+            series_name = f"Series {series}"
+            try:
+                series_url = f"{self.base_url}/b1s/v1/SeriesService_GetDocumentSeries?DocumentTypeParams={{'Document':1250000045,'Series':{series}}}"
+                series_response = self.session.get(series_url, timeout=10)
+                if series_response.status_code == 200:
+                    series_name = series_response.json().get('Name', series_name)
+            except Exception:
+                pass
+
+            # Format to match SQL query output
+            return [
+                {
+                    'DocEntry': doc.get('DocumentEntry'),
+                    'DocNum': doc.get('DocumentNumber'),
+                    'SeriesName': series_name,
+                    'CountDate': doc.get('CountDate'),
+                    'Status': 'O'  # Open status
+                }
+                for doc in documents
+            ]
+
+        # Method 1: SQL Query Get_Open_INVCNT_DocNum (preferred), Method 2: OData filter
+        documents = self._run_lookup('open_invcnt_docnums', [
+            ('sql_query', lambda: self._sql_query_rows('Get_Open_INVCNT_DocNum', {"ParamList": f"series='{series}'"})),
+            ('odata', via_odata),
+        ], default=[])
+        logging.info(f"✅ Retrieved {len(documents)} open inventory counting documents from series {series}")
+        return documents
 
     def get_inventory_counting_by_doc_entry(self, doc_entry):
         """Get inventory counting document details from SAP B1 using DocEntry"""
@@ -1000,6 +1413,7 @@ class SAPIntegration:
             )
             return []
 
+    @coalesced
     def get_bin_items(self, bin_code):
         """Enhanced bin scanning with detailed item information using your exact API patterns"""
         if not self.ensure_logged_in():
@@ -1011,9 +1425,7 @@ class SAPIntegration:
             
             # Step 1: Get bin information using your exact API pattern
             bin_info_url = f"{self.base_url}/b1s/v1/BinLocations?$filter=BinCode eq '{bin_code}'"
-            logging.debug(f"[DEBUG] Calling URL: {bin_info_url}")
             bin_response = self.session.get(bin_info_url)
-            logging.debug(f"[DEBUG] Status code: {bin_response.status_code}")
 
             if bin_response.status_code != 200:
                 logging.warning(f"❌ Bin {bin_code} not found: {bin_response.status_code}")
@@ -1030,44 +1442,44 @@ class SAPIntegration:
 
             logging.info(f"✅ Found bin {bin_code} in warehouse {warehouse_code} (AbsEntry: {abs_entry})")
 
+            # Steps 2 and 3 only need the warehouse code, so both go to SAP in one $batch round trip
             # Step 2: Get warehouse business place info using your exact API pattern
-            warehouse_info_url = (f"{self.base_url}/b1s/v1/Warehouses?"
-                                f"$select=BusinessPlaceID,WarehouseCode,DefaultBin&"
-                                f"$filter=WarehouseCode eq '{warehouse_code}'")
-            logging.debug(f"[DEBUG] Calling URL: {warehouse_info_url}")
-            warehouse_response = self.session.get(warehouse_info_url)
-            logging.debug(f"[DEBUG] Status code: {warehouse_response.status_code}")
-            
-            business_place_id = 0
-            if warehouse_response.status_code == 200:
-                warehouse_data = warehouse_response.json().get('value', [])
-                if warehouse_data:
-                    business_place_id = warehouse_data[0].get('BusinessPlaceID', 0)
-                    logging.info(f"✅ Warehouse {warehouse_code} BusinessPlaceID: {business_place_id}")
+            warehouse_info_path = (f"Warehouses?"
+                                   f"$select=BusinessPlaceID,WarehouseCode,DefaultBin&"
+                                   f"$filter=WarehouseCode eq '{warehouse_code}'")
 
             # Step 3: Get warehouse items using your exact crossjoin API pattern
-            crossjoin_url = (f"{self.base_url}/b1s/v1/$crossjoin(Items,Items/ItemWarehouseInfoCollection)?"
-                           f"$expand=Items($select=ItemCode,ItemName,QuantityOnStock),"
-                           f"Items/ItemWarehouseInfoCollection($select=InStock,Ordered,StandardAveragePrice)&"
-                           f"$filter=Items/ItemCode eq Items/ItemWarehouseInfoCollection/ItemCode and "
-                           f"Items/ItemWarehouseInfoCollection/WarehouseCode eq '{warehouse_code}'")
+            crossjoin_path = (f"$crossjoin(Items,Items/ItemWarehouseInfoCollection)?"
+                              f"$expand=Items($select=ItemCode,ItemName,QuantityOnStock),"
+                              f"Items/ItemWarehouseInfoCollection($select=InStock,Ordered,StandardAveragePrice)&"
+                              f"$filter=Items/ItemCode eq Items/ItemWarehouseInfoCollection/ItemCode and "
+                              f"Items/ItemWarehouseInfoCollection/WarehouseCode eq '{warehouse_code}'")
 
-            logging.debug(f"[DEBUG] Calling URL: {crossjoin_url}")
             headers = {"Prefer": "odata.maxpagesize=300"}
-            crossjoin_response = self.session.get(crossjoin_url,headers=headers)
-            logging.debug(f"[DEBUG] Status code: {crossjoin_response.status_code}")
-            logging.debug(f"[DEBUG] Response text: {crossjoin_response.text[:300]}")
+            warehouse_result, crossjoin_result = self.batch_get([warehouse_info_path, crossjoin_path], headers=headers)
 
-            if crossjoin_response.status_code != 200:
-                logging.error(f"❌ Failed to get warehouse items: {crossjoin_response.status_code}")
+            business_place_id = 0
+            if warehouse_result['ok']:
+                warehouse_data = (warehouse_result['data'] or {}).get('value', [])
+                if warehouse_data:
+                    business_place_id = warehouse_data[0].get('BusinessPlaceID', 0)
+                    logging.info(f"✅ Warehouse {warehouse_code} BusinessPlaceID: {business_place_id}")
+
+            if not crossjoin_result['ok']:
+                logging.error(f"❌ Failed to get warehouse items: {crossjoin_result['status']}")
                 return []
 
             # Step 4: Process crossjoin results and enhance with batch details
             formatted_items = []
-            crossjoin_data = crossjoin_response.json().get('value', [])
+            crossjoin_data = (crossjoin_result['data'] or {}).get('value', [])
             
             logging.info(f"📦 Found {len(crossjoin_data)} items in warehouse {warehouse_code}")
 
+            # Step 5: Get batch details for every in-stock item, batched instead of one call per item
+            stocked_codes = [row.get('Items', {}).get('ItemCode', '') for row in crossjoin_data
+                             if float(row.get('Items/ItemWarehouseInfoCollection', {}).get('InStock', 0) or 0) > 0]
+            batch_details_by_item = self._get_items_batch_details([code for code in stocked_codes if code])
+
             for item_data in crossjoin_data:
                 try:
                     item_info = item_data.get('Items', {})
@@ -1077,14 +1489,13 @@ class SAPIntegration:
                     if not item_code:
                         continue
 
-                    # Step 5: Get batch details for this item using your exact API pattern
-                    batch_details = self._get_item_batch_details(item_code)
-                    
                     # Skip items with zero InStock quantity
                     in_stock_qty = float(warehouse_info.get('InStock', 0))
                     if in_stock_qty <= 0:
                         logging.debug(f"⏭️ Skipping item {item_code} - InStock quantity is {in_stock_qty}")
                         continue
+
+                    batch_details = batch_details_by_item.get(item_code, [])
                     
                     # Create enhanced item record with all details
                     enhanced_item = {
@@ -1170,6 +1581,19 @@ class SAPIntegration:
             logging.error(f"❌ Error getting batch details for {item_code}: {str(e)}")
             return []
 
+    def _get_items_batch_details(self, item_codes):
+        """Batch details for several items via $batch: {item_code: [batches]}"""
+        item_codes = list(dict.fromkeys(item_codes))
+        paths = [f"BatchNumberDetails?$filter=ItemCode eq '{code}'" for code in item_codes]
+        details = {}
+        for item_code, result in zip(item_codes, self.batch_get(paths)):
+            if result['ok']:
+                details[item_code] = (result['data'] or {}).get('value', [])
+            else:
+                logging.debug(f"⚠️ No batch details found for item {item_code}")
+                details[item_code] = []
+        return details
+
     def _get_mock_bin_items(self, bin_code):
         """Mock data for offline mode with enhanced structure matching your API responses"""
         # Only return items with InStock > 0 to match the filtering logic
@@ -1569,12 +1993,29 @@ class SAPIntegration:
             if not pick_list_data or 'PickListsLines' not in pick_list_data:
                 return pick_list_data
             
+            # Resolve every uncached bin concurrently first; the loop below then reads the cache
+            pending = sorted({allocation.get('BinAbsEntry')
+                              for line in pick_list_data['PickListsLines']
+                              for allocation in (line.get('DocumentLinesBinAllocations') or [])
+                              if allocation.get('BinAbsEntry')
+                              and allocation.get('BinAbsEntry') not in self._bin_location_cache})
+            resolved = {}
+            if len(pending) > 1 and self.ensure_logged_in():
+                from sap_async import fan_out
+                details_list = fan_out(self, [('get_bin_location_details', abs_entry) for abs_entry in pending])
+                for abs_entry, details in zip(pending, details_list):
+                    if isinstance(details, dict):
+                        resolved[abs_entry] = details
+                        # Only found bins are cached, as in get_bin_location_details
+                        if details.get('Warehouse') not in ('Unknown', 'Error'):
+                            self._bin_location_cache[abs_entry] = details
+
             for line in pick_list_data['PickListsLines']:
                 if 'DocumentLinesBinAllocations' in line and line['DocumentLinesBinAllocations']:
                     for bin_allocation in line['DocumentLinesBinAllocations']:
                         bin_abs_entry = bin_allocation.get('BinAbsEntry')
                         if bin_abs_entry:
-                            bin_details = self.get_bin_location_details(bin_abs_entry)
+                            bin_details = resolved.get(bin_abs_entry) or self.get_bin_location_details(bin_abs_entry)
                             # Add warehouse and bin code to the bin allocation
                             bin_allocation['Warehouse'] = bin_details.get('Warehouse', 'Unknown')
                             bin_allocation['BinCode'] = bin_details.get('BinCode', f'Bin-{bin_abs_entry}')
@@ -1708,6 +2149,7 @@ class SAPIntegration:
                 logging.info(
                     f"✅ Stock transfer created successfully: {result.get('DocNum')}"
                 )
+                serial_index.apply_stock_transfer(transfer_data)
                 return {
                     'success': True,
                     'document_number': result.get('DocNum')
@@ -1786,6 +2228,7 @@ class SAPIntegration:
                 logging.info(
                     f"✅ Serial item stock transfer created successfully: {result.get('DocNum')}"
                 )
+                serial_index.apply_stock_transfer(transfer_data)
                 return {
                     'success': True,
                     'document_number': result.get('DocNum'),
@@ -2364,130 +2807,175 @@ class SAPIntegration:
             logging.error(f"Error syncing bins: {str(e)}")
             return False
 
+    def read_pages(self, entity, select, filter=None, page_size=500):
+        """Page through a Service Layer collection, yielding one list of records per page
+
+        Pages are ordered by the first $select field. Raises
+        LookupStrategyUnavailable when SAP answers a page with an HTTP error.
+        """
+        url = f"{self.base_url}/b1s/v1/{entity}"
+        headers = {'Prefer': f'odata.maxpagesize={page_size}'}
+        skip = 0
+
+        while True:
+            params = {'$select': select, '$orderby': select.split(',', 1)[0],
+                      '$top': page_size, '$skip': skip}
+            if filter:
+                params['$filter'] = filter
+            response = self.session.get(url, params=params, headers=headers, timeout=60)
+            if response.status_code != 200:
+                raise LookupStrategyUnavailable(f"{entity}: {response.status_code} {response.text[:200]}")
+
+            data = response.json()
+            records = data.get('value', [])
+            if records:
+                yield records
+            # A server-side page cap smaller than $top still sends odata.nextLink
+            if not records or (len(records) < page_size and not data.get('odata.nextLink')):
+                return
+            skip += len(records)
+
+    def _sync_master_table(self, entity, select, model, key, build_row, page_size=500):
+        """Page through a Service Layer collection and bulk-upsert it into a local index table
+
+        build_row maps one SAP record to column values (or None to skip it).
+        After a complete pass, rows SAP no longer returned are marked inactive.
+        Returns the number of SAP records read, or None on failure.
+        """
+        from app import db
+        from db_dual_support import captures, capture_where
+
+        model.ensure_schema()
+        replicate = captures(model.__tablename__)
+        key_column = getattr(model, key)
+        existing = dict(db.session.query(key_column, model.id).all())
+        # Whole seconds, so the stamp compares equal after a round trip through MySQL DATETIME
+        synced_at = datetime.utcnow().replace(microsecond=0)
+        total = 0
+
+        try:
+            for records in self.read_pages(entity, select, page_size=page_size):
+                inserts, updates = [], []
+                for record in records:
+                    row = build_row(record)
+                    if not row or not row.get(key):
+                        continue
+                    row['last_synced_at'] = synced_at
+                    row['updated_at'] = synced_at
+                    if row[key] in existing:
+                        row['id'] = existing[row[key]]
+                        updates.append(row)
+                    else:
+                        row['created_at'] = synced_at
+                        inserts.append(row)
+                        existing[row[key]] = None
+
+                if inserts:
+                    db.session.bulk_insert_mappings(model, inserts)
+                if updates:
+                    db.session.bulk_update_mappings(model, updates)
+                if replicate and (inserts or updates):
+                    # Bulk mappings skip the outbox flush listener
+                    capture_where(db.session.connection(), model.__table__,
+                                  model.__table__.c[key].in_([row[key] for row in inserts + updates]))
+                db.session.commit()
+                if inserts or updates:
+                    model.mark_synced(synced_at)
+                total += len(records)
+
+            if total:
+                # Deleted in SAP (or skipped by build_row): not stamped by this pass
+                retired = db.session.query(model).filter(
+                    model.is_active.is_(True),
+                    db.or_(model.last_synced_at.is_(None), model.last_synced_at < synced_at),
+                ).update({'is_active': False, 'updated_at': synced_at}, synchronize_session=False)
+                db.session.commit()
+                if retired:
+                    logging.info(f"📦 Marked {retired} {model.__tablename__} rows inactive - no longer in SAP")
+        except LookupStrategyUnavailable as e:
+            logging.error(f"Error syncing {entity}: {str(e)}")
+            db.session.rollback()
+            return None
+        except Exception:
+            db.session.rollback()
+            raise
+
+        return total
+
     def sync_business_partners(self):
-        """Sync business partners (suppliers/customers) from SAP B1"""
+        """Sync business partners into the local business_partners search index"""
         if not self.ensure_logged_in():
             logging.warning(
                 "Cannot sync business partners - SAP B1 not available")
             return False
 
-        try:
-            # Get suppliers and customers
-            url = f"{self.base_url}/b1s/v1/BusinessPartners?$filter=CardType eq 'cSupplier' or CardType eq 'cCustomer'"
-            response = self.session.get(url)
-
-            if response.status_code == 200:
-                partners = response.json().get('value', [])
+        from models import BusinessPartner, build_search_text
 
-                from app import db, app
+        def build_row(partner):
+            card_code = partner.get('CardCode')
+            return {
+                'card_code': card_code,
+                'card_name': partner.get('CardName') or '',
+                'card_type': partner.get('CardType') or '',
+                'phone': partner.get('Phone1') or '',
+                'email': partner.get('EmailAddress') or '',
+                'address': partner.get('Address') or '',
+                'is_active': partner.get('Valid') == 'tYES' and partner.get('Frozen') != 'tYES',
+                'search_text': build_search_text(card_code, partner.get('CardName')),
+            }
 
-                # Create business_partners table if not exists - use database-specific syntax
-                db_uri = os.environ.get('DATABASE_URL', '')
+        try:
+            total = self._sync_master_table(
+                'BusinessPartners', 'CardCode,CardName,CardType,Phone1,EmailAddress,Address,Valid,Frozen',
+                BusinessPartner, 'card_code', build_row)
+            if total is None:
+                return False
+            logging.info(
+                f"Synced {total} business partners from SAP B1")
+            return True
 
-                if 'postgresql' in db_uri.lower():
-                    create_table_sql = """
-                        CREATE TABLE IF NOT EXISTS business_partners (
-                            id SERIAL PRIMARY KEY,
-                            card_code VARCHAR(50) UNIQUE NOT NULL,
-                            card_name VARCHAR(200) NOT NULL,
-                            card_type VARCHAR(20) NOT NULL,
-                            phone VARCHAR(50),
-                            email VARCHAR(100),
-                            address TEXT,
-                            is_active BOOLEAN DEFAULT TRUE,
-                            created_at TIMESTAMP DEFAULT NOW(),
-                            updated_at TIMESTAMP DEFAULT NOW()
-                        )
-                    """
-                elif 'mysql' in db_uri.lower():
-                    create_table_sql = """
-                        CREATE TABLE IF NOT EXISTS business_partners (
-                            id INT AUTO_INCREMENT PRIMARY KEY,
-                            card_code VARCHAR(50) UNIQUE NOT NULL,
-                            card_name VARCHAR(200) NOT NULL,
-                            card_type VARCHAR(20) NOT NULL,
-                            phone VARCHAR(50),
-                            email VARCHAR(100),
-                            address TEXT,
-                            is_active BOOLEAN DEFAULT TRUE,
-                            created_at TIMESTAMP DEFAULT NOW(),
-                            updated_at TIMESTAMP DEFAULT NOW() ON UPDATE NOW()
-                        )
-                    """
-                else:
-                    create_table_sql = """
-                        CREATE TABLE IF NOT EXISTS business_partners (
-                            id INTEGER PRIMARY KEY AUTOINCREMENT,
-                            card_code VARCHAR(50) UNIQUE NOT NULL,
-                            card_name VARCHAR(200) NOT NULL,
-                            card_type VARCHAR(20) NOT NULL,
-                            phone VARCHAR(50),
-                            email VARCHAR(100),
-                            address TEXT,
-                            is_active BOOLEAN DEFAULT 1,
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                        )
-                    """
+        except Exception as e:
+            logging.error(f"Error syncing business partners: {str(e)}")
+            return False
 
-                db.session.execute(db.text(create_table_sql))
+    def sync_items(self):
+        """Sync the item master (OITM) into the local item_master search index"""
+        if not self.ensure_logged_in():
+            logging.warning("Cannot sync items - SAP B1 not available")
+            return False
 
-                for partner in partners:
-                    card_code = partner.get('CardCode')
-                    if card_code:
-                        # Use database-specific upsert syntax
-                        if 'postgresql' in db_uri.lower():
-                            upsert_sql = """
-                                INSERT INTO business_partners (card_code, card_name, card_type, phone, email, address, is_active, created_at, updated_at)
-                                VALUES (:card_code, :card_name, :card_type, :phone, :email, :address, :is_active, NOW(), NOW())
-                                ON CONFLICT (card_code) 
-                                DO UPDATE SET 
-                                    card_name = EXCLUDED.card_name,
-                                    card_type = EXCLUDED.card_type,
-                                    phone = EXCLUDED.phone,
-                                    email = EXCLUDED.email,
-                                    address = EXCLUDED.address,
-                                    is_active = EXCLUDED.is_active,
-                                    updated_at = NOW()
-                            """
-                        elif 'mysql' in db_uri.lower():
-                            upsert_sql = """
-                                INSERT INTO business_partners (card_code, card_name, card_type, phone, email, address, is_active, created_at, updated_at)
-                                VALUES (:card_code, :card_name, :card_type, :phone, :email, :address, :is_active, NOW(), NOW())
-                                ON DUPLICATE KEY UPDATE 
-                                    card_name = VALUES(card_name),
-                                    card_type = VALUES(card_type),
-                                    phone = VALUES(phone),
-                                    email = VALUES(email),
-                                    address = VALUES(address),
-                                    is_active = VALUES(is_active),
-                                    updated_at = NOW()
-                            """
-                        else:
-                            # SQLite - use INSERT OR REPLACE
-                            upsert_sql = """
-                                INSERT OR REPLACE INTO business_partners (card_code, card_name, card_type, phone, email, address, is_active, created_at, updated_at)
-                                VALUES (:card_code, :card_name, :card_type, :phone, :email, :address, :is_active, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
-                            """
+        from models import ItemMaster, build_search_text
 
-                        db.session.execute(
-                            db.text(upsert_sql), {
-                                "card_code": card_code,
-                                "card_name": partner.get('CardName', ''),
-                                "card_type": partner.get('CardType', ''),
-                                "phone": partner.get('Phone1', ''),
-                                "email": partner.get('EmailAddress', ''),
-                                "address": partner.get('Address', ''),
-                                "is_active": partner.get('Valid') == 'Y'
-                            })
+        def build_row(item):
+            item_code = item.get('ItemCode')
+            serial = item.get('ManageSerialNumbers') == 'tYES'
+            batch = item.get('ManageBatchNumbers') == 'tYES'
+            return {
+                'item_code': item_code,
+                'item_name': item.get('ItemName') or '',
+                'item_group_code': item.get('ItemsGroupCode'),
+                'item_type': 'serial' if serial else 'batch' if batch else 'none',
+                'manage_method': 'R' if item.get('SRIAndBatchManageMethod') == 'bomm_OnReleaseOnly' else 'A',
+                'batch_managed': batch,
+                'serial_managed': serial,
+                'inventory_uom': item.get('InventoryUOM'),
+                'is_inventory_item': item.get('InventoryItem') != 'tNO',
+                'is_active': item.get('Valid') != 'tNO' and item.get('Frozen') != 'tYES',
+                'search_text': build_search_text(item_code, item.get('ItemName')),
+            }
 
-                db.session.commit()
-                logging.info(
-                    f"Synced {len(partners)} business partners from SAP B1")
-                return True
+        try:
+            total = self._sync_master_table(
+                'Items', 'ItemCode,ItemName,ItemsGroupCode,ManageSerialNumbers,ManageBatchNumbers,'
+                'SRIAndBatchManageMethod,InventoryUOM,InventoryItem,Valid,Frozen',
+                ItemMaster, 'item_code', build_row)
+            if total is None:
+                return False
+            logging.info(f"Synced {total} items from SAP B1")
+            return True
 
         except Exception as e:
-            logging.error(f"Error syncing business partners: {str(e)}")
+            logging.error(f"Error syncing items: {str(e)}")
             return False
 
     def update_pick_list_status_to_picked(self, absolute_entry, pick_list_data):
@@ -3119,7 +3607,8 @@ class SAPIntegration:
         results = {
             'warehouses': self.sync_warehouses(),
             'bins': self.sync_bins(),
-            'business_partners': self.sync_business_partners()
+            'business_partners': self.sync_business_partners(),
+            'items': self.sync_items()
         }
 
         success_count = sum(1 for result in results.values() if result)
@@ -3343,6 +3832,17 @@ class SAPIntegration:
             item_code: The item code to check against
             warehouse_code: Optional warehouse code to check series availability in specific warehouse
         """
+        if warehouse_code and serial_index.lookup(self, item_code, warehouse_code, serial_number):
+            return {
+                'valid': True,
+                'DistNumber': serial_number,
+                'ItemCode': item_code,
+                'WhsCode': warehouse_code,
+                'available_in_warehouse': True,
+                'source': 'serial_index',
+                'message': f'Series {serial_number} is available in warehouse {warehouse_code}'
+            }
+
         if not self.ensure_logged_in():
             logging.warning("SAP B1 not available, cannot validate series")
             return {
@@ -3373,6 +3873,8 @@ class SAPIntegration:
                 if data.get('value') and len(data['value']) > 0:
                     # Series found in the specified warehouse
                     series_data = data['value'][0]
+                    if warehouse_code:
+                        serial_index.confirm(self, item_code, warehouse_code, serial_number)
                     return {
                         'valid': True,
                         'DistNumber': series_data.get('DistNumber'),
@@ -3433,15 +3935,21 @@ class SAPIntegration:
         
         try:
             # Process serials in batches to avoid API limits and improve performance
-            for i in range(0, total_serials, batch_size):
-                batch = serial_numbers[i:i+batch_size]
-                batch_results = self._validate_batch_chunk(batch, item_code, warehouse_code)
-                results.update(batch_results)
-                
-                # Log progress for large batches
-                if total_serials > 100:
-                    processed = min(i + batch_size, total_serials)
-                    logging.info(f"📊 Batch validation progress: {processed}/{total_serials} serial numbers processed")
+            chunks = [serial_numbers[i:i+batch_size] for i in range(0, total_serials, batch_size)]
+            if len(chunks) > 1:
+                # Several chunks: query them concurrently through the async client
+                from sap_async import fan_out
+                responses = fan_out(self, [('post', "SQLQueries('Batch_Series_Validation')/List",
+                                            self._batch_chunk_payload(chunk, item_code, warehouse_code))
+                                           for chunk in chunks])
+                for chunk, response in zip(chunks, responses):
+                    if isinstance(response, Exception):
+                        response = {'status': 0, 'error': str(response)}
+                    results.update(self._batch_chunk_results(chunk, warehouse_code, response))
+                logging.info(f"📊 Batch validation: {total_serials} serial numbers in {len(chunks)} concurrent chunks")
+            else:
+                for batch in chunks:
+                    results.update(self._validate_batch_chunk(batch, item_code, warehouse_code))
             
             logging.info(f"✅ Completed batch validation for {total_serials} serial numbers")
             return results
@@ -3451,6 +3959,72 @@ class SAPIntegration:
             # Return error for all serials if batch fails
             return {serial: {'valid': False, 'error': f'Batch validation error: {str(e)}'} for serial in serial_numbers}
     
+    def _batch_chunk_payload(self, serial_batch, item_code, warehouse_code):
+        """Batch_Series_Validation SQL query body for a chunk of serial numbers"""
+        serial_list = "','".join(serial_batch)
+        sql_query = f"""
+            SELECT 
+                SN.DistNumber as SerialNumber,
+                SN.ItemCode,
+                SN.WhsCode,
+                CASE WHEN SN.WhsCode = '{warehouse_code}' THEN 1 ELSE 0 END as AvailableInWarehouse
+            FROM OSRN SN 
+            WHERE SN.DistNumber IN ('{serial_list}')
+            AND SN.ItemCode = '{item_code}'
+            """
+        return {
+            "ParamList": f"sqlQuery={sql_query}"
+        }
+
+    def _batch_chunk_results(self, serial_batch, warehouse_code, response):
+        """Per-serial results of a chunk from a {'status', 'data', 'text'} query response"""
+        results = {}
+        if response.get('status') != 200:
+            # API error - mark all serials as failed
+            if response.get('status'):
+                error_msg = f"SAP API error: {response['status']} - {response.get('text', '')}"
+                validation_type = 'batch_api_error'
+            else:
+                error_msg = f"Batch chunk validation error: {response.get('error', '')}"
+                validation_type = 'batch_exception'
+            for serial in serial_batch:
+                results[serial] = {
+                    'valid': False,
+                    'error': error_msg,
+                    'validation_type': validation_type
+                }
+            return results
+
+        found_serials = {item.get('SerialNumber'): item for item in (response.get('data') or {}).get('value', [])}
+
+        # Process each serial in the batch
+        for serial in serial_batch:
+            if serial in found_serials:
+                series_data = found_serials[serial]
+                available_in_warehouse = bool(series_data.get('AvailableInWarehouse', 0))
+
+                results[serial] = {
+                    'valid': True,
+                    'DistNumber': series_data.get('SerialNumber'),
+                    'ItemCode': series_data.get('ItemCode'),
+                    'WhsCode': series_data.get('WhsCode'),
+                    'available_in_warehouse': available_in_warehouse,
+                    'validation_type': 'batch_warehouse_specific' if available_in_warehouse else 'batch_warehouse_unavailable',
+                    'message': f'Series {serial} validated in batch'
+                }
+
+                if not available_in_warehouse:
+                    results[serial]['warning'] = f'Series {serial} is not available in warehouse {warehouse_code}'
+            else:
+                # Serial not found in SAP
+                results[serial] = {
+                    'valid': False,
+                    'error': f'Series {serial} not found in SAP system',
+                    'available_in_warehouse': False,
+                    'validation_type': 'batch_not_found'
+                }
+        return results
+
     def _validate_batch_chunk(self, serial_batch, item_code, warehouse_code):
         """Validate a chunk of serial numbers using SAP B1 bulk query
         
@@ -3462,83 +4036,18 @@ class SAPIntegration:
         Returns:
             Dict with validation results for each serial in the batch
         """
-        results = {}
-        
         try:
-            # Create SQL query for batch validation
-            serial_list = "','".join(serial_batch)
-            sql_query = f"""
-            SELECT 
-                SN.DistNumber as SerialNumber,
-                SN.ItemCode,
-                SN.WhsCode,
-                CASE WHEN SN.WhsCode = '{warehouse_code}' THEN 1 ELSE 0 END as AvailableInWarehouse
-            FROM OSRN SN 
-            WHERE SN.DistNumber IN ('{serial_list}')
-            AND SN.ItemCode = '{item_code}'
-            """
-            
             # Use custom SQL query endpoint
             api_url = f"{self.base_url}/b1s/v1/SQLQueries('Batch_Series_Validation')/List"
-            
-            payload = {
-                "ParamList": f"sqlQuery={sql_query}"
-            }
-            
+            payload = self._batch_chunk_payload(serial_batch, item_code, warehouse_code)
             response = self.session.post(api_url, json=payload, timeout=60)
-            
-            if response.status_code == 200:
-                data = response.json()
-                found_serials = {item.get('SerialNumber'): item for item in data.get('value', [])}
-                
-                # Process each serial in the batch
-                for serial in serial_batch:
-                    if serial in found_serials:
-                        series_data = found_serials[serial]
-                        available_in_warehouse = bool(series_data.get('AvailableInWarehouse', 0))
-                        
-                        results[serial] = {
-                            'valid': True,
-                            'DistNumber': series_data.get('SerialNumber'),
-                            'ItemCode': series_data.get('ItemCode'),
-                            'WhsCode': series_data.get('WhsCode'),
-                            'available_in_warehouse': available_in_warehouse,
-                            'validation_type': 'batch_warehouse_specific' if available_in_warehouse else 'batch_warehouse_unavailable',
-                            'message': f'Series {serial} validated in batch'
-                        }
-                        
-                        if not available_in_warehouse:
-                            results[serial]['warning'] = f'Series {serial} is not available in warehouse {warehouse_code}'
-                    else:
-                        # Serial not found in SAP
-                        results[serial] = {
-                            'valid': False,
-                            'error': f'Series {serial} not found in SAP system',
-                            'available_in_warehouse': False,
-                            'validation_type': 'batch_not_found'
-                        }
-            else:
-                # API error - mark all serials as failed
-                error_msg = f'SAP API error: {response.status_code} - {response.text}'
-                for serial in serial_batch:
-                    results[serial] = {
-                        'valid': False,
-                        'error': error_msg,
-                        'validation_type': 'batch_api_error'
-                    }
-                
+            data = response.json() if response.status_code == 200 else None
+            return self._batch_chunk_results(serial_batch, warehouse_code,
+                                             {'status': response.status_code, 'data': data, 'text': response.text})
         except Exception as e:
             logging.error(f"❌ Error in batch chunk validation: {str(e)}")
             # Mark all serials in chunk as failed
-            error_msg = f'Batch chunk validation error: {str(e)}'
-            for serial in serial_batch:
-                results[serial] = {
-                    'valid': False,
-                    'error': error_msg,
-                    'validation_type': 'batch_exception'
-                }
-        
-        return results
+            return self._batch_chunk_results(serial_batch, warehouse_code, {'status': 0, 'error': str(e)})
 
 
     def create_serial_number_stock_transfer(self, serial_transfer_document):
@@ -3649,6 +4158,7 @@ class SAPIntegration:
                 result = response.json()
                 doc_num = result.get('DocNum')
                 logging.info(f"✅ Successfully created Serial Number Stock Transfer {doc_num}")
+                serial_index.apply_stock_transfer(transfer_data)
                 
                 return {
                     'success': True,
@@ -3692,6 +4202,21 @@ class SAPIntegration:
         Uses the specific API endpoint: SQLQueries('Item_Validation')/List
         """
         try:
+            item_code = serial_index.find_item(serial_number, warehouse_code)
+            if item_code:
+                item_description = serial_index.item_name(item_code, warehouse_code)
+                if not item_description and self.ensure_logged_in():
+                    item_description = self._get_item_description(item_code)
+                    serial_index.remember_item_name(item_code, warehouse_code, item_description)
+                return {
+                    'valid': True,
+                    'item_code': item_code,
+                    'item_description': item_description or f'Item {item_code}',
+                    'warehouse_code': warehouse_code,
+                    'dist_number': serial_number,
+                    'source': 'serial_index'
+                }
+
             if not self.ensure_logged_in():
                 logging.warning("SAP B1 not available, returning mock validation for Serial Item Transfer")
                 return {
@@ -3728,6 +4253,8 @@ class SAPIntegration:
                     
                     # For item description, we'll need to make another call to get item details
                     item_description = self._get_item_description(item_code)
+                    serial_index.confirm(self, item_code, whs_code or warehouse_code, dist_number or serial_number)
+                    serial_index.remember_item_name(item_code, whs_code or warehouse_code, item_description)
                     
                     logging.info(f"✅ Serial number {serial_number} validated successfully")
                     logging.info(f"📋 Item Code: {item_code}, Warehouse: {whs_code}")
@@ -3790,11 +4317,12 @@ class SAPIntegration:
         # Fallback to item code if description not found
         return f'Item {item_code}'
 
+    @coalesced
     def get_warehouses(self):
         """Get warehouse list from SAP B1"""
         try:
             if not self.ensure_logged_in():
-                return []
+                return self._get_local_warehouses() if self.is_offline else []
             
             url = f"{self.base_url}/b1s/v1/Warehouses?$select=WarehouseCode,WarehouseName"
             headers = {"Prefer": "odata.maxpagesize=0"}
@@ -3813,6 +4341,18 @@ class SAPIntegration:
             logging.error(f"❌ Error getting warehouses: {str(e)}")
             return []
 
+    def _get_local_warehouses(self):
+        """Warehouses synced into the local branches table, used while SAP is unreachable"""
+        try:
+            from app import db
+            rows = db.session.execute(db.text(
+                "SELECT id, name FROM branches WHERE is_active = :active ORDER BY id"), {'active': True}).fetchall()
+            logging.info(f"📦 SAP B1 offline - serving {len(rows)} warehouses from the local branches table")
+            return [{'WarehouseCode': row[0], 'WarehouseName': row[1]} for row in rows]
+        except Exception as e:
+            logging.error(f"Error reading local warehouses: {str(e)}")
+            return []
+
     def validate_item_for_direct_transfer(self, item_code):
         """
         Validate item code and determine if it's serial or batch managed
@@ -3827,7 +4367,13 @@ class SAPIntegration:
                 "ParamList": f"itemCode='{item_code}'"
             }
             
-            response = self.session.post(url, json=payload, timeout=10)
+            # The description lookup does not depend on the validation query, so both run at once
+            import fanout
+            describer = self.sibling()
+            lookups = fanout.gather(
+                response=lambda: self.session.post(url, json=payload, timeout=10),
+                description=lambda: describer._get_item_description(item_code))
+            response = lookups['response']
             
             if response.status_code == 200:
                 data = response.json()
@@ -3845,7 +4391,7 @@ class SAPIntegration:
                     else:
                         item_type = 'none'
                     
-                    item_description = self._get_item_description(item_code)
+                    item_description = lookups['description']
                     
                     return {
                         'valid': True,
@@ -3936,6 +4482,7 @@ class SAPIntegration:
                 doc_entry = data.get('DocEntry')
                 
                 logging.info(f"✅ Direct Inventory Transfer posted to SAP B1: DocNum={doc_num}, DocEntry={doc_entry}")
+                serial_index.apply_stock_transfer(payload)
                 return {
                     'success': True,
                     'document_number': str(doc_num),
@@ -4110,7 +4657,26 @@ class SAPIntegration:
                 'success': False,
                 'error': 'SAP B1 connection unavailable'
             }
-        
+
+        available = serial_index.serials(self, item_code, warehouse_code)
+        if available is not None:
+            serial_numbers = [{
+                'serial_number': serial,
+                'internal_serial': serial,
+                'system_number': system_number,
+                'warehouse_code': warehouse_code,
+                'item_code': item_code,
+                'status': '0'
+            } for serial, system_number in sorted(available.items())]
+            return {
+                'success': True,
+                'item_code': item_code,
+                'warehouse_code': warehouse_code,
+                'serial_numbers': serial_numbers,
+                'count': len(serial_numbers),
+                'source': 'serial_index'
+            }
+
         try:
             # Query SerialNumberDetails with filters
             filter_query = f"ItemCode eq '{item_code}' and WhsCode eq '{warehouse_code}' and Status eq '0'"
@@ -106,6 +106,16 @@ class SAPQueryManager:
                 "SqlCode": "Get_INVCNT_Series",
                 "SqlName": "Get_INVCNT_Series",
                 "SqlText": "SELECT n.[Series],n.[SeriesName] FROM [NNM1] n WHERE n.[ObjectCode] = '1470000065' ORDER BY n.[SeriesName]"
+            },
+            {
+                "SqlCode": "Serial_Availability_Watermark",
+                "SqlName": "Serial_Availability_Watermark",
+                "SqlText": "SELECT ISNULL(MAX(T0.[LogEntry]), 0) AS [LogEntry] FROM [OITL] T0 WHERE T0.[ItemCode] = :itemCode AND T0.[LocCode] = :whsCode"
+            },
+            {
+                "SqlCode": "Serial_Availability_Delta",
+                "SqlName": "Serial_Availability_Delta",
+                "SqlText": "SELECT T2.[DistNumber], T2.[SysNumber], ISNULL(T3.[Quantity], 0) AS [Quantity], MAX(T0.[LogEntry]) AS [LogEntry] FROM [OITL] T0 INNER JOIN [ITL1] T1 ON T0.[LogEntry] = T1.[LogEntry] INNER JOIN [OSRN] T2 ON T1.[ItemCode] = T2.[ItemCode] AND T1.[SysNumber] = T2.[SysNumber] LEFT JOIN [OSRQ] T3 ON T2.[ItemCode] = T3.[ItemCode] AND T2.[SysNumber] = T3.[SysNumber] AND T3.[WhsCode] = T0.[LocCode] WHERE T0.[ItemCode] = :itemCode AND T0.[LocCode] = :whsCode AND T0.[LogEntry] > :logEntry GROUP BY T2.[DistNumber], T2.[SysNumber], T3.[Quantity] ORDER BY MAX(T0.[LogEntry])"
             }
         ]
     
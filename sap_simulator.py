@@ -0,0 +1,410 @@
+"""
+SAP B1 Service Layer Simulator
+A small stand-in for the Service Layer endpoints the WMS calls, used by
+benchmark_wms.py and for local load testing without a real SAP server.
+
+Run standalone:
+    python sap_simulator.py --port 50000 --latency-ms 40 --items 500
+
+then point the WMS at it with SAP_B1_SERVER=http://127.0.0.1:50000
+"""
+
+import re
+import time
+import uuid
+import random
+import logging
+import argparse
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from flask import Flask, jsonify, request
+
+
+class SimulatorConfig:
+    """Latency and dataset size of the simulated company database"""
+
+    def __init__(self, latency_ms=30, jitter_ms=10, items=200, warehouses=4,
+                 bins_per_warehouse=20, serials=5000, purchase_orders=50,
+                 business_partners=200, seed=42):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.items = items
+        self.warehouses = warehouses
+        self.bins_per_warehouse = bins_per_warehouse
+        self.serials = serials
+        self.purchase_orders = purchase_orders
+        self.business_partners = business_partners
+        self.seed = seed
+
+
+class SimulatorDataset:
+    """Deterministic master data generated from a SimulatorConfig"""
+
+    def __init__(self, config):
+        rnd = random.Random(config.seed)
+        today = datetime.now().strftime('%Y-%m-%dT00:00:00Z')
+
+        self.warehouses = [{
+            'WarehouseCode': f'WH{w:02d}',
+            'WarehouseName': f'Warehouse {w}',
+            'BusinessPlaceID': 1 + (w % 3),
+            'DefaultBin': 1,
+            'Inactive': 'tNO',
+        } for w in range(1, config.warehouses + 1)]
+        warehouse_codes = [w['WarehouseCode'] for w in self.warehouses]
+
+        self.items = []
+        for i in range(1, config.items + 1):
+            kind = i % 3  # 0 = serial, 1 = batch, 2 = neither
+            self.items.append({
+                'ItemCode': f'ITM{i:05d}',
+                'ItemName': f'Simulated Item {i}',
+                'InventoryUoM': 'EA',
+                'InventoryUOM': 'EA',
+                'QuantityOnStock': float(rnd.randint(10, 500)),
+                'ManageSerialNumbers': 'tYES' if kind == 0 else 'tNO',
+                'ManageBatchNumbers': 'tYES' if kind == 1 else 'tNO',
+                'Valid': 'tYES',
+            })
+        self.items_by_code = {item['ItemCode']: item for item in self.items}
+        serial_items = [i for i in self.items if i['ManageSerialNumbers'] == 'tYES'] or self.items
+
+        self.bins = []
+        abs_entry = 1
+        for whs in warehouse_codes:
+            for b in range(1, config.bins_per_warehouse + 1):
+                self.bins.append({
+                    'AbsEntry': abs_entry,
+                    'BinCode': f'{whs}-BIN-{b:03d}',
+                    'Warehouse': whs,
+                    'Active': 'Y',
+                    'Inactive': 'tNO',
+                })
+                abs_entry += 1
+
+        # Each item is stocked in a subset of warehouses
+        self.item_warehouse = defaultdict(list)
+        for item in self.items:
+            for whs in rnd.sample(warehouse_codes, k=max(1, len(warehouse_codes) // 2)):
+                self.item_warehouse[whs].append({
+                    'Items': {
+                        'ItemCode': item['ItemCode'],
+                        'ItemName': item['ItemName'],
+                        'QuantityOnStock': item['QuantityOnStock'],
+                    },
+                    'Items/ItemWarehouseInfoCollection': {
+                        'InStock': float(rnd.randint(1, 100)),
+                        'Ordered': 0.0,
+                        'StandardAveragePrice': round(rnd.uniform(1, 250), 2),
+                    },
+                })
+
+        self.batches = defaultdict(list)
+        for item in self.items:
+            if item['ManageBatchNumbers'] == 'tYES':
+                for n in range(1, 3):
+                    self.batches[item['ItemCode']].append({
+                        'ItemCode': item['ItemCode'],
+                        'Batch': f"B{item['ItemCode'][3:]}-{n}",
+                        'Status': 'bdsStatus_Released',
+                        'AdmissionDate': today,
+                        'ExpirationDate': (datetime.now() + timedelta(days=365)).strftime('%Y-%m-%dT00:00:00Z'),
+                    })
+
+        # Serial numbers SN0000001... are spread across the serial-managed items,
+        # always in the first warehouse so a transfer from WH01 validates them all
+        self.serials = {}
+        for s in range(1, config.serials + 1):
+            item = serial_items[s % len(serial_items)]
+            serial = f'SN{s:07d}'
+            self.serials[serial] = {
+                'ItemCode': item['ItemCode'],
+                'DistNumber': serial,
+                'WhsCode': warehouse_codes[0],
+                'Quantity': 1,
+            }
+
+        self.business_partners = [{
+            'CardCode': f'{"V" if n % 2 else "C"}{n:05d}',
+            'CardName': f'Simulated Partner {n}',
+            'CardType': 'cSupplier' if n % 2 else 'cCustomer',
+            'Valid': 'tYES',
+        } for n in range(1, config.business_partners + 1)]
+        suppliers = [bp for bp in self.business_partners if bp['CardType'] == 'cSupplier'] or self.business_partners
+
+        self.purchase_orders = {}
+        for p in range(1, config.purchase_orders + 1):
+            doc_num = 1000 + p
+            vendor = suppliers[p % len(suppliers)]
+            lines = []
+            for line_num, item in enumerate(rnd.sample(self.items, k=min(5, len(self.items)))):
+                lines.append({
+                    'LineNum': line_num,
+                    'ItemCode': item['ItemCode'],
+                    'ItemDescription': item['ItemName'],
+                    'Quantity': float(rnd.randint(1, 50)),
+                    'RemainingOpenQuantity': float(rnd.randint(1, 50)),
+                    'Price': round(rnd.uniform(1, 250), 2),
+                    'UoMCode': 'EA',
+                    'WarehouseCode': warehouse_codes[p % len(warehouse_codes)],
+                    'LineStatus': 'bost_Open',
+                })
+            self.purchase_orders[doc_num] = {
+                'DocEntry': p,
+                'DocNum': doc_num,
+                'CardCode': vendor['CardCode'],
+                'CardName': vendor['CardName'],
+                'DocDate': today,
+                'DocDueDate': today,
+                'DocumentStatus': 'bost_Open',
+                'Series': 10,
+                'DocumentLines': lines,
+            }
+
+
+_FILTER_EQ = re.compile(r"([\w/]+)\s+eq\s+'?([^'\s)]+)'?")
+_PARAM = re.compile(r"(\w+)='([^']*)'")
+
+
+def parse_filter(filter_text):
+    """Extract "Field eq 'value'" terms from an OData $filter (enough for the WMS queries)"""
+    return dict(_FILTER_EQ.findall(filter_text or ''))
+
+
+def parse_params(param_list):
+    """Parse a SQLQueries ParamList such as "itemCode='A'&whcode='WH01'" """
+    return dict(_PARAM.findall(param_list or ''))
+
+
+def _matches(record, conditions):
+    for field, value in conditions.items():
+        if '/' in field or field not in record:
+            continue
+        if str(record[field]) != value:
+            return False
+    return True
+
+
+def _odata(records):
+    return jsonify({'odata.metadata': '$metadata', 'value': records})
+
+
+def create_simulator_app(config=None):
+    """Build the simulator Flask app; call counts are served from /_sim/stats"""
+    config = config or SimulatorConfig()
+    data = SimulatorDataset(config)
+    sim = Flask('sap_simulator')
+    sim.config['SIMULATOR'] = config
+    sim.config['DATASET'] = data
+
+    stats_lock = threading.Lock()
+    calls = defaultdict(int)
+    sessions = set()
+    doc_counter = {'next': 50000}
+
+    def next_doc():
+        with stats_lock:
+            doc_counter['next'] += 1
+            return doc_counter['next']
+
+    def endpoint_name():
+        path = request.path.replace('/b1s/v1/', '', 1)
+        return re.sub(r"\(.*?\)", '()', path) if not path.startswith('SQLQueries') else path
+
+    @sim.before_request
+    def simulate_service_layer():
+        if request.path.startswith('/_sim'):
+            return None
+        with stats_lock:
+            calls[f"{request.method} {endpoint_name()}"] += 1
+        if config.latency_ms or config.jitter_ms:
+            delay = config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)
+            time.sleep(max(0.0, delay) / 1000.0)
+        if request.path not in ('/b1s/v1/Login', '/b1s/v1/Logout') and \
+                request.cookies.get('B1SESSION') not in sessions:
+            return jsonify({'error': {'code': 301, 'message': {'value': 'Invalid session.'}}}), 401
+        return None
+
+    @sim.route('/_sim/stats')
+    def sim_stats():
+        with stats_lock:
+            return jsonify({'calls': dict(calls), 'total': sum(calls.values())})
+
+    @sim.route('/_sim/reset', methods=['POST'])
+    def sim_reset():
+        with stats_lock:
+            calls.clear()
+        return jsonify({'success': True})
+
+    @sim.route('/b1s/v1/Login', methods=['POST'])
+    def login():
+        session_id = str(uuid.uuid4())
+        with stats_lock:
+            sessions.add(session_id)
+        response = jsonify({'SessionId': session_id, 'Version': '1000190', 'SessionTimeout': 30})
+        response.set_cookie('B1SESSION', session_id)
+        response.set_cookie('ROUTEID', '.node1')
+        return response
+
+    @sim.route('/b1s/v1/Logout', methods=['POST'])
+    def logout():
+        with stats_lock:
+            sessions.discard(request.cookies.get('B1SESSION'))
+        return '', 204
+
+    @sim.route("/b1s/v1/SQLQueries('<name>')/List", methods=['GET', 'POST'])
+    def sql_query(name):
+        body = request.get_json(silent=True) or {}
+        params = parse_params(body.get('ParamList') or request.args.get('ParamList'))
+
+        if name == 'Item_Validation':
+            serial = data.serials.get(params.get('seriel_number') or params.get('serial_number'))
+            whs = params.get('whcode')
+            rows = [serial] if serial and (not whs or serial['WhsCode'] == whs) else []
+        elif name == 'ItemCode_Batch_Serial_Val':
+            item = data.items_by_code.get(params.get('itemCode'))
+            rows = [{
+                'ItemCode': item['ItemCode'],
+                'BatchNum': 'Y' if item['ManageBatchNumbers'] == 'tYES' else 'N',
+                'SerialNum': 'Y' if item['ManageSerialNumbers'] == 'tYES' else 'N',
+                'NonBatch_NonSerialMethod': 'A',
+            }] if item else []
+        elif name in ('Series_Validation', 'Batch_Series_Validation'):
+            serial = data.serials.get(params.get('series') or params.get('serialNumber'))
+            rows = [serial] if serial else []
+        elif name.endswith('_Series'):
+            rows = [{'Series': 10, 'SeriesName': 'Primary'}, {'Series': 11, 'SeriesName': 'Secondary'}]
+        elif name == 'Get_Open_PO_DocNum':
+            rows = [{'DocEntry': po['DocEntry'], 'DocNum': po['DocNum'], 'CardCode': po['CardCode'],
+                     'CardName': po['CardName']} for po in data.purchase_orders.values()]
+        elif name.startswith('Get_Open_') or name.endswith('_DocEntry'):
+            rows = [{'DocEntry': n, 'DocNum': 2000 + n} for n in range(1, 21)]
+        elif name.endswith('ManagedItemWH'):
+            rows = [{'ItemCode': i['ItemCode'], 'ItemName': i['ItemName'], 'WhsCode': params.get('whsCode', 'WH01'),
+                     'OnHand': i['QuantityOnStock']} for i in data.items[:50]]
+        else:
+            rows = []
+        return jsonify({'SqlText': f'-- simulated {name}', 'value': rows})
+
+    @sim.route('/b1s/v1/BinLocations')
+    def bin_locations():
+        conditions = parse_filter(request.args.get('$filter'))
+        return _odata([b for b in data.bins if _matches(b, conditions)])
+
+    @sim.route('/b1s/v1/Warehouses')
+    def warehouses():
+        conditions = parse_filter(request.args.get('$filter'))
+        return _odata([w for w in data.warehouses if _matches(w, conditions)])
+
+    @sim.route('/b1s/v1/$crossjoin(Items,Items/ItemWarehouseInfoCollection)')
+    def crossjoin_items():
+        conditions = parse_filter(request.args.get('$filter'))
+        whs = conditions.get('Items/ItemWarehouseInfoCollection/WarehouseCode')
+        return _odata(data.item_warehouse.get(whs, []))
+
+    @sim.route('/b1s/v1/BatchNumberDetails')
+    def batch_number_details():
+        conditions = parse_filter(request.args.get('$filter'))
+        return _odata(data.batches.get(conditions.get('ItemCode'), []))
+
+    @sim.route('/b1s/v1/SerialNumberDetails')
+    def serial_number_details():
+        conditions = parse_filter(request.args.get('$filter'))
+        serial = data.serials.get(conditions.get('SerialNumber'))
+        return _odata([{'ItemCode': serial['ItemCode'], 'SerialNumber': serial['DistNumber']}] if serial else [])
+
+    @sim.route('/b1s/v1/Items')
+    def items():
+        conditions = parse_filter(request.args.get('$filter'))
+        top = request.args.get('$top', type=int) or 20
+        skip = request.args.get('$skip', type=int) or 0
+        return _odata([i for i in data.items if _matches(i, conditions)][skip:skip + top])
+
+    @sim.route("/b1s/v1/Items('<item_code>')")
+    def item(item_code):
+        found = data.items_by_code.get(item_code)
+        if not found:
+            return jsonify({'error': {'code': -2028, 'message': {'value': 'No matching records found'}}}), 404
+        return jsonify(found)
+
+    @sim.route('/b1s/v1/BusinessPartners')
+    def business_partners():
+        conditions = parse_filter(request.args.get('$filter'))
+        top = request.args.get('$top', type=int) or 20
+        skip = request.args.get('$skip', type=int) or 0
+        matched = [bp for bp in data.business_partners if _matches(bp, conditions)]
+        return _odata(matched[skip:skip + top])
+
+    @sim.route('/b1s/v1/PurchaseOrders')
+    def purchase_orders():
+        conditions = parse_filter(request.args.get('$filter'))
+        doc_num = conditions.get('DocNum')
+        if doc_num:
+            po = data.purchase_orders.get(int(doc_num)) if doc_num.isdigit() else None
+            return _odata([po] if po else [])
+        return _odata(list(data.purchase_orders.values())[:20])
+
+    @sim.route('/b1s/v1/PickLists')
+    def pick_lists():
+        return _odata([{'Absoluteentry': n, 'Name': f'Pick {n}', 'Status': 'ps_Released',
+                        'PickListsLines': []} for n in range(1, 11)])
+
+    @sim.route('/b1s/v1/InventoryTransferRequests')
+    def transfer_requests():
+        return _odata([])
+
+    def create_document(kind):
+        payload = request.get_json(silent=True) or {}
+        doc_num = next_doc()
+        return jsonify({'DocEntry': doc_num, 'DocNum': doc_num, 'DocType': kind,
+                        'Lines': len(payload.get('DocumentLines') or payload.get('StockTransferLines') or [])}), 201
+
+    @sim.route('/b1s/v1/PurchaseDeliveryNotes', methods=['POST'])
+    def purchase_delivery_notes():
+        return create_document('PurchaseDeliveryNotes')
+
+    @sim.route('/b1s/v1/StockTransfers', methods=['POST'])
+    def stock_transfers():
+        return create_document('StockTransfers')
+
+    @sim.route('/b1s/v1/DeliveryNotes', methods=['POST'])
+    def delivery_notes():
+        return create_document('DeliveryNotes')
+
+    return sim
+
+
+def start_simulator(config=None, host='127.0.0.1', port=0):
+    """Serve the simulator from a daemon thread; returns (server, base_url)"""
+    from werkzeug.serving import make_server
+
+    server = make_server(host, port, create_simulator_app(config), threaded=True)
+    thread = threading.Thread(target=server.serve_forever, name='sap-simulator', daemon=True)
+    thread.start()
+    base_url = f"http://{host}:{server.server_port}"
+    logging.info(f"🧪 SAP Service Layer simulator listening on {base_url}")
+    return server, base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SAP B1 Service Layer simulator')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=50000)
+    parser.add_argument('--latency-ms', type=float, default=30)
+    parser.add_argument('--jitter-ms', type=float, default=10)
+    parser.add_argument('--items', type=int, default=200)
+    parser.add_argument('--warehouses', type=int, default=4)
+    parser.add_argument('--bins', type=int, default=20, help='bins per warehouse')
+    parser.add_argument('--serials', type=int, default=5000)
+    args = parser.parse_args()
+
+    config = SimulatorConfig(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, items=args.items,
+                             warehouses=args.warehouses, bins_per_warehouse=args.bins, serials=args.serials)
+    create_simulator_app(config).run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,92 @@
+"""
+Scan Manifests
+Compact list of the serial or batch numbers available for one item in one
+warehouse, for scanner clients that check scans locally and only confirm
+them with the server when the document is submitted. The web templates do
+not use it - their forms already hold the warehouse's serials and batches -
+so decoding is left to the API client.
+
+    {"v": 1, "type": "serial", "item_code": "...", "warehouse_code": "...",
+     "version": "<sha1 prefix>", "count": 3, "encoding": "front-coded",
+     "codes": "0,SN-000120\\n8,1\\n8,7"}
+
+Codes are sorted and front-coded: each line is "<characters shared with the
+previous code>,<rest of the code>". Batch manifests add "quantities", the
+available quantity of each code in the same order. The version is a hash of
+the content, so it doubles as the ETag: a scanner that already holds the
+manifest gets 304 Not Modified from /api/scan-manifest.
+"""
+
+import json
+import hashlib
+
+FORMAT_VERSION = 1
+
+
+def _shared_prefix(a, b):
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+def front_code(codes):
+    """Sorted codes as newline-separated "<shared prefix length>,<suffix>" lines"""
+    lines, previous = [], ''
+    for code in codes:
+        n = _shared_prefix(previous, code)
+        lines.append(f"{n},{code[n:]}")
+        previous = code
+    return '\n'.join(lines)
+
+
+def front_decode(text):
+    """Inverse of front_code"""
+    codes, previous = [], ''
+    for line in text.split('\n') if text else []:
+        n, _, suffix = line.partition(',')
+        previous = previous[:int(n)] + suffix
+        codes.append(previous)
+    return codes
+
+
+def build(kind, item_code, warehouse_code, quantities):
+    """Manifest dict for {code: available quantity} (quantities only kept for batches)"""
+    codes = sorted(code for code in quantities if code)
+    body = {
+        'v': FORMAT_VERSION,
+        'type': kind,
+        'item_code': item_code,
+        'warehouse_code': warehouse_code,
+        'count': len(codes),
+        'encoding': 'front-coded',
+        'codes': front_code(codes),
+    }
+    if kind == 'batch':
+        body['quantities'] = [float(quantities[code] or 0) for code in codes]
+    digest = hashlib.sha1(json.dumps(body, sort_keys=True, separators=(',', ':')).encode('utf-8'))
+    body['version'] = digest.hexdigest()[:20]
+    return body
+
+
+def load(sap, kind, item_code, warehouse_code):
+    """(manifest, None) built from SAP, or (None, error message)"""
+    if kind == 'serial':
+        result = sap.get_available_serial_numbers(item_code, warehouse_code)
+        if not result.get('success'):
+            return None, result.get('error', 'Could not read serial numbers')
+        available = {row['serial_number']: 1 for row in result.get('serial_numbers', [])}
+    elif kind == 'batch':
+        result = sap.get_batch_managed_item_warehouses(item_code)
+        if not result.get('success'):
+            return None, result.get('error', 'Could not read batch numbers')
+        available = {}
+        for row in result.get('warehouses', []):
+            if str(row.get('WarehouseCode', '')).upper() != warehouse_code.upper() or not row.get('BatchNumber'):
+                continue
+            available[row['BatchNumber']] = available.get(row['BatchNumber'], 0) + float(row.get('AvailableQty') or 0)
+    else:
+        return None, f'Invalid manifest type: {kind}'
+    return build(kind, item_code, warehouse_code, available), None
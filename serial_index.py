@@ -0,0 +1,319 @@
+"""
+Serial Availability Index
+In-memory set of the serial numbers available per (ItemCode, WhsCode), so a
+scanned serial is checked with a dictionary lookup instead of a Service Layer
+call.
+
+    if serial_index.lookup(sap, item_code, whs_code, serial_number):
+        ...  # available - no SAP call
+
+A key is loaded once, on first use, from SerialNumberDetails through
+SAPIntegration.read_pages (in the background for scans, in the foreground for
+get_available_serial_numbers, which needs the full list anyway). After that it
+is kept fresh by a delta poll: the saved SQL query Serial_Availability_Delta
+returns the serials of the item whose inventory log (OITL) entries for the
+warehouse are newer than the last one seen, with their current OSRQ quantity.
+Where that query is missing the key is reloaded instead. Stock transfers
+posted by WMS move their serials between keys as soon as SAP accepts them.
+
+The index only answers "available"; a serial it does not hold (a miss, or a
+key still loading) is checked with SAP as before, and a serial SAP confirms is
+added. Each worker process has its own index, capped at SERIAL_INDEX_MAX_KEYS
+keys (least recently used dropped first). Counters are served from
+/api/sap-metrics.
+
+Environment:
+    SERIAL_INDEX                  - 0 disables the index (default on)
+    SERIAL_INDEX_POLL_SECONDS     - age after which a key is delta-polled (default 30)
+    SERIAL_INDEX_RELOAD_SECONDS   - age after which a key without delta query is reloaded (default 300)
+    SERIAL_INDEX_MAX_KEYS         - item/warehouse keys kept per worker process (default 200)
+    SERIAL_INDEX_WORKERS          - background load / poll threads per worker process (default 2)
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _env_int(name, default):
+    try:
+        return max(1, int(os.environ.get(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+ENABLED = os.environ.get('SERIAL_INDEX', '1').lower() not in ('0', 'false', 'no')
+POLL_SECONDS = _env_int('SERIAL_INDEX_POLL_SECONDS', 30)
+RELOAD_SECONDS = _env_int('SERIAL_INDEX_RELOAD_SECONDS', 300)
+MAX_KEYS = _env_int('SERIAL_INDEX_MAX_KEYS', 200)
+WORKERS = _env_int('SERIAL_INDEX_WORKERS', 2)
+
+SELECT = 'DistNumber,ItemCode,WhsCode,SystemNumber,Status'
+DELTA_QUERY = 'Serial_Availability_Delta'
+WATERMARK_QUERY = 'Serial_Availability_Watermark'
+
+
+def _quote(value):
+    return str(value).replace("'", "''")
+
+
+class _Entry:
+    __slots__ = ('serials', 'watermark', 'loaded_at', 'polled_at', 'busy', 'item_name')
+
+    def __init__(self, serials, watermark):
+        self.serials = serials  # DistNumber -> SystemNumber
+        self.watermark = watermark  # highest OITL LogEntry applied, None without delta query
+        self.loaded_at = self.polled_at = time.time()
+        self.busy = False
+        self.item_name = None
+
+
+class SerialIndex:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._loading = set()
+        self._failed = {}  # key -> time of the last failed load
+        self._executor = None
+        self._executor_pid = None
+        self._stats = {'hits': 0, 'misses': 0, 'loads': 0, 'load_failures': 0, 'polls': 0,
+                       'poll_changes': 0, 'reloads': 0, 'postings': 0}
+
+    @staticmethod
+    def _key(item_code, whs_code):
+        return (str(item_code or '').strip().upper(), str(whs_code or '').strip().upper())
+
+    def _pool(self):
+        """Background thread pool, created on first use in each worker process"""
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='serial-index')
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _store(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > MAX_KEYS:
+                self._entries.popitem(last=False)
+
+    # ---- loading and polling (SAP calls, never under the lock) ----
+
+    def _watermark(self, sap, item_code, whs_code):
+        from sap_integration import LookupStrategyUnavailable
+        try:
+            rows = sap._sql_query_rows(WATERMARK_QUERY, {
+                'ParamList': f"itemCode='{item_code}'&whsCode='{whs_code}'"})
+        except LookupStrategyUnavailable:
+            return None
+        return int((rows[0].get('LogEntry') if rows else 0) or 0)
+
+    def _load(self, sap, item_code, whs_code):
+        """Read every available serial of the key from SAP; returns the new entry or None"""
+        key = self._key(item_code, whs_code)
+        try:
+            # Taken before the read so changes made during it are replayed by the next poll
+            watermark = self._watermark(sap, item_code, whs_code)
+            serials = {}
+            flt = f"ItemCode eq '{_quote(item_code)}' and WhsCode eq '{_quote(whs_code)}' and Status eq '0'"
+            for records in sap.read_pages('SerialNumberDetails', SELECT, filter=flt):
+                for record in records:
+                    if record.get('DistNumber'):
+                        serials[record['DistNumber']] = record.get('SystemNumber', 0)
+        except Exception as e:
+            logging.warning(f"⚠️ Serial index load failed for {item_code} in {whs_code}: {str(e)}")
+            with self._lock:
+                self._failed[key] = time.time()
+                self._stats['load_failures'] += 1
+            return None
+
+        entry = _Entry(serials, watermark)
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous is not None:
+                entry.item_name = previous.item_name
+            self._failed.pop(key, None)
+            self._stats['loads'] += 1
+        self._store(key, entry)
+        logging.info(f"🔢 Serial index loaded {len(serials)} serials for {item_code} in {whs_code}")
+        return entry
+
+    def _poll(self, sap, item_code, whs_code, entry):
+        """Apply SAP changes since the entry's watermark, or reload when that is not possible"""
+        from sap_integration import LookupStrategyUnavailable
+        try:
+            if entry.watermark is not None:
+                try:
+                    rows = sap._sql_query_rows(DELTA_QUERY, {
+                        'ParamList': f"itemCode='{item_code}'&whsCode='{whs_code}'&logEntry='{entry.watermark}'"})
+                except LookupStrategyUnavailable as e:
+                    logging.warning(f"⚠️ Serial index delta query unavailable ({str(e)}); reloading instead")
+                    entry.watermark = None
+                else:
+                    with self._lock:
+                        for row in rows:
+                            serial = row.get('DistNumber')
+                            if not serial:
+                                continue
+                            if float(row.get('Quantity') or 0) > 0:
+                                entry.serials[serial] = row.get('SysNumber', entry.serials.get(serial, 0))
+                            else:
+                                entry.serials.pop(serial, None)
+                            entry.watermark = max(entry.watermark, int(row.get('LogEntry') or 0))
+                        entry.polled_at = time.time()
+                        self._stats['polls'] += 1
+                        self._stats['poll_changes'] += len(rows)
+                    return
+
+            entry.polled_at = time.time()
+            if time.time() - entry.loaded_at >= RELOAD_SECONDS:
+                with self._lock:
+                    self._stats['reloads'] += 1
+                self._load(sap, item_code, whs_code)
+        except Exception as e:
+            logging.warning(f"⚠️ Serial index poll failed for {item_code} in {whs_code}: {str(e)}")
+
+    def _refresh_in_background(self, sap, item_code, whs_code, entry):
+        """Start a background load (entry None) or poll, at most one per key"""
+        key = self._key(item_code, whs_code)
+        with self._lock:
+            if entry is None:
+                # A key whose load failed is retried after one poll interval, not on every scan
+                if key in self._loading or time.time() - self._failed.get(key, 0) < POLL_SECONDS:
+                    return
+                self._loading.add(key)
+            else:
+                if entry.busy:
+                    return
+                entry.busy = True
+        worker = sap.sibling()
+
+        def run():
+            try:
+                if not worker.ensure_logged_in():
+                    return
+                if entry is None:
+                    self._load(worker, item_code, whs_code)
+                else:
+                    self._poll(worker, item_code, whs_code, entry)
+            finally:
+                if entry is None:
+                    with self._lock:
+                        self._loading.discard(key)
+                else:
+                    entry.busy = False
+
+        self._pool().submit(run)
+
+    def _entry(self, sap, item_code, whs_code, load=True):
+        """Loaded entry of a key (None while loading), scheduling a poll, and a load unless load is False"""
+        key = self._key(item_code, whs_code)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None and not load:
+            return None
+        if entry is None or time.time() - entry.polled_at >= POLL_SECONDS:
+            self._refresh_in_background(sap, item_code, whs_code, entry)
+        return entry
+
+    # ---- public API ----
+
+    def lookup(self, sap, item_code, whs_code, serial_number):
+        """True when the index holds the serial as available; None means ask SAP"""
+        if not ENABLED or not item_code or not whs_code or not serial_number:
+            return None
+        entry = self._entry(sap, item_code, whs_code)
+        with self._lock:
+            hit = entry is not None and serial_number in entry.serials
+            self._stats['hits' if hit else 'misses'] += 1
+        return True if hit else None
+
+    def find_item(self, serial_number, whs_code):
+        """Item code of an available serial in a warehouse, from the keys already loaded"""
+        if not ENABLED or not serial_number or not whs_code:
+            return None
+        whs = self._key('', whs_code)[1]
+        with self._lock:
+            for (item_code, key_whs), entry in self._entries.items():
+                if key_whs == whs and serial_number in entry.serials:
+                    self._stats['hits'] += 1
+                    return item_code
+            self._stats['misses'] += 1
+        return None
+
+    def serials(self, sap, item_code, whs_code):
+        """{DistNumber: SystemNumber} of a key, loading it in the foreground; None when SAP failed"""
+        if not ENABLED:
+            return None
+        entry = self._entry(sap, item_code, whs_code, load=False)
+        if entry is None:
+            # Registered as loading so scans of the same key do not start a second, background load
+            key = self._key(item_code, whs_code)
+            with self._lock:
+                owner = key not in self._loading
+                self._loading.add(key)
+            try:
+                entry = self._load(sap, item_code, whs_code)
+            finally:
+                if owner:
+                    with self._lock:
+                        self._loading.discard(key)
+            if entry is None:
+                return None
+        with self._lock:
+            return dict(entry.serials)
+
+    def confirm(self, sap, item_code, whs_code, serial_number, system_number=0):
+        """Record a serial SAP reported as available (on a miss); starts loading its key"""
+        if not ENABLED or not item_code or not whs_code or not serial_number:
+            return
+        entry = self._entry(sap, item_code, whs_code)
+        if entry is not None:
+            with self._lock:
+                entry.serials.setdefault(serial_number, system_number)
+
+    def item_name(self, item_code, whs_code):
+        """Item description cached with a loaded key (None when unknown)"""
+        with self._lock:
+            entry = self._entries.get(self._key(item_code, whs_code))
+            return entry.item_name if entry is not None else None
+
+    def remember_item_name(self, item_code, whs_code, name):
+        with self._lock:
+            entry = self._entries.get(self._key(item_code, whs_code))
+            if entry is not None:
+                entry.item_name = name
+
+    def apply_stock_transfer(self, payload):
+        """Move the serials of a StockTransfers payload SAP has accepted between loaded keys"""
+        if not ENABLED:
+            return
+        with self._lock:
+            for line in payload.get('StockTransferLines') or []:
+                item_code = line.get('ItemCode')
+                source = self._entries.get(self._key(item_code, line.get('FromWarehouseCode') or payload.get('FromWarehouse')))
+                target = self._entries.get(self._key(item_code, line.get('WarehouseCode') or payload.get('ToWarehouse')))
+                for serial in line.get('SerialNumbers') or []:
+                    number = serial.get('InternalSerialNumber')
+                    if not number:
+                        continue
+                    system_number = source.serials.pop(number, 0) if source is not None else 0
+                    if target is not None:
+                        target.serials[number] = system_number
+            self._stats['postings'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {'enabled': ENABLED, 'keys': len(self._entries), 'max_keys': MAX_KEYS,
+                    'serials': sum(len(entry.serials) for entry in self._entries.values()),
+                    'loading': len(self._loading), **self._stats}
+
+
+serial_index = SerialIndex()
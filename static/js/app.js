@@ -1,4 +1,8 @@
 // Main application JavaScript
+
+// Actions per /api/sync_offline request - keep at or below the server's OFFLINE_SYNC_MAX_ACTIONS
+const OFFLINE_SYNC_BATCH_SIZE = 1000;
+
 class WMSApp {
     constructor() {
         this.initializeApp();
@@ -243,29 +247,75 @@ class WMSApp {
         localStorage.removeItem(`wms_offline_${key}`);
     }
 
-    // Sync offline data when online
-    async syncOfflineData() {
-        if (!this.isOnline()) return;
+    // Queue a scanner action (bin_scan, grpo_item_add, grpo_serial_add, count_update) for /api/sync_offline.
+    // The id is the idempotency key - re-sending an action never applies it twice.
+    queueOfflineAction(type, payload) {
+        const actions = this.getOfflineData('actions') || [];
+        actions.push({ id: generateUUID(), type: type, payload: payload, client_ts: new Date().toISOString() });
+        this.saveOfflineData('actions', actions);
+    }
 
-        const offlineKeys = Object.keys(localStorage).filter(key => 
-            key.startsWith('wms_offline_')
-        );
+    // Sync offline data when online - queued actions go in batches of at most OFFLINE_SYNC_BATCH_SIZE
+    async syncOfflineData() {
+        if (!this.isOnline() || this.offlineSyncRunning) return;
+        this.offlineSyncRunning = true;
 
-        for (const key of offlineKeys) {
-            try {
-                const data = this.getOfflineData(key.replace('wms_offline_', ''));
+        try {
+            const actions = [...(this.getOfflineData('actions') || [])];
+            const legacyKeys = Object.keys(localStorage)
+                .filter(key => key.startsWith('wms_offline_') && key !== 'wms_offline_actions')
+                .map(key => key.replace('wms_offline_', ''));
+
+            // Older entries hold one payload per key
+            legacyKeys.forEach(key => {
+                const data = this.getOfflineData(key);
                 if (data) {
-                    // Sync data to server
-                    await this.apiRequest('/api/sync_offline', {
-                        method: 'POST',
-                        body: JSON.stringify({ key: key.replace('wms_offline_', ''), data })
-                    });
-                    
-                    this.clearOfflineData(key.replace('wms_offline_', ''));
+                    actions.push({ id: `legacy-${key}`, type: data.type || key, payload: data.payload || data });
                 }
-            } catch (error) {
-                console.error('Error syncing offline data:', error);
+            });
+            if (actions.length === 0) return;
+
+            // Drop everything the server applied, had already applied, or rejected outright;
+            // 'skipped' actions (rolled back with their document) stay queued for the next sync
+            const done = new Set();
+            let applied = 0;
+            for (let start = 0; start < actions.length; start += OFFLINE_SYNC_BATCH_SIZE) {
+                const data = await this.apiRequest('/api/sync_offline', {
+                    method: 'POST',
+                    body: JSON.stringify({ actions: actions.slice(start, start + OFFLINE_SYNC_BATCH_SIZE) })
+                });
+
+                let interrupted = false;
+                (data.results || []).forEach(result => {
+                    if (result.status === 'failed') {
+                        console.warn(`Offline action ${result.id} rejected: ${result.error}`);
+                    }
+                    if (result.status !== 'skipped') {
+                        done.add(result.id);
+                    }
+                    interrupted = interrupted || result.status === 'skipped' || result.status === 'failed';
+                });
+                applied += (data.counts && data.counts.applied) || 0;
+                // A later batch may hold more actions for the document that failed - keep them queued
+                // in order rather than apply them past the failure
+                if (interrupted) break;
             }
+
+            const remaining = (this.getOfflineData('actions') || []).filter(action => !done.has(action.id));
+            if (remaining.length) {
+                this.saveOfflineData('actions', remaining);
+            } else {
+                this.clearOfflineData('actions');
+            }
+            legacyKeys.filter(key => done.has(`legacy-${key}`)).forEach(key => this.clearOfflineData(key));
+
+            if (applied) {
+                this.showAlert(`Synced ${applied} offline action${applied === 1 ? '' : 's'}`, 'success');
+            }
+        } catch (error) {
+            console.error('Error syncing offline data:', error);
+        } finally {
+            this.offlineSyncRunning = false;
         }
     }
 }
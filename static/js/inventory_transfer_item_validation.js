@@ -200,6 +200,28 @@ function onWarehouseChange() {
     }
 }
 
+/**
+ * Select a scanned serial/batch number from the warehouse's list (already loaded with
+ * warehouseData, so no server call)
+ */
+function selectScannedCode(code) {
+    code = String(code || '').trim();
+    if (!code) {
+        return false;
+    }
+
+    const select = document.getElementById(currentItemType === 'batch' ? 'batch_number' : 'serial_number');
+    const option = Array.from(select.options).find(opt => opt.value === code);
+    if (!option) {
+        showNotification(`${code} is not in the list for the selected warehouse`, 'error');
+        return false;
+    }
+
+    select.value = code;
+    select.dispatchEvent(new Event('change'));
+    return true;
+}
+
 /**
  * Populate serial numbers for selected warehouse
  */
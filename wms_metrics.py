@@ -0,0 +1,362 @@
+"""
+WMS Metrics
+Prometheus text-format metrics for the /metrics endpoint: request latency per
+blueprint endpoint, SQLAlchemy pool checkouts and wait time, SAP Service Layer
+calls, logins and circuit breaker state, label renders, the QC / SAP posting
+queue depth and the MySQL replication outbox backlog.
+
+Multi-process mode: gunicorn runs several workers, so each worker writes its
+counters to a JSON file in a shared directory and /metrics merges every file.
+Set WMS_METRICS_DIR (or PROMETHEUS_MULTIPROC_DIR) to enable it; the directory
+is cleared when the server starts.
+
+Environment:
+    WMS_METRICS_DIR           - shared directory for multi-process mode
+    WMS_METRICS_FLUSH_SECONDS - how often a worker writes its file (default 5)
+    WMS_METRICS_TOKEN         - if set, /metrics requires "Authorization: Bearer <token>"
+"""
+
+import os
+import json
+import time
+import glob
+import atexit
+import logging
+import threading
+
+from sqlalchemy.pool import QueuePool
+
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+POOL_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+# name: (type, help, buckets)
+METRICS = {
+    'wms_http_requests_total': ('counter', 'HTTP requests by blueprint endpoint and status', None),
+    'wms_http_request_duration_seconds': ('histogram', 'HTTP request latency by blueprint endpoint', LATENCY_BUCKETS),
+    'wms_db_pool_checkouts_total': ('counter', 'SQLAlchemy connection pool checkouts', None),
+    'wms_db_pool_timeouts_total': ('counter', 'SQLAlchemy pool checkouts that timed out', None),
+    'wms_db_pool_wait_seconds': ('histogram', 'Time spent waiting for a pooled DB connection', POOL_WAIT_BUCKETS),
+    'wms_db_pool_checked_out': ('gauge', 'DB connections currently checked out', None),
+    'wms_db_pool_size': ('gauge', 'Configured DB pool size', None),
+    'wms_db_pool_overflow': ('gauge', 'DB connections open beyond the pool size', None),
+    'wms_sap_calls_total': ('counter', 'SAP Service Layer calls by endpoint and status', None),
+    'wms_sap_call_duration_seconds': ('histogram', 'SAP Service Layer call latency by endpoint', LATENCY_BUCKETS),
+    'wms_sap_logins_total': ('counter', 'SAP Service Layer session logins', None),
+    'wms_sap_circuit_open': ('gauge', 'SAP circuit breaker state per worker (0 closed, 0.5 half-open, 1 open)', None),
+    'wms_labels_rendered_total': ('counter', 'QR / barcode labels rendered', None),
+    'wms_job_queue_depth': ('gauge', 'Documents waiting for QC approval or SAP posting', None),
+    'wms_replication_applied_total': ('counter', 'Outbox entries applied to the secondary MySQL database', None),
+    'wms_replication_errors_total': ('counter', 'Outbox batches that failed on the secondary MySQL database', None),
+    'wms_replication_outbox_pending': ('gauge', 'Outbox entries waiting to be replicated to MySQL', None),
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_process_collectors = []
+_scrape_collectors = []
+_last_flush = 0.0
+
+
+def multiprocess_dir():
+    return os.environ.get('WMS_METRICS_DIR') or os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+
+
+def _key(name, labels):
+    return name, tuple(sorted((labels or {}).items()))
+
+
+def inc(name, labels=None, value=1.0):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + value
+
+
+def observe(name, value, labels=None):
+    buckets = METRICS[name][2]
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [[0] * len(buckets), 0.0, 0]
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                hist[0][i] += 1
+                break
+        hist[1] += value
+        hist[2] += 1
+
+
+def register_process_gauge(collector):
+    """collector() returns [(name, labels, value)] describing this worker process"""
+    _process_collectors.append(collector)
+
+
+def register_scrape_gauge(collector):
+    """collector() returns [(name, labels, value)] computed once per scrape (e.g. from the database)"""
+    _scrape_collectors.append(collector)
+
+
+def _collect(collectors):
+    samples = []
+    for collector in collectors:
+        try:
+            samples.extend(collector())
+        except Exception as e:
+            logging.debug(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {e}")
+    return samples
+
+
+def _local_state():
+    with _lock:
+        counters = [[name, list(labels), value] for (name, labels), value in _counters.items()]
+        histograms = [[name, list(labels), list(h[0]), h[1], h[2]] for (name, labels), h in _histograms.items()]
+    gauges = [[name, sorted((labels or {}).items()), value] for name, labels, value in _collect(_process_collectors)]
+    return {'counters': counters, 'histograms': histograms, 'gauges': gauges}
+
+
+def flush(force=False):
+    """Write this process's metrics to the shared directory (multi-process mode only)"""
+    global _last_flush
+    directory = multiprocess_dir()
+    if not directory:
+        return
+    interval = float(os.environ.get('WMS_METRICS_FLUSH_SECONDS', 5))
+    now = time.time()
+    if not force and now - _last_flush < interval:
+        return
+    _last_flush = now
+
+    try:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'wms_metrics_{os.getpid()}.json')
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(_local_state(), f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logging.warning(f"⚠️ Could not write metrics file to {directory}: {e}")
+
+
+def mark_process_dead():
+    """Keep an exiting worker's counters but drop its per-process gauges"""
+    _process_collectors.clear()
+    flush(force=True)
+
+
+def clear_multiprocess_dir():
+    """Remove worker files left by a previous run - call once before workers start"""
+    directory = multiprocess_dir()
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, 'wms_metrics_*.json*')):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _load_states():
+    directory = multiprocess_dir()
+    if not directory:
+        return [(None, _local_state())]
+
+    flush(force=True)
+    states = []
+    for path in glob.glob(os.path.join(directory, 'wms_metrics_*.json')):
+        pid = os.path.basename(path)[len('wms_metrics_'):-len('.json')]
+        try:
+            with open(path) as f:
+                states.append((pid, json.load(f)))
+        except (OSError, ValueError):
+            continue
+    return states
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}'
+
+
+def _format_value(value):
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+def render_latest():
+    """Merge all process states and render the Prometheus text exposition format"""
+    counters = {}
+    histograms = {}
+    gauges = {}
+
+    for pid, state in _load_states():
+        for name, labels, value in state.get('counters', []):
+            key = (name, tuple(tuple(pair) for pair in labels))
+            counters[key] = counters.get(key, 0.0) + value
+        for name, labels, buckets, total, count in state.get('histograms', []):
+            key = (name, tuple(tuple(pair) for pair in labels))
+            merged = histograms.setdefault(key, [[0] * len(buckets), 0.0, 0])
+            merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+            merged[1] += total
+            merged[2] += count
+        for name, labels, value in state.get('gauges', []):
+            labels = [tuple(pair) for pair in labels]
+            if pid is not None:
+                labels.append(('pid', pid))
+            gauges[(name, tuple(labels))] = value
+
+    for name, labels, value in _collect(_scrape_collectors):
+        gauges[(name, tuple(sorted((labels or {}).items())))] = value
+
+    lines = []
+    for name, (metric_type, help_text, buckets) in METRICS.items():
+        if metric_type == 'counter':
+            samples = sorted((k, v) for k, v in counters.items() if k[0] == name)
+        elif metric_type == 'gauge':
+            samples = sorted((k, v) for k, v in gauges.items() if k[0] == name)
+        else:
+            samples = sorted((k, v) for k, v in histograms.items() if k[0] == name)
+        if not samples:
+            continue
+
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for (_, labels), value in samples:
+            if metric_type != 'histogram':
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+                continue
+            bucket_counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, bucket_counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", bound),))} {cumulative}')
+            lines.append(f'{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {count}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(total)}')
+            lines.append(f'{name}_count{_format_labels(labels)} {count}')
+
+    return '\n'.join(lines) + '\n'
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records checkouts and the time spent waiting for a connection"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception as e:
+            if type(e).__name__ == 'TimeoutError':
+                inc('wms_db_pool_timeouts_total')
+            raise
+        finally:
+            inc('wms_db_pool_checkouts_total')
+            observe('wms_db_pool_wait_seconds', time.perf_counter() - start)
+
+
+def record_label_render(kind, count=1):
+    inc('wms_labels_rendered_total', {'kind': kind}, count)
+
+
+def _record_sap_call(method, endpoint, status, nbytes, duration_ms):
+    status_class = f'{status // 100}xx' if status else 'error'
+    inc('wms_sap_calls_total', {'endpoint': endpoint, 'method': method, 'status': status_class})
+    observe('wms_sap_call_duration_seconds', duration_ms / 1000.0, {'endpoint': endpoint, 'method': method})
+    if endpoint == 'Login':
+        inc('wms_sap_logins_total')
+
+
+def _pool_gauges():
+    from app import db
+    pool = db.engine.pool
+    if not isinstance(pool, QueuePool):
+        return []
+    return [
+        ('wms_db_pool_checked_out', None, pool.checkedout()),
+        ('wms_db_pool_size', None, pool.size()),
+        ('wms_db_pool_overflow', None, max(0, pool.overflow())),
+    ]
+
+
+def _circuit_gauges():
+    from sap_circuit import breaker
+    state = breaker.snapshot()['state']
+    return [('wms_sap_circuit_open', None, {'closed': 0, 'half_open': 0.5}.get(state, 1))]
+
+
+# Document tables with a QC step: submitted = waiting for QC, qc_approved = waiting for SAP posting
+QUEUE_DOCUMENTS = (
+    ('grpo', 'modules.grpo.models', 'GRPODocument'),
+    ('inventory_transfer', 'models', 'InventoryTransfer'),
+    ('serial_item_transfer', 'models', 'SerialItemTransfer'),
+    ('direct_inventory_transfer', 'models', 'DirectInventoryTransfer'),
+    ('sales_delivery', 'modules.sales_delivery.models', 'DeliveryDocument'),
+)
+_queue_cache = {'at': 0.0, 'samples': []}
+
+
+def _queue_depth_gauges():
+    """Queue depth is read from the database at most every 15 seconds"""
+    if time.time() - _queue_cache['at'] < 15:
+        return _queue_cache['samples']
+
+    import importlib
+    from app import db
+    samples = []
+    for document, module_path, model_name in QUEUE_DOCUMENTS:
+        try:
+            model = getattr(importlib.import_module(module_path), model_name)
+            rows = db.session.query(model.status, db.func.count(model.id)) \
+                .filter(model.status.in_(['submitted', 'qc_approved'])) \
+                .group_by(model.status).all()
+        except Exception as e:
+            logging.debug(f"Queue depth for {document} unavailable: {e}")
+            continue
+        counts = dict(rows)
+        samples.append(('wms_job_queue_depth', {'queue': 'qc_approval', 'document': document},
+                        counts.get('submitted', 0)))
+        samples.append(('wms_job_queue_depth', {'queue': 'sap_posting', 'document': document},
+                        counts.get('qc_approved', 0)))
+
+    _queue_cache.update(at=time.time(), samples=samples)
+    return samples
+
+
+def init_app(app):
+    """Time every request and hook the SAP call and DB pool collectors"""
+    from flask import g, request
+    import sap_instrumentation
+
+    sap_instrumentation.add_listener(_record_sap_call)
+    register_process_gauge(_pool_gauges)
+    register_process_gauge(_circuit_gauges)
+    register_scrape_gauge(_queue_depth_gauges)
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_request_metrics(response):
+        start = g.get('metrics_start')
+        if start is None or request.endpoint == 'metrics':
+            return response
+
+        labels = {
+            'blueprint': request.blueprint or 'core',
+            'endpoint': request.endpoint or 'unmatched',
+            'method': request.method,
+        }
+        observe('wms_http_request_duration_seconds', time.perf_counter() - start, labels)
+        inc('wms_http_requests_total', dict(labels, status=str(response.status_code)))
+        flush()
+        return response
+
+    if multiprocess_dir():
+        atexit.register(flush, True)
@@ -0,0 +1,178 @@
+"""
+Production WSGI Server Launcher
+Serves the WMS with a multi-process, multi-threaded gunicorn on Linux and
+with waitress on Windows installs (the PyInstaller build from build_exe.spec)
+"""
+
+import os
+import signal
+import logging
+import multiprocessing
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        logging.warning(f"⚠️ Invalid value for {name}, using default {default}")
+        return default
+
+
+def is_dev_workspace():
+    """True inside a Replit workspace (not a Replit deployment)"""
+    return bool(os.environ.get('REPL_ID')) and not os.environ.get('REPLIT_DEPLOYMENT')
+
+
+def get_server_settings():
+    """Read serving settings from the environment
+
+    WMS_HOST / WMS_PORT       - bind address (default 0.0.0.0:5000)
+    WMS_WORKERS               - worker processes (default 2 x CPU + 1, max 8;
+                                also honours WEB_CONCURRENCY)
+    WMS_THREADS               - threads per worker (default 8)
+    WMS_TIMEOUT               - seconds before a silent worker is restarted (default 120,
+                                SAP postings can take up to 60s)
+    WMS_GRACEFUL_TIMEOUT      - seconds in-flight requests get on shutdown (default 30)
+    WMS_MAX_REQUESTS          - recycle workers after this many requests (default 2000, 0 = never)
+    WMS_PRELOAD               - import the app once in the master before forking (default true)
+    """
+    cpu_count = multiprocessing.cpu_count()
+    default_workers = 1 if is_dev_workspace() else min(cpu_count * 2 + 1, 8)
+
+    return {
+        'host': os.environ.get('WMS_HOST', '0.0.0.0'),
+        'port': _env_int('WMS_PORT', 5000),
+        'workers': max(1, _env_int('WMS_WORKERS', _env_int('WEB_CONCURRENCY', default_workers))),
+        'threads': max(1, _env_int('WMS_THREADS', 8)),
+        'timeout': _env_int('WMS_TIMEOUT', 120),
+        'graceful_timeout': _env_int('WMS_GRACEFUL_TIMEOUT', 30),
+        'keepalive': _env_int('WMS_KEEPALIVE', 5),
+        'max_requests': _env_int('WMS_MAX_REQUESTS', 2000),
+        'preload': os.environ.get('WMS_PRELOAD', 'false' if is_dev_workspace() else 'true').lower() in ('true', '1', 'yes'),
+    }
+
+
+def dispose_database_pool(close=True):
+    """Drop pooled DB connections - used after fork and on shutdown
+
+    close=False (after fork) only forgets the inherited connections; closing
+    them would shut the sockets the parent process is still using.
+    """
+    try:
+        from app import app, db
+        with app.app_context():
+            db.engine.dispose(close=close)
+    except Exception as e:
+        logging.debug(f"Database pool dispose skipped: {e}")
+
+
+def run_gunicorn(app, settings):
+    """Run the app under gunicorn with gthread workers"""
+    from gunicorn.app.base import BaseApplication
+
+    class WMSApplication(BaseApplication):
+
+        def __init__(self, application, options):
+            self.application = application
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                if key in self.cfg.settings and value is not None:
+                    self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+    options = {
+        'bind': f"{settings['host']}:{settings['port']}",
+        'workers': settings['workers'],
+        'threads': settings['threads'],
+        'worker_class': 'gthread',
+        'timeout': settings['timeout'],
+        'graceful_timeout': settings['graceful_timeout'],
+        'keepalive': settings['keepalive'],
+        'max_requests': settings['max_requests'],
+        'max_requests_jitter': settings['max_requests'] // 10,
+        'preload_app': settings['preload'],
+        'on_starting': on_starting,
+        'post_fork': post_fork,
+        'worker_exit': worker_exit,
+    }
+
+    logging.info(f"🚀 Starting gunicorn on {options['bind']} with {settings['workers']} workers "
+                 f"x {settings['threads']} threads")
+    WMSApplication(app, options).run()
+
+
+def run_waitress(app, settings):
+    """Run the app under waitress (Windows has no fork, so one process with many threads)"""
+    try:
+        from waitress import create_server
+    except ImportError:
+        logging.error("❌ waitress is not installed - run 'pip install waitress' to serve on Windows")
+        raise
+
+    threads = settings['threads'] * settings['workers']
+    on_starting(None)
+    server = create_server(app,
+                           host=settings['host'],
+                           port=settings['port'],
+                           threads=threads,
+                           connection_limit=max(100, threads * 4),
+                           channel_timeout=settings['timeout'])
+
+    def shutdown(signum, frame):
+        logging.info("🛑 Shutdown requested - closing waitress server")
+        server.close()
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+    if hasattr(signal, 'SIGBREAK'):
+        signal.signal(signal.SIGBREAK, shutdown)
+
+    logging.info(f"🚀 Starting waitress on {settings['host']}:{settings['port']} with {threads} threads")
+    try:
+        server.run()
+    except OSError:
+        # The socket loop can raise once close() has run from the signal handler
+        pass
+    finally:
+        dispose_database_pool()
+        logging.info("✅ Waitress server stopped")
+
+
+def on_starting(server):
+    """Runs once in the gunicorn master before any worker starts"""
+    from wms_metrics import clear_multiprocess_dir
+    clear_multiprocess_dir()
+
+
+def post_fork(server, worker):
+    """Connections opened in the master must not be shared with forked workers"""
+    dispose_database_pool(close=False)
+
+
+def worker_exit(server, worker):
+    """Return pooled connections when a worker stops"""
+    dispose_database_pool()
+    from wms_metrics import mark_process_dead
+    mark_process_dead()
+
+
+def run(app):
+    """Serve the app with the production server for this platform"""
+    settings = get_server_settings()
+    if os.name == 'nt':
+        run_waitress(app, settings)
+    else:
+        run_gunicorn(app, settings)
+
+
+if __name__ == "__main__":
+    from main import app, check_license
+
+    if not is_dev_workspace() and not check_license():
+        raise SystemExit(1)
+    run(app)